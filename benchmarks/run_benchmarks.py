@@ -0,0 +1,494 @@
+# benchmarks/run_benchmarks.py
+"""
+event_study 的可复现基准测试。
+
+以 event_study.synthetic 生成指定规模的合成面板，对每个规模分别计时：
+- 数据生成与写出；
+- 单项阶段（estimation_window、perform_regressions、calculate_CAR_AR、run_tests、run_tests_batch）的每次调用耗时；
+- 端到端 run_event_study（按回归引擎分别运行），附带 profile=True 的分阶段报告；
+每次运行都在新的子进程中进行，并记录该进程的内存峰值（RSS）。
+冷启动部分在新解释器中计时各入口的导入耗时，以及一个只计算的短任务的进程总耗时。
+
+数值一致性检查在小规模面板上以逐事件 statsmodels 串行运行为参照，比较批量引擎、窗口缓存、
+多进程与结果存储重放的输出；--save-reference/--reference 用于跨提交比较参照输出本身。
+--compact-dtypes 另外以紧凑类型模式端到端运行批量引擎（记录其内存峰值），并在一致性检查中以
+check_compact_accuracy 检查紧凑类型模式相对 float64 的最大偏差（--compact-tolerance）。
+
+结果写入 JSON 文件，--compare 比较两个结果文件：
+
+    python benchmarks/run_benchmarks.py --scales tiny small --output before.json
+    python benchmarks/run_benchmarks.py --scales tiny small --output after.json
+    python benchmarks/run_benchmarks.py --compare before.json after.json
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from event_study.car_calculations import calculate_CAR_AR, estimation_window  # noqa: E402
+from event_study.data_loader import load_data, parquet_available  # noqa: E402
+from event_study.main import check_compact_accuracy, run_event_study  # noqa: E402
+from event_study.pipeline import run_event_study_pipelined  # noqa: E402
+from event_study.panel_index import PanelIndex  # noqa: E402
+from event_study.regression_models import perform_regressions  # noqa: E402
+from event_study.statistical_tests import run_tests, run_tests_batch  # noqa: E402
+from event_study.synthetic import generate_panel, write_panel  # noqa: E402
+from event_study.trading_calendar import TradingCalendar  # noqa: E402
+
+# 规模名 -> generate_panel 参数
+SCALES = {
+    'tiny': dict(n_firms=50, n_years=3, n_events=200),
+    'small': dict(n_firms=500, n_years=5, n_events=2000),
+    'medium': dict(n_firms=2000, n_years=10, n_events=10000),
+    'large': dict(n_firms=5000, n_years=20, n_events=50000),
+}
+
+# 一致性检查的变体：名称 -> 相对参照运行修改的 run_event_study 参数（pipelined=True 时改用流水线入口）
+VARIANTS = {
+    'batch_engine': dict(regression_engine='batch'),
+    'window_cache': dict(window_cache_size=256),
+    'parallel': dict(n_jobs=2),
+    'result_store_replay': dict(result_store='results.sqlite'),
+    'pipelined': dict(pipelined=True, firm_sorted=True, read_chunk_rows=20000, chunk_size=100),
+}
+
+# 参照运行：逐事件 statsmodels 拟合、串行、不使用窗口缓存
+REFERENCE = dict(regression_engine='statsmodels', n_jobs=1, window_cache_size=0)
+
+RESULT_FILES = ('event_study_results', 'event_study_daily_AR_results', 'event_study_daily_CAR_results')
+
+# 各输出文件比较前的排序键
+SORT_KEYS = {
+    'event_study_results': ['Symbol', 'EventDate', 'Model', 'Statistic'],
+    'event_study_daily_AR_results': ['Model', 'EventDay'],
+    'event_study_daily_CAR_results': ['Model', 'EventDay'],
+}
+
+OUTPUT_FORMAT = 'parquet' if parquet_available() else 'csv'
+
+# 冷启动计时：名称 -> 在新解释器中执行的语句
+COLD_START = {
+    'interpreter': 'pass',
+    'import_package': 'import event_study',
+    'compute_api': 'from event_study import compute_event_study',
+    'run_event_study': 'from event_study.main import run_event_study',
+}
+
+# 冷启动后检查是否已被导入的重量级依赖
+HEAVY_MODULES = ('pandas', 'scipy', 'statsmodels', 'matplotlib', 'seaborn')
+
+# 冷启动的短任务：新进程中导入、加载数据并以只计算的入口计算一次
+COMPUTE_JOB = '''
+import sys
+from event_study import compute_event_study, load_data
+paths, options = {paths!r}, {options!r}
+compute_event_study(*load_data(**paths, use_cache=False), **options)
+'''
+
+
+def environment():
+    """记录运行环境，便于跨提交、跨机器比较。"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {}
+    for module in ('numpy', 'pandas', 'scipy', 'statsmodels', 'pyarrow'):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'versions': versions,
+    }
+
+def peak_rss():
+    """当前进程的内存峰值（字节）；平台不支持时为 None。"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def in_child(fn, *args):
+    """在新的 spawn 子进程中运行 fn(*args)，使计时与内存峰值不受之前运行的影响。"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(fn, *args).result()
+
+@contextmanager
+def working_directory(path):
+    """run_event_study 把结果写入当前目录，运行期间切换到 path。"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def time_calls(fn, items, repeat):
+    """对 items 逐个调用 fn，重复 repeat 次，返回每次调用耗时的最小值与均值（秒）。"""
+    totals = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        totals.append(time.perf_counter() - start)
+    n = max(len(items), 1)
+    return {'calls': len(items), 'best_seconds_per_call': min(totals) / n,
+            'mean_seconds_per_call': sum(totals) / len(totals) / n}
+
+def cold_start(repeat, paths=None, options=None):
+    """
+    在新的解释器中计时各入口的导入耗时与进程总耗时（取 repeat 次中的最小值），
+    并记录导入后已加载的重量级依赖；
+    给定 paths 时再计时一个完整的短任务（导入 + 加载 + compute_event_study）的进程总耗时。
+    """
+    results = {}
+    for name, statement in COLD_START.items():
+        code = (f'import sys, time; start = time.perf_counter(); {statement}; '
+                f'print(time.perf_counter() - start); '
+                f'print(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))')
+        timings, process_timings = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            lines = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                                   check=True).stdout.splitlines()
+            process_timings.append(time.perf_counter() - start)
+            timings.append(float(lines[0]))
+        loaded = lines[1].split(',') if len(lines) > 1 and lines[1] else []
+        results[name] = {'best_seconds': min(timings), 'mean_seconds': sum(timings) / len(timings),
+                         'best_process_seconds': min(process_timings), 'loaded_modules': loaded}
+
+    if paths is not None:
+        code = COMPUTE_JOB.format(paths=paths, options=options)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, check=True)
+            timings.append(time.perf_counter() - start)
+        results['compute_job'] = {'best_process_seconds': min(timings),
+                                  'mean_process_seconds': sum(timings) / len(timings)}
+    return results
+
+
+def generate_scale(config, seed, business_days, directory):
+    """生成并写出一个规模的合成面板，返回文件路径、数据规模与耗时。"""
+    start = time.perf_counter()
+    tables = generate_panel(seed=seed, business_days=business_days, **config)
+    generated = time.perf_counter()
+    paths = write_panel(tables, directory)
+    return {
+        'paths': paths,
+        'rows': {name: len(table) for name, table in zip(('events', 'firm', 'market', 'ff_factors'), tables)},
+        'generate_seconds': generated - start,
+        'write_seconds': time.perf_counter() - generated,
+        'peak_rss': peak_rss(),
+    }
+
+def stage_benchmarks(paths, options, samples, repeat):
+    """对前 samples 个有足够估计样本的事件计时各个单项阶段。"""
+    event_data, firm_data, market_data, ff_factors = load_data(**paths, use_cache=False)
+    panel = PanelIndex(firm_data, market_data, ff_factors)
+    calendar = TradingCalendar.from_market(market_data) if options['window_unit'] == 'trading' else None
+    models_to_use = options['models_to_use']
+
+    def window(event):
+        return estimation_window(event[0], event[1], firm_data, market_data, ff_factors,
+                                 options['estimation_window_days'], panel=panel, calendar=calendar)
+
+    events, windows = [], []
+    for event in event_data[['Symbol', 'Date']].itertuples(index=False, name=None):
+        data = window(event)
+        if data is not None:
+            events.append(event)
+            windows.append(data)
+            if len(events) == samples:
+                break
+
+    def car(event):
+        return calculate_CAR_AR(event[0], event[1], firm_data, market_data, ff_factors,
+                                options['event_window_days'], options['estimation_window_days'], models_to_use,
+                                panel=panel, rng=np.random.default_rng(0), test_options=options['test_options'],
+                                calendar=calendar, tests=options.get('tests'))
+
+    rng = np.random.default_rng(0)
+    n_events = len(event_data)
+    window_length = options['event_window_days'][1] - options['event_window_days'][0] + 1
+    vector = rng.normal(0.0, 0.02, n_events)
+    matrix = rng.normal(0.0, 0.02, (n_events, window_length))
+    matrix[rng.random(matrix.shape) < 0.02] = np.nan
+
+    return {
+        'estimation_window': time_calls(window, events, repeat),
+        'perform_regressions': time_calls(lambda data: perform_regressions(data, models_to_use), windows, repeat),
+        'calculate_CAR_AR': time_calls(car, events, repeat),
+        'run_tests': time_calls(lambda data: run_tests(data, rng=np.random.default_rng(0), tests=options.get('tests'),
+                                                       **options['test_options']), [vector], repeat),
+        'run_tests_batch': time_calls(lambda data: run_tests_batch(data, rng=np.random.default_rng(0),
+                                                                   tests=options.get('tests'),
+                                                                   **options['test_options']), [matrix], repeat),
+        'peak_rss': peak_rss(),
+    }
+
+def end_to_end(paths, options, directory, hooks=()):
+    """
+    在 directory 中运行一次完整的 run_event_study（options 含 pipelined=True 时为 run_event_study_pipelined），
+    返回总耗时、分阶段报告与内存峰值。
+    """
+    options = dict(options)
+    runner = run_event_study_pipelined if options.pop('pipelined', False) else run_event_study
+    os.makedirs(directory, exist_ok=True)
+    with working_directory(directory), redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        report = runner(**paths, **options, generate_plots=False, output_format=OUTPUT_FORMAT,
+                                 cache_dir=os.path.join(directory, 'cache'), profile=True, profile_hooks=hooks)
+        seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'profile': report, 'peak_rss': peak_rss()}
+
+
+def read_outputs(directory):
+    """读取一次运行写出的三个结果文件。"""
+    reader = pd.read_parquet if OUTPUT_FORMAT == 'parquet' else pd.read_csv
+    return {name: reader(os.path.join(directory, f'{name}.{OUTPUT_FORMAT}')) for name in RESULT_FILES}
+
+def compare_outputs(expected, actual, rtol=1e-8, atol=1e-10):
+    """
+    按文件比较两次运行的输出：行与列必须一致，数值列在容差内相等（NaN 视为相等）。
+    返回 {文件: {'ok', 'max_abs_diff', 'mismatches'}}。
+    """
+    comparison = {}
+    for name in RESULT_FILES:
+        keys = SORT_KEYS[name]
+        left = expected[name].sort_values(keys, kind='mergesort').reset_index(drop=True)
+        right = actual[name].sort_values(keys, kind='mergesort').reset_index(drop=True)
+        if list(left.columns) != list(right.columns) or len(left) != len(right) \
+                or not left[keys].astype(str).equals(right[keys].astype(str)):
+            comparison[name] = {'ok': False, 'max_abs_diff': None, 'mismatches': None,
+                                'reason': 'rows or columns differ'}
+            continue
+        numeric = [col for col in left.columns if col not in keys and pd.api.types.is_numeric_dtype(left[col])]
+        a = left[numeric].to_numpy(dtype=float)
+        b = right[numeric].to_numpy(dtype=float)
+        same = np.isclose(a, b, rtol=rtol, atol=atol) | (np.isnan(a) & np.isnan(b))
+        with np.errstate(invalid='ignore'):
+            diff = np.abs(a - b)
+        comparison[name] = {
+            'ok': bool(same.all()),
+            'max_abs_diff': float(np.nanmax(diff)) if np.isfinite(diff).any() else 0.0,
+            'mismatches': int((~same).sum()),
+        }
+    return comparison
+
+def run_variant(paths, options, directory, replay=False):
+    """运行一次并读取输出；replay=True 时先运行一次填充结果存储，再以第二次（全部复用）的输出为准。"""
+    if replay:
+        end_to_end(paths, options, directory)
+    end_to_end(paths, options, directory)
+    return read_outputs(directory)
+
+def compact_accuracy(paths, options, tolerance):
+    """
+    以 check_compact_accuracy 比较紧凑类型模式与 float64 的结果，
+    返回 {量: {'ok', 'max_abs_diff', 'max_rel_diff', 'nan_mismatches'}}。
+    """
+    tables = load_data(paths['event_file'], paths['firm_file'], paths['market_file'], paths['ff_factors_file'],
+                       use_cache=False)
+    options = {key: value for key, value in options.items() if key != 'n_jobs'}
+    report = check_compact_accuracy(*tables, tolerance=tolerance, **options)
+    return {
+        row.Quantity: {'ok': bool(row.Passed), 'max_abs_diff': row.MaxAbsDeviation,
+                       'max_rel_diff': row.MaxRelDeviation, 'nan_mismatches': int(row.NaNMismatch)}
+        for row in report.itertuples(index=False)
+    }
+
+def equivalence_checks(config, options, seed, business_days, workdir, reference_dir=None, save_reference=None,
+                       compact_tolerance=None):
+    """
+    在小规模面板上以参照运行为基准检查各变体的数值一致性；
+    reference_dir 给定时再把参照输出与之前保存的参照输出比较（跨提交）；
+    compact_tolerance 给定时再检查紧凑类型模式相对 float64 的最大相对偏差不超过该容差。
+    """
+    data = generate_scale(config, seed, business_days, os.path.join(workdir, 'data'))
+    paths = data['paths']
+    expected = run_variant(paths, {**options, **REFERENCE}, os.path.join(workdir, 'reference'))
+
+    checks = {}
+    for name, overrides in VARIANTS.items():
+        directory = os.path.join(workdir, name)
+        actual = run_variant(paths, {**options, **REFERENCE, **overrides}, directory,
+                             replay='result_store' in overrides)
+        checks[name] = compare_outputs(expected, actual)
+    if compact_tolerance is not None:
+        checks['compact_dtypes'] = compact_accuracy(paths, options, compact_tolerance)
+
+    if save_reference:
+        os.makedirs(save_reference, exist_ok=True)
+        for name in RESULT_FILES:
+            shutil.copy(os.path.join(workdir, 'reference', f'{name}.{OUTPUT_FORMAT}'), save_reference)
+        with open(os.path.join(save_reference, 'config.json'), 'w', encoding='utf-8') as f:
+            json.dump({'config': config, 'options': options, 'seed': seed, 'business_days': business_days,
+                       'output_format': OUTPUT_FORMAT}, f, indent=2)
+    if reference_dir:
+        with open(os.path.join(reference_dir, 'config.json'), encoding='utf-8') as f:
+            saved = json.load(f)
+        current = {'config': config, 'options': options, 'seed': seed, 'business_days': business_days,
+                   'output_format': OUTPUT_FORMAT}
+        if json.loads(json.dumps(current)) != saved:
+            checks['saved_reference'] = {'ok': False, 'reason': 'saved reference was produced with other settings'}
+        else:
+            checks['saved_reference'] = compare_outputs(read_outputs(reference_dir), expected)
+
+    passed = all(all(result.get('ok', False) for result in check.values()) if 'reason' not in check
+                 else check['ok'] for check in checks.values())
+    return {'config': config, 'passed': passed, 'checks': checks}
+
+
+def run_benchmarks(args):
+    options = dict(
+        models_to_use=args.models,
+        event_window_days=tuple(args.event_window),
+        estimation_window_days=args.estimation_window,
+        window_unit=args.window_unit,
+        seed=args.seed,
+        n_jobs=args.n_jobs,
+        test_options={'num_permutations': args.num_permutations},
+    )
+    if args.tests:
+        # 只在选择检验时加入，使之前保存的参照输出仍可比较
+        options['tests'] = args.tests
+    business_days = args.window_unit == 'trading'
+    hooks = ('tracemalloc',) if args.trace_memory else ()
+    results = {'environment': environment(), 'options': {**options, 'engines': args.engines}, 'scales': {}}
+
+    with tempfile.TemporaryDirectory(prefix='event_study_bench_') as workdir:
+        print('Measuring cold start ...', flush=True)
+        data = generate_scale(SCALES['tiny'], args.seed, business_days, os.path.join(workdir, 'cold_start'))
+        job_options = {key: value for key, value in options.items() if key != 'n_jobs'}
+        results['cold_start'] = cold_start(args.repeat, data['paths'], job_options)
+        for name, timing in results['cold_start'].items():
+            print(f"  {name}: process {timing['best_process_seconds']:.3f}s", flush=True)
+
+        if not args.skip_equivalence:
+            print('Running equivalence checks ...', flush=True)
+            equivalence = in_child(equivalence_checks, SCALES['tiny'], options, args.seed, business_days,
+                                   os.path.join(workdir, 'equivalence'), args.reference, args.save_reference,
+                                   args.compact_tolerance if args.compact_dtypes else None)
+            results['equivalence'] = equivalence
+            print(f"  equivalence {'passed' if equivalence['passed'] else 'FAILED'}", flush=True)
+
+        for scale in args.scales:
+            config = SCALES[scale]
+            directory = os.path.join(workdir, scale)
+            print(f'Scale {scale}: {config}', flush=True)
+            data = in_child(generate_scale, config, args.seed, business_days, os.path.join(directory, 'data'))
+            record = {'config': config, 'data': {key: value for key, value in data.items() if key != 'paths'}}
+            record['stages'] = in_child(stage_benchmarks, data['paths'], options, args.samples, args.repeat)
+
+            record['end_to_end'] = {}
+            runs = {engine: {'regression_engine': engine} for engine in args.engines}
+            if args.compact_dtypes:
+                runs['batch_compact'] = {'regression_engine': 'batch', 'compact_dtypes': True}
+            for engine, overrides in runs.items():
+                run = in_child(end_to_end, data['paths'], {**options, **overrides},
+                               os.path.join(directory, engine), hooks)
+                record['end_to_end'][engine] = run
+                print(f"  {engine}: {run['seconds']:.2f}s, peak RSS {(run['peak_rss'] or 0) / 2 ** 20:.0f} MiB",
+                      flush=True)
+            results['scales'][scale] = record
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, default=float)
+    print(f'Results written to {args.output}')
+    return 0 if results.get('equivalence', {}).get('passed', True) else 1
+
+def compare_results(old_path, new_path):
+    """打印两个结果文件中各规模端到端与单项阶段耗时的变化（新/旧）。"""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"old: {old['environment']['git_commit']}  new: {new['environment']['git_commit']}")
+    print(f"{'scale':<8}{'benchmark':<32}{'old':>12}{'new':>12}{'ratio':>8}")
+    for name, timing in new.get('cold_start', {}).items():
+        before = old.get('cold_start', {}).get(name)
+        if before:
+            print(f"{'cold':<8}{name:<32}{before['best_process_seconds']:>12.4g}"
+                  f"{timing['best_process_seconds']:>12.4g}"
+                  f"{timing['best_process_seconds'] / before['best_process_seconds']:>8.2f}")
+    for scale in new['scales']:
+        if scale not in old['scales']:
+            continue
+        rows = []
+        for engine, run in new['scales'][scale]['end_to_end'].items():
+            before = old['scales'][scale]['end_to_end'].get(engine)
+            if before:
+                rows.append((f'end_to_end[{engine}]', before['seconds'], run['seconds']))
+        for stage, timing in new['scales'][scale]['stages'].items():
+            before = old['scales'][scale]['stages'].get(stage)
+            if isinstance(timing, dict) and before:
+                rows.append((stage, before['best_seconds_per_call'], timing['best_seconds_per_call']))
+        for name, before, after in rows:
+            print(f'{scale:<8}{name:<32}{before:>12.4g}{after:>12.4g}{after / before:>8.2f}')
+    if 'equivalence' in new:
+        print(f"equivalence: {'passed' if new['equivalence']['passed'] else 'FAILED'}")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', nargs='*', choices=list(SCALES), default=['tiny', 'small'])
+    parser.add_argument('--engines', nargs='+', choices=['statsmodels', 'batch'], default=['statsmodels', 'batch'])
+    parser.add_argument('--models', nargs='+', default=['MarketModel', 'MarketAdjusted', '3F', '4F', '5F'])
+    parser.add_argument('--event-window', nargs=2, type=int, default=[-1, 1])
+    parser.add_argument('--estimation-window', type=int, default=250)
+    parser.add_argument('--window-unit', choices=['calendar', 'trading'], default='trading',
+                        help="'calendar' generates a panel with data on every calendar day")
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--num-permutations', type=int, default=1000)
+    parser.add_argument('--tests', nargs='+', help='tests to compute (default: all), e.g. --tests t binomial')
+    parser.add_argument('--compact-dtypes', action='store_true',
+                        help='also run the batch engine with compact_dtypes=True and check its accuracy')
+    parser.add_argument('--compact-tolerance', type=float, default=1e-4,
+                        help='largest relative deviation accepted for the compact dtype mode')
+    parser.add_argument('--seed', type=int, default=12345)
+    parser.add_argument('--samples', type=int, default=50, help='events timed in the stage benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--trace-memory', action='store_true', help='record per-stage peak memory (slower)')
+    parser.add_argument('--skip-equivalence', action='store_true')
+    parser.add_argument('--save-reference', help='directory to save the reference outputs to')
+    parser.add_argument('--reference', help='directory of previously saved reference outputs to compare with')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare_results(*args.compare)
+    return run_benchmarks(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
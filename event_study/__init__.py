@@ -1,6 +1,48 @@
 # event_study/__init__.py
 
-from .data_loader import load_data
-from .statistical_tests import run_tests
-from .regression_models import perform_regressions, calculate_abnormal_returns
-from .car_calculations import calculate_CAR_AR
+import importlib
+
+# 公开名称 -> 所在子模块；子模块在首次访问时才导入（PEP 562），
+# 因此 import event_study 不会加载 pandas、SciPy、statsmodels 或绘图库
+_EXPORTS = {
+    'load_data': 'data_loader',
+    'compact_table': 'data_loader',
+    'run_tests': 'statistical_tests',
+    'run_tests_batch': 'statistical_tests',
+    'standardized_tests': 'statistical_tests',
+    'select_tests': 'statistical_tests',
+    'perform_regressions': 'regression_models',
+    'calculate_abnormal_returns': 'regression_models',
+    'batch_regressions': 'regression_models',
+    'register_model': 'regression_models',
+    'calculate_CAR_AR': 'car_calculations',
+    'PanelIndex': 'panel_index',
+    'FactorWindowCache': 'panel_index',
+    'TradingCalendar': 'trading_calendar',
+    'EventResults': 'results',
+    'EventRecord': 'results',
+    'run_sensitivity': 'sensitivity',
+    'generate_panel': 'synthetic',
+    'write_panel': 'synthetic',
+    'compute_event_study': 'main',
+    'run_event_study': 'main',
+    'check_compact_accuracy': 'main',
+    'run_event_study_pipelined': 'pipeline',
+    'prepare_shards': 'sharding',
+    'run_shard_worker': 'sharding',
+    'reduce_shards': 'sharding',
+    'run_event_study_sharded': 'sharding',
+    'EventStudySession': 'live',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
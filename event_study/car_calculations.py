@@ -1,156 +1,288 @@
 import numpy as np
+import pandas as pd
 from datetime import timedelta
-from .regression_models import perform_regressions, calculate_abnormal_returns
-from .statistical_tests import run_tests
+from .regression_models import (perform_regressions, calculate_abnormal_returns, estimation_variance, design_matrix,
+                                model_columns, union_columns, as_estimates)
+from .statistical_tests import run_tests, run_tests_batch, select_tests, TESTS
+from .profiling import NULL_PROFILER
+from .data_loader import COMPACT_DAY, COMPACT_FLOAT
+from .results import EventRecord, EVENT_TESTS, STATISTIC_INDEX
 
-def calculate_CAR_AR(symbol, event_date, firm_data, market_data, ff_factors, event_window_days, estimation_window_days, models_to_use):
+def _merge_window(symbol, start, end, firm_data, market_data, ff_factors):
+    """对整张表做布尔掩码并按 'Date' 内连接，提取 [start, end] 区间内的合并数据。"""
+    firm_window = firm_data[
+        (firm_data['Stkcd'] == symbol) &
+        (firm_data['Date'] >= start) &
+        (firm_data['Date'] <= end)
+    ]
+
+    market_window = market_data[
+        (market_data['Date'] >= start) &
+        (market_data['Date'] <= end)
+    ]
+
+    ff_window = ff_factors[
+        (ff_factors['Date'] >= start) &
+        (ff_factors['Date'] <= end)
+    ]
+
+    return firm_window.merge(market_window, on='Date', how='inner')\
+                      .merge(ff_window, on='Date', how='inner')
+
+def event_day_matrix(frame, column, day_column='EventDay'):
     """
-    对于每个事件，计算CAR和AR，执行统计检验，并返回结果。
+    将长表按事件日展开为 (观测, 事件日) 矩阵，缺失位置为 NaN。
+
+    返回 (排序后的事件日数组, 矩阵)，可直接传给 run_tests_batch。
     """
+    days, day_index = np.unique(frame[day_column].to_numpy(), return_inverse=True)
+    row = frame.groupby(day_column).cumcount().to_numpy()
+    matrix = np.full((int(row.max()) + 1 if len(row) else 0, len(days)), np.nan)
+    matrix[row, day_index] = frame[column].to_numpy(dtype=float)
+    return days, matrix
 
-    event_window_start, event_window_end = event_window_days
+def compact_event_frame(merged_event):
+    """
+    把事件窗口结果转换为紧凑类型（float64 列含 AR/CAR 为 float32，EventDay 为 int32），列顺序不变，
+    用于紧凑类型模式下保留到每日汇总的逐事件数据；逐事件统计量在转换前已由 float64 计算。
+    """
+    # 按数据块整体转换，避免逐列 astype 的开销
+    others = merged_event.select_dtypes(exclude=np.float64)
+    others = others.assign(EventDay=others['EventDay'].to_numpy().astype(COMPACT_DAY))
+    floats = merged_event.select_dtypes(np.float64).astype(COMPACT_FLOAT)
+    return pd.concat([others, floats], axis=1)[merged_event.columns]
 
-    estimation_start = event_date - timedelta(days=estimation_window_days)
-    estimation_end = event_date - timedelta(days=1)
-    event_start = event_date + timedelta(days=event_window_start)
-    event_end = event_date + timedelta(days=event_window_end)
+def column_means(matrix):
+    """按列计算忽略 NaN 的均值；全为 NaN 的列返回 NaN（不触发空切片警告）。"""
+    counts = np.sum(~np.isnan(matrix), axis=0)
+    sums = np.nansum(matrix, axis=0)
+    return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
 
-    firm_estimation = firm_data[
-        (firm_data['Stkcd'] == symbol) &
-        (firm_data['Date'] >= estimation_start) &
-        (firm_data['Date'] <= estimation_end)
-    ]
+def standardize_abnormal_returns(merged_event, variance, model, regressors=None):
+    """
+    用估计窗口方差标准化事件窗口的 AR 与 CAR，返回 (SAR, SCAR) 数组。
 
-    market_estimation = market_data[
-        (market_data['Date'] >= estimation_start) &
-        (market_data['Date'] <= estimation_end)
-    ]
+    SAR_t = AR_t / sqrt(σ² (1 + x_t'(X'X)^-1 x_t))；
+    SCAR_τ = CAR_τ / sqrt(σ² (τ + z_τ'(X'X)^-1 z_τ))，其中 z_τ 为前 τ 个事件日回归量之和，
+    即累计预测误差的方差。merged_event 须已按事件日排序；
+    regressors 为可选的 (列名列表, 设计矩阵)，已预先构建的事件窗口设计矩阵，避免重复索引 DataFrame。
+    """
+    ar = merged_event[f'AbnormalReturn_{model}'].to_numpy(dtype=float)
+    car = merged_event[f'CAR_{model}'].to_numpy(dtype=float)
+    steps = np.arange(1, len(ar) + 1)
+    if variance.xtx_inv is None:
+        correction = np.zeros(len(ar))
+        cumulative_correction = np.zeros(len(ar))
+    else:
+        columns = model_columns(model)
+        if regressors is None:
+            design = design_matrix(merged_event, columns)
+        else:
+            names, values = regressors
+            design = values[:, [names.index(col) for col in columns]]
+        cumulative = np.cumsum(design, axis=0)
+        correction = np.einsum('ti,ij,tj->t', design, variance.xtx_inv, design)
+        cumulative_correction = np.einsum('ti,ij,tj->t', cumulative, variance.xtx_inv, cumulative)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sar = ar / np.sqrt(variance.sigma2 * (1 + correction))
+        scar = car / np.sqrt(variance.sigma2 * (steps + cumulative_correction))
+    return sar, scar
 
-    ff_estimation = ff_factors[
-        (ff_factors['Date'] >= estimation_start) &
-        (ff_factors['Date'] <= estimation_end)
-    ]
+def estimation_window(symbol, event_date, firm_data, market_data, ff_factors, estimation_window_days, panel=None,
+                      calendar=None, window_cache=None, as_arrays=False):
+    """
+    提取事件的估计窗口合并数据；样本量不足估计窗口的 80% 时返回 None。
+
+    若提供 calendar（TradingCalendar），估计窗口为事件日前 estimation_window_days 个交易日，
+    否则为自然日。若提供 window_cache（FactorWindowCache），市场与因子部分取自缓存；
+    as_arrays=True 时（需要 panel 与 window_cache）返回 EstimationSample 而非 DataFrame。
+    """
+    if calendar is not None:
+        event_ordinal = calendar.ordinal(event_date)
+        bounds = calendar.window_dates(event_ordinal - estimation_window_days, event_ordinal - 1)
+        if bounds is None:
+            return None
+        estimation_start, estimation_end = bounds
+    else:
+        estimation_start = event_date - timedelta(days=estimation_window_days)
+        estimation_end = event_date - timedelta(days=1)
+
+    if as_arrays:
+        sample = panel.estimation_sample(symbol, estimation_start, estimation_end, window_cache)
+        return sample if len(sample.y) >= estimation_window_days * 0.8 else None
 
-    merged_estimation = firm_estimation.merge(market_estimation, on='Date', how='inner')\
-                                     .merge(ff_estimation, on='Date', how='inner')
+    if panel is not None:
+        merged_estimation = panel.window(symbol, estimation_start, estimation_end, cache=window_cache)
+    else:
+        merged_estimation = _merge_window(symbol, estimation_start, estimation_end,
+                                          firm_data, market_data, ff_factors)
 
     if len(merged_estimation) < estimation_window_days * 0.8:
         return None
 
-    models = perform_regressions(merged_estimation, models_to_use)
+    return merged_estimation
 
-    firm_event = firm_data[
-        (firm_data['Stkcd'] == symbol) &
-        (firm_data['Date'] >= event_start) &
-        (firm_data['Date'] <= event_end)
-    ]
+def calculate_CAR_AR(symbol, event_date, firm_data, market_data, ff_factors, event_window_days, estimation_window_days, models_to_use,
+                     panel=None, fitted_models=None, rng=None, test_options=None, calendar=None,
+                     window_cache=None, estimation_data=None, profiler=None, compact=False, tests=None,
+                     estimation_variances=None, keep_estimates=False):
+    """
+    对于每个事件，计算CAR和AR，执行统计检验，并返回结果。
 
-    market_event = market_data[
-        (market_data['Date'] >= event_start) &
-        (market_data['Date'] <= event_end)
-    ]
+    若提供 panel（PanelIndex），窗口数据通过二分查找和切片提取，不再扫描整张公司表。
+    若提供 fitted_models（如 batch_regressions 的结果），则跳过估计窗口的回归。
+    rng 为置换检验使用的随机数生成器；test_options 为传给 run_tests 的其他参数。
+    若提供 calendar（TradingCalendar），估计窗口、事件窗口和 EventDay 均以交易日计，
+    事件日为事件日期当天或之后的第一个交易日。
+    window_cache（FactorWindowCache）用于复用共享同一窗口的市场+因子数据块。
+    estimation_data 为与 fitted_models 对应的估计窗口数据（DataFrame 或 EstimationSample）；
+    可得时，结果中增加各模型的 SAR_/SCAR_ 列（估计窗口方差标准化的 AR/CAR）、残差方差与自由度，
+    以及供 Kolari-Pynnönen 检验使用的估计窗口标准化残差（'estimation_residuals'）。
+    estimation_variances 为已得到的各模型 EstimationVariance（如结果存储中保存的估计结果），
+    与 fitted_models 一同提供时不再需要估计窗口数据；keep_estimates=True 时把拟合结果与方差信息
+    保存在 EventRecord.estimates 中，供结果存储持久化。
+    profiler（Profiler）记录各阶段耗时、扫描行数、回归与检验次数，以及事件被跳过的原因。
+    结果原地写入一个 EventRecord（固定的 模型 × 统计量 数组）；compact=True 时直接返回
+    (EventRecord, merged_event)，否则返回由其转换的原有结果字典。
+    tests 为要计算的检验（见 select_tests），默认为全部；未选择的检验不计算。
+    逐事件的每日 CAR 检验只在某个事件日有不少于两行时计算，否则（如交易日窗口，每个事件日恰好一行）
+    按构造必然退化，整步跳过。
+    """
+    test_options = test_options or {}
+    tests = tuple(name for name in select_tests(tests) if name in TESTS)
+    profiler = profiler or NULL_PROFILER
 
-    ff_event = ff_factors[
-        (ff_factors['Date'] >= event_start) &
-        (ff_factors['Date'] <= event_end)
-    ]
+    event_window_start, event_window_end = event_window_days
+
+    if calendar is not None:
+        event_ordinal = calendar.ordinal(event_date)
+        bounds = calendar.window_dates(event_ordinal + event_window_start, event_ordinal + event_window_end)
+        if bounds is None:
+            profiler.skip('event_window_outside_calendar')
+            return None
+        event_start, event_end = bounds
+    else:
+        event_start = event_date + timedelta(days=event_window_start)
+        event_end = event_date + timedelta(days=event_window_end)
 
-    merged_event = firm_event.merge(market_event, on='Date', how='inner')\
-                             .merge(ff_event, on='Date', how='inner')
+    if fitted_models is None:
+        with profiler.stage('estimation_window'):
+            merged_estimation = estimation_window(symbol, event_date, firm_data, market_data, ff_factors,
+                                                  estimation_window_days, panel=panel, calendar=calendar,
+                                                  window_cache=window_cache)
+        if merged_estimation is None:
+            profiler.skip('short_estimation_sample')
+            return None
+        profiler.count('rows_scanned', len(merged_estimation))
+        with profiler.stage('regression'):
+            models = perform_regressions(merged_estimation, models_to_use)
+        profiler.count('regressions_fit', len(models))
+        estimation_data = merged_estimation
+    else:
+        models = fitted_models
+
+    with profiler.stage('event_window'):
+        if panel is not None:
+            merged_event = panel.window(symbol, event_start, event_end, cache=window_cache)
+        else:
+            merged_event = _merge_window(symbol, event_start, event_end, firm_data, market_data, ff_factors)
 
     if merged_event.empty:
+        profiler.skip('empty_event_window')
         return None
+    profiler.count('rows_scanned', len(merged_event))
 
-    merged_event = calculate_abnormal_returns(models, merged_event, models_to_use)
+    # 事件窗口设计矩阵只构建一次，异常收益与标准化共用
+    columns = union_columns(models_to_use)
+    design = design_matrix(merged_event, columns)
+    with profiler.stage('abnormal_returns'):
+        merged_event = calculate_abnormal_returns(models, merged_event, models_to_use, design=design)
 
-    merged_event['EventDay'] = (merged_event['Date'] - event_date).dt.days
-    merged_event = merged_event.sort_values('EventDay')
+    if calendar is not None:
+        merged_event['EventDay'] = calendar.ordinals(merged_event['Date'].to_numpy()) - event_ordinal
+    else:
+        merged_event['EventDay'] = (merged_event['Date'] - event_date).dt.days
+    order = np.argsort(merged_event['EventDay'].to_numpy(), kind='stable')
+    merged_event, design = merged_event.iloc[order], design[order]
 
-    for model in models_to_use:
-        ar_col = f'AbnormalReturn_{model}'
-        car_col = f'CAR_{model}'
-        merged_event[car_col] = merged_event[ar_col].cumsum()
+    # 各模型的 CAR 一次累加（与 Series.cumsum 相同，缺失的 AR 保持为 NaN 并跳过）
+    ar = merged_event[[f'AbnormalReturn_{model}' for model in models_to_use]].to_numpy(dtype=float)
+    car = np.nancumsum(ar, axis=0)
+    car[np.isnan(ar)] = np.nan
+    merged_event = pd.concat([merged_event, pd.DataFrame(car, index=merged_event.index,
+                                                         columns=[f'CAR_{model}' for model in models_to_use])], axis=1)
+
+    with profiler.stage('standardization'):
+        if estimation_variances is not None:
+            variances = estimation_variances
+        elif estimation_data is not None:
+            variances = estimation_variance(models, estimation_data, models_to_use)
+        else:
+            variances = {}
+        estimation_residuals = {}
+        standardized = {}
+        regressors = (columns, design)
+        for model, variance in variances.items():
+            standardized[f'SAR_{model}'], standardized[f'SCAR_{model}'] = standardize_abnormal_returns(
+                merged_event, variance, model, regressors)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                estimation_residuals[model] = (variance.dates, variance.resid / np.sqrt(variance.sigma2))
+        if standardized:
+            merged_event = merged_event.assign(**standardized)
 
-    test_results = {}
-    daily_car_test_results = {}
+    record = EventRecord(symbol, event_date, len(models_to_use))
+    # 逐事件序列上只计算会写入结果的检验；每日 CAR 检验只在某个事件日有多行时才能计算，
+    # 否则每日均值即 CAR 本身，不构建 (观测, 事件日) 矩阵
+    event_tests = tuple(name for name in tests if name in EVENT_TESTS)
+    event_days = merged_event['EventDay'].to_numpy()
+    repeated_days = bool(np.any(event_days[1:] == event_days[:-1]))
 
-    for model in models_to_use:
+    for m, model in enumerate(models_to_use):
         car_col = f'CAR_{model}'
         car_values = merged_event[car_col].dropna().values
         car_mean = np.mean(car_values)
-        car_tests = run_tests(car_values)
-
         ar_col = f'AbnormalReturn_{model}'
         ar_values = merged_event[ar_col].dropna().values
         ar_mean = np.mean(ar_values)
-        ar_tests = run_tests(ar_values)
-
-        test_results[f'AvgCAR_{model}'] = car_mean
-        test_results[f't_statistic_{model}'] = car_tests.get('t_statistic', np.nan)
-        test_results[f't_p_value_{model}'] = car_tests.get('t_p_value', np.nan)
-        test_results[f'binomial_statistic_{model}'] = car_tests.get('binomial_statistic', np.nan)
-        test_results[f'binomial_p_value_{model}'] = car_tests.get('binomial_p_value', np.nan)
-        test_results[f'wilcoxon_statistic_{model}'] = car_tests.get('wilcoxon_statistic', np.nan)
-        test_results[f'wilcoxon_p_value_{model}'] = car_tests.get('wilcoxon_p_value', np.nan)
-        test_results[f'permutation_statistic_{model}'] = car_tests.get('permutation_statistic', np.nan)
-        test_results[f'permutation_p_value_{model}'] = car_tests.get('permutation_p_value', np.nan)
-
-        test_results[f'AvgAR_{model}'] = ar_mean
-        test_results[f't_statistic_AR_{model}'] = ar_tests.get('t_statistic', np.nan)
-        test_results[f't_p_value_AR_{model}'] = ar_tests.get('t_p_value', np.nan)
-        test_results[f'binomial_statistic_AR_{model}'] = ar_tests.get('binomial_statistic', np.nan)
-        test_results[f'binomial_p_value_AR_{model}'] = ar_tests.get('binomial_p_value', np.nan)
-        test_results[f'wilcoxon_statistic_AR_{model}'] = ar_tests.get('wilcoxon_statistic', np.nan)
-        test_results[f'wilcoxon_p_value_AR_{model}'] = ar_tests.get('wilcoxon_p_value', np.nan)
-        test_results[f'permutation_statistic_AR_{model}'] = ar_tests.get('permutation_statistic', np.nan)
-        test_results[f'permutation_p_value_AR_{model}'] = ar_tests.get('permutation_p_value', np.nan)
+        car_tests = ar_tests = {}
+        if event_tests:
+            with profiler.stage('tests'):
+                car_tests = run_tests(car_values, rng=rng, tests=event_tests, **test_options)
+                ar_tests = run_tests(ar_values, rng=rng, tests=event_tests, **test_options)
+            profiler.count('tests_run', 2)
+
+        record.set_tests(m, car_mean, car_tests, ar_mean, ar_tests)
 
         # Calculate daily average CAR and its tests
-        daily_car_means = merged_event.groupby('EventDay')[car_col].mean()
-        
-        daily_car_test_results[f'daily_avgCAR_{model}_means'] = daily_car_means.to_dict()
-        daily_car_test_results[f'daily_avgCAR_{model}_tests'] = {}
-
-        for day, mean_car in daily_car_means.items():
-            if not isinstance(mean_car, float) or not np.isnan(mean_car):
-                car_values_for_day = merged_event[merged_event['EventDay'] == day][car_col].dropna().values
-                if len(car_values_for_day) >= 2:
-                    car_tests_for_day = run_tests(car_values_for_day)
-                    daily_car_test_results[f'daily_avgCAR_{model}_tests'][day] = car_tests_for_day
-                else:
-                    daily_car_test_results[f'daily_avgCAR_{model}_tests'][day] = {
-                        't_statistic': np.nan,
-                        't_p_value': np.nan,
-                        'patell_statistic': np.nan,
-                        'patell_p_value': np.nan,
-                        'wilcoxon_statistic': np.nan,
-                        'wilcoxon_p_value': np.nan,
-                        'binomial_statistic': np.nan,
-                        'binomial_p_value': np.nan,
-                        'permutation_statistic': np.nan,
-                        'permutation_p_value': np.nan,
-                        'corrado_statistic': np.nan,
-                        'corrado_p_value': np.nan
-                    }
+        if not repeated_days:
+            record.set_daily(m, event_days, merged_event[car_col].to_numpy(dtype=float))
+            continue
+        days, car_matrix = event_day_matrix(merged_event, car_col)
+        daily_car_means = column_means(car_matrix)
+        daily_tests = None
+        if tests:
+            with profiler.stage('tests'):
+                daily_tests = run_tests_batch(car_matrix, min_count=2, rng=rng, tests=tests, **test_options)
+            profiler.count('tests_run', car_matrix.shape[1])
+        record.set_daily(m, days, daily_car_means, daily_tests)
 
+    # 事件窗口最后一天的 CAR（按 EventDay 排序后的最后一行）
     last_day = merged_event['EventDay'].max()
     last_day_data = merged_event[merged_event['EventDay'] == last_day]
-    last_day_tests = {}
-
-    for model in models_to_use:
-        car_col = f'CAR_{model}'
-        if not last_day_data.empty:
-            car_value = last_day_data.iloc[0][car_col]
-            last_day_tests[f'CAR_LastDay_{model}'] = car_value
-        else:
-            last_day_tests[f'CAR_LastDay_{model}'] = np.nan
+    if not last_day_data.empty:
+        last_row = last_day_data.iloc[0]
+        for m, model in enumerate(models_to_use):
+            record.values[m, STATISTIC_INDEX['CAR_LastDay']] = last_row[f'CAR_{model}']
 
-    result = {
-        'Symbol': symbol,
-        'EventDate': event_date,
-    }
-    result.update(test_results)
-    result.update(last_day_tests)
-    result.update(daily_car_test_results)
+    for model, variance in variances.items():
+        m = models_to_use.index(model)
+        record.values[m, STATISTIC_INDEX['sigma2']] = variance.sigma2
+        record.values[m, STATISTIC_INDEX['dof']] = variance.dof
+    if variances:
+        record.residuals = estimation_residuals
+    if keep_estimates:
+        record.estimates = (as_estimates(models), variances)
 
-    return result, merged_event
\ No newline at end of file
+    if compact:
+        return record, merged_event
+    return record.to_dict(models_to_use, tests), merged_event
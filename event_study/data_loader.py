@@ -1,17 +1,254 @@
 # event_study/data_loader.py
 
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+
+import numpy as np
 import pandas as pd
 
-def load_data(event_file, firm_file, market_file, ff_factors_file):
+# 以字符串读取以保留前置零的代码列
+CODE_COLUMNS = ('Symbol', 'Stkcd')
+
+# 缓存格式版本；缓存布局变化时递增以使旧缓存失效
+CACHE_VERSION = 1
+
+# 紧凑类型模式下数值列与事件日偏移的类型
+COMPACT_FLOAT = np.float32
+COMPACT_DAY = np.int32
+
+def file_signature(path, validate='mtime'):
+    """返回源文件的签名，用于判断缓存是否失效。"""
+    stat = os.stat(path)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if validate == 'hash':
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        signature['sha256'] = digest.hexdigest()
+    return signature
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def read_table(path):
+    """
+    按扩展名读取单个数据文件（.xlsx/.xls、.csv、.parquet），代码列以字符串读取。
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.xlsx', '.xls', '.xlsm'):
+        df = pd.read_excel(path, dtype={col: str for col in CODE_COLUMNS})
+    elif ext == '.csv':
+        df = pd.read_csv(path, dtype={col: str for col in CODE_COLUMNS})
+    elif ext == '.parquet':
+        df = pd.read_parquet(path)
+    else:
+        raise ValueError(f"Unsupported data file format: {path}")
+    return _normalize(df)
+
+def _normalize(df):
+    """代码列转换为字符串（缺失的代码保持为缺失值，而不是字符串 'nan'），日期列转换为 datetime64[ns]。"""
+    for col in CODE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(str).where(df[col].notna())
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date']).astype('datetime64[ns]')
+    return df
+
+def typed_table(df):
+    """转换为缓存使用的列类型：代码列为 categorical，日期为 datetime64，数值列为 float64。"""
+    df = df.copy()
+    for col in df.columns:
+        if col in CODE_COLUMNS:
+            df[col] = df[col].astype('category')
+        elif col == 'Date':
+            df[col] = df[col].astype('datetime64[ns]')
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype(np.float64)
+    return df
+
+def compact_table(df):
+    """
+    返回紧凑类型的新表：代码列为 categorical（整数编码加一份类别表），数值列为 float32，日期不变。
+    """
+    data = {}
+    for col in df.columns:
+        series = df[col]
+        if col in CODE_COLUMNS:
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype('category')
+        elif col != 'Date' and pd.api.types.is_numeric_dtype(series):
+            series = series.astype(COMPACT_FLOAT)
+        data[col] = series
+    return pd.DataFrame(data, index=df.index)
+
+def write_npz(df, path):
+    """无 pyarrow 时的后备缓存格式：每列一个数组，categorical 列拆为编码与类别。"""
+    arrays = {}
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            arrays[f'cat_codes:{col}'] = series.cat.codes.to_numpy()
+            arrays[f'cat_values:{col}'] = series.cat.categories.to_numpy(dtype=str)
+        elif col == 'Date':
+            arrays[f'date:{col}'] = series.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            arrays[f'col:{col}'] = series.to_numpy()
+    with open(path, 'wb') as f:
+        np.savez(f, __columns__=np.array(list(df.columns), dtype=str), **arrays)
+
+def read_npz(path):
+    with np.load(path, allow_pickle=False) as npz:
+        data = {}
+        for col in npz['__columns__']:
+            if f'cat_codes:{col}' in npz:
+                data[col] = pd.Categorical.from_codes(npz[f'cat_codes:{col}'], npz[f'cat_values:{col}'])
+            elif f'date:{col}' in npz:
+                data[col] = npz[f'date:{col}'].view('datetime64[ns]')
+            else:
+                data[col] = npz[f'col:{col}']
+    return pd.DataFrame(data)
+
+def restore_code_columns(df):
+    """将 categorical 的代码列还原为字符串，使缓存命中与否返回的数据一致。"""
+    for col in CODE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype(str).where(df[col].notna())
+    return df
+
+def default_cache_dir():
+    """按用户区分的缓存目录：$XDG_CACHE_HOME/event_study，未设置时为 ~/.cache/event_study。"""
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'event_study')
+
+def _cache_paths(path, cache_dir):
+    """返回缓存目录与缓存文件名前缀；前缀包含源文件绝对路径的哈希，避免同名文件冲突。"""
+    path = os.path.abspath(path)
+    cache_dir = cache_dir or default_cache_dir()
+    key = hashlib.sha1(path.encode('utf-8')).hexdigest()[:12]
+    return cache_dir, f'{os.path.basename(path)}.{key}'
+
+def load_table(path, cache_dir=None, use_cache=True, validate='mtime', compact=False):
     """
-    加载Excel文件，并确保'Stkcd'和'Symbol'列以字符串形式读取，以保留前置零。
+    读取单个数据文件，并维护一份带类型的列式缓存。
+
+    Excel 与 CSV 文件首次读取后写入缓存（有 pyarrow 时为 Parquet，否则为 NPZ），
+    之后只要源文件签名（大小与修改时间，validate='hash' 时再加 SHA-256）不变就直接读取缓存。
+    Parquet 源文件本身已是列式格式，直接读取。compact=True 时返回 compact_table 的紧凑类型。
+    """
+    if not use_cache or os.path.splitext(path)[1].lower() == '.parquet':
+        df = read_table(path)
+        return compact_table(df) if compact else df
+
+    signature = file_signature(path, validate)
+    cached = _read_cache(path, cache_dir, signature, restore_codes=not compact)
+    if cached is None:
+        cached = typed_table(read_table(path))
+        _write_cache(path, cached, cache_dir, signature)
+        if not compact:
+            return restore_code_columns(cached)
+    return compact_table(cached) if compact else cached
+
+def _read_cache(path, cache_dir, signature, restore_codes=True):
+    """缓存有效（版本与源文件签名一致）时返回缓存的数据，否则返回 None；restore_codes=False 时代码列保持 categorical。"""
+    cache_dir, prefix = _cache_paths(path, cache_dir)
+    meta_path = os.path.join(cache_dir, prefix + '.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        meta = json.load(f)
+    cache_path = os.path.join(cache_dir, meta.get('cache_file', ''))
+    if meta.get('version') != CACHE_VERSION or meta.get('signature') != signature or not os.path.exists(cache_path):
+        return None
+    df = pd.read_parquet(cache_path) if meta['format'] == 'parquet' else read_npz(cache_path)
+    return restore_code_columns(df) if restore_codes else df
+
+def _write_cache(path, typed, cache_dir, signature):
+    """
+    把带类型的数据写入缓存（有 pyarrow 时为 Parquet，否则为 NPZ），并记录源文件签名。
+
+    每个文件先写入同目录下的临时文件再 os.replace 到位，数据文件在前、签名文件在后，
+    因此中断的写入不会留下签名有效但内容不完整的缓存。目录不可写等 OSError 只给出警告，不使用缓存继续运行。
     """
-    event_data = pd.read_excel(event_file, dtype={'Symbol': str})
-    firm_data = pd.read_excel(firm_file, dtype={'Stkcd': str})
-    market_data = pd.read_excel(market_file)
-    ff_factors = pd.read_excel(ff_factors_file)
+    cache_dir, prefix = _cache_paths(path, cache_dir)
+    fmt = 'parquet' if parquet_available() else 'npz'
+    cache_file = f'{prefix}.{fmt}'
+    meta = {'version': CACHE_VERSION, 'format': fmt, 'cache_file': cache_file,
+            'source': os.path.abspath(path), 'signature': signature}
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if fmt == 'parquet':
+            _replace_atomic(os.path.join(cache_dir, cache_file), lambda tmp: typed.to_parquet(tmp, index=False))
+        else:
+            _replace_atomic(os.path.join(cache_dir, cache_file), lambda tmp: write_npz(typed, tmp))
+        _replace_atomic(os.path.join(cache_dir, prefix + '.json'), lambda tmp: _write_json(meta, tmp))
+    except OSError as exc:
+        warnings.warn(f"Could not write data cache for {path} to {cache_dir}: {exc}; continuing without a cache.")
 
-    for df in [event_data, firm_data, market_data, ff_factors]:
-        df['Date'] = pd.to_datetime(df['Date'])
+def _write_json(meta, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
 
-    return event_data, firm_data, market_data, ff_factors
+def _replace_atomic(target, write):
+    """write(tmp) 写入 target 同目录下的临时文件，完成后以 os.replace 原子地替换 target。"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.' + os.path.basename(target), suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def read_table_chunks(path, chunk_rows=500000, cache_dir=None, use_cache=True, validate='mtime'):
+    """
+    分块读取单个数据文件，逐块产出与 load_table 类型相同的 DataFrame，使调用方可以边读边计算。
+
+    CSV 按 chunk_rows 行分块读取，读完后写入列式缓存；缓存有效时整表读取缓存。
+    Parquet 按 chunk_rows 行的批次读取（需要 pyarrow）；Excel 无法分块，整表产出。
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.csv':
+        signature = file_signature(path, validate) if use_cache else None
+        cached = _read_cache(path, cache_dir, signature) if use_cache else None
+        if cached is not None:
+            yield cached
+            return
+        pieces = []
+        for piece in pd.read_csv(path, dtype={col: str for col in CODE_COLUMNS}, chunksize=chunk_rows):
+            piece = _normalize(piece)
+            if use_cache:
+                pieces.append(piece)
+            yield piece
+        if pieces:
+            _write_cache(path, typed_table(pd.concat(pieces, ignore_index=True)), cache_dir, signature)
+    elif ext == '.parquet' and parquet_available():
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield _normalize(batch.to_pandas())
+    else:
+        yield load_table(path, cache_dir=cache_dir, use_cache=use_cache, validate=validate)
+
+def load_data(event_file, firm_file, market_file, ff_factors_file, cache_dir=None, use_cache=True, validate='mtime',
+              compact=False):
+    """
+    加载数据文件（Excel、CSV 或 Parquet），并确保'Stkcd'和'Symbol'列以字符串形式读取，以保留前置零。
+
+    参数：
+    - cache_dir：列式缓存目录，默认为 default_cache_dir() 给出的按用户区分的目录。
+    - use_cache：是否使用列式缓存。
+    - validate：缓存失效判断方式，'mtime'（大小与修改时间）或 'hash'（另加内容哈希）。
+    - compact：是否返回紧凑类型（代码列为 categorical，数值列为 float32），见 compact_table。
+    """
+    return tuple(
+        load_table(path, cache_dir=cache_dir, use_cache=use_cache, validate=validate, compact=compact)
+        for path in (event_file, firm_file, market_file, ff_factors_file)
+    )
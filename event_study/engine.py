@@ -0,0 +1,427 @@
+# event_study/engine.py
+
+# run_event_study、compute_event_study、流水线与分片运行共用的事件处理、并行与汇总步骤
+
+import hashlib
+import math
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+import numpy as np
+import pandas as pd
+
+from .car_calculations import calculate_CAR_AR, column_means, compact_event_frame, estimation_window, event_day_matrix
+from .output_writers import STATISTIC_NAMES
+from .panel_index import FactorWindowCache, PanelIndex
+from .profiling import NULL_PROFILER, Profiler, format_report
+from .regression_models import MODELS, batch_regressions, check_models, unpack_batch
+from .results import EventResults
+from .statistical_tests import (STANDARDIZED_TESTS, ResidualCorrelation, run_tests_batch, select_tests,
+                                standardized_tests)
+from .streaming import CsvSink, DailyAccumulator
+from .trading_calendar import TradingCalendar
+
+# 只含 'Stkcd'、'Date' 两列的空公司表，用于构建只含市场与因子数据的基础面板（流水线与分片运行）
+EMPTY_FIRMS = pd.DataFrame({'Stkcd': pd.Series(dtype=object), 'Date': pd.Series(dtype='datetime64[ns]')})
+
+# 进程池中每个工作进程以内存映射方式加载的面板及其因子窗口缓存
+_WORKER_PANEL = None
+_WORKER_CACHE = None
+
+def _event_rng(seed, symbol, event_date):
+    """
+    为每个事件生成独立的随机数生成器，使串行与并行运行的置换检验结果一致。
+
+    生成器由种子与 (股票代码, 事件日期) 决定，与事件在文件中的位置无关，
+    因此增量重跑时复用的结果与完整重算一致。
+    """
+    if seed is None:
+        return None
+    digest = hashlib.sha256(f'{symbol}|{pd.Timestamp(event_date).isoformat()}'.encode('utf-8')).hexdigest()
+    return np.random.default_rng([seed, int(digest[:16], 16)])
+
+def process_events(events, panel, firm_data, market_data, ff_factors, event_window_days, estimation_window_days,
+                   models_to_use, regression_engine, batch_size, seed, test_options, calendar=None,
+                   window_cache=None, profiler=NULL_PROFILER, tests=None, compact_dtypes=False, estimates=None,
+                   keep_estimates=False):
+    """
+    处理一段事件，返回 [(事件序号, EventRecord, merged_event)]，跳过无效事件。
+
+    events 为 [(事件序号, 股票代码, 事件日期)] 列表；profiler 记录各阶段耗时与计数；
+    tests 为所选检验（见 select_tests）；compact_dtypes=True 时保留的 merged_event 转为紧凑类型。
+    estimates 为结果存储中已有的拟合结果 {事件序号: ({模型: OLSEstimate}, {模型: EstimationVariance})}，
+    这些事件不再提取估计窗口与回归；keep_estimates=True 时新拟合的事件在 record.estimates 中保留拟合结果。
+    """
+    processed = []
+    estimates = estimates or {}
+    profiler.count('events', len(events))
+
+    for begin in range(0, len(events), batch_size):
+        chunk = events[begin:begin + batch_size]
+        fitted = [None] * len(chunk)
+
+        if regression_engine == 'batch':
+            with profiler.stage('estimation_window'):
+                windows = [
+                    None if index in estimates else
+                    estimation_window(symbol, event_date, firm_data, market_data, ff_factors,
+                                      estimation_window_days, panel=panel, calendar=calendar,
+                                      window_cache=window_cache, as_arrays=window_cache is not None)
+                    for index, symbol, event_date in chunk
+                ]
+            valid = [i for i, window in enumerate(windows) if window is not None]
+            with profiler.stage('regression'):
+                batch = batch_regressions([windows[i] for i in valid], models_to_use, batch_size=batch_size)
+                for j, i in enumerate(valid):
+                    fitted[i] = unpack_batch(batch, j)
+            profiler.count('rows_scanned', sum(len(windows[i].y) if hasattr(windows[i], 'y') else len(windows[i])
+                                               for i in valid))
+            profiler.count('regressions_fit', len(valid) * len(batch))
+
+        for i, ((index, symbol, event_date), fitted_models) in enumerate(zip(chunk, fitted)):
+            variances = None
+            if index in estimates:
+                fitted_models, variances = estimates[index]
+                profiler.count('estimates_reused')
+            elif regression_engine == 'batch' and fitted_models is None:
+                profiler.skip('short_estimation_sample')
+                continue
+
+            res = calculate_CAR_AR(
+                symbol=symbol,
+                event_date=event_date,
+                firm_data=firm_data,
+                market_data=market_data,
+                ff_factors=ff_factors,
+                event_window_days=event_window_days,  # 传入事件窗口范围
+                estimation_window_days=estimation_window_days,
+                models_to_use=models_to_use,
+                panel=panel,
+                fitted_models=fitted_models,
+                rng=_event_rng(seed, symbol, event_date),
+                test_options=test_options,
+                calendar=calendar,
+                window_cache=window_cache,
+                estimation_data=windows[i] if fitted_models is not None and variances is None else None,
+                profiler=profiler,
+                compact=True,
+                tests=tests,
+                estimation_variances=variances,
+                keep_estimates=keep_estimates and variances is None
+            )
+
+            if res:
+                record, merged_event = res
+                if compact_dtypes:
+                    merged_event = compact_event_frame(merged_event)
+                processed.append((index, record, merged_event))
+
+    profiler.count('events_processed', len(processed))
+    return processed
+
+def _init_worker(panel_dir, window_cache_size, models=None):
+    """
+    工作进程初始化：以只读内存映射方式打开主进程写出的面板数组，并创建因子窗口缓存；
+    models 为主进程的模型注册表，使以 spawn 方式启动的工作进程也能使用运行时注册的模型。
+    """
+    global _WORKER_PANEL, _WORKER_CACHE
+    MODELS.update(models or {})
+    _WORKER_PANEL = PanelIndex.load(panel_dir, mmap_mode='r')
+    _WORKER_CACHE = FactorWindowCache(_WORKER_PANEL, window_cache_size) if window_cache_size > 0 else None
+
+def process_shard(events, options, profile_hooks=None, firm_data=None):
+    """
+    在工作进程中处理一个事件分片，同时返回本分片的缓存统计（进程号、缓存块数、命中与未命中次数），
+    以及 profile_hooks 不为 None 时本分片的 Profiler 报告。
+
+    firm_data 不为 None 时（流水线运行），工作进程的面板只含市场与因子数据，
+    本分片的公司收益随任务传入，与之组成面板后再处理。
+    """
+    profiler = Profiler(profile_hooks) if profile_hooks is not None else NULL_PROFILER
+    panel = _WORKER_PANEL if firm_data is None else _WORKER_PANEL.with_firms(firm_data)
+    if _WORKER_CACHE is None:
+        processed = process_events(events, panel, None, None, None, profiler=profiler, **options)
+        return processed, None, profiler.report()
+    hits, misses = _WORKER_CACHE.hits, _WORKER_CACHE.misses
+    processed = process_events(events, panel, None, None, None, window_cache=_WORKER_CACHE,
+                               profiler=profiler, **options)
+    cache_stats = (os.getpid(), _WORKER_CACHE.stats()['size'], _WORKER_CACHE.hits - hits, _WORKER_CACHE.misses - misses)
+    return processed, cache_stats, profiler.report()
+
+@contextmanager
+def worker_pool(panel, n_jobs, window_cache_size):
+    """
+    创建进程池：面板数组只写出一次，工作进程通过只读内存映射共享，任务本身只传递事件列表。
+    """
+    with tempfile.TemporaryDirectory(prefix='event_study_panel_') as panel_dir:
+        panel.save(panel_dir)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                 initargs=(panel_dir, window_cache_size, dict(MODELS))) as executor:
+            yield executor
+
+def process_parallel(events, executor, n_jobs, options, window_cache=None, profiler=NULL_PROFILER):
+    """
+    将事件按连续分片分配到进程池，结果按分片提交顺序合并，保证输出顺序确定。
+
+    各工作进程的缓存统计与 Profiler 报告汇总到主进程的 window_cache 与 profiler 上，以便统一报告。
+    """
+    shard_size = max(1, math.ceil(len(events) / (n_jobs * 4)))
+    shards = [events[i:i + shard_size] for i in range(0, len(events), shard_size)]
+
+    profile_hooks = profiler.hooks if profiler.enabled else None
+    futures = [executor.submit(process_shard, shard, options, profile_hooks) for shard in shards]
+    processed = []
+    for future in futures:
+        shard_processed, cache_stats, report = future.result()
+        processed.extend(shard_processed)
+        merge_worker_stats(cache_stats, report, window_cache, profiler)
+
+    return processed
+
+def merge_worker_stats(cache_stats, report, window_cache, profiler):
+    """把工作进程返回的缓存统计与 Profiler 报告并入主进程的 window_cache 与 profiler。"""
+    profiler.merge(report)
+    if window_cache is not None and cache_stats is not None:
+        pid, size, hits, misses = cache_stats
+        window_cache.worker_sizes[pid] = size
+        window_cache.hits += hits
+        window_cache.misses += misses
+
+def iter_processed(events, chunk_size, panel, firm_data, market_data, ff_factors, n_jobs, options,
+                   store=None, keys=None, window_cache=None, profiler=NULL_PROFILER, estimate_keys=None):
+    """
+    按块处理事件，逐块产出 [(事件序号, EventRecord, merged_event)]；并行时整个运行共用一个进程池。
+
+    若提供 store（ResultStore）与 keys（{事件序号: 存储键}），已存储的事件直接复用，
+    只计算新的或已失效的事件，并在每块完成后写入存储。estimate_keys（{事件序号: 估计键}）
+    对应存储中的拟合结果：结果已失效但拟合结果仍有效的事件复用其系数与方差信息，不再回归。
+    """
+    with ExitStack() as stack:
+        window_cache_size = window_cache.maxsize if window_cache is not None else 0
+        executor = stack.enter_context(worker_pool(panel, n_jobs, window_cache_size)) if n_jobs > 1 else None
+        for begin in range(0, len(events), chunk_size):
+            chunk = events[begin:begin + chunk_size]
+            cached = store.get_many(keys[index] for index, _, _ in chunk) if store is not None else {}
+            pending = [event for event in chunk if store is None or keys[event[0]] not in cached]
+            chunk_options = options
+            if store is not None and pending:
+                found = store.get_estimates(estimate_keys[index] for index, _, _ in pending)
+                chunk_options = dict(options, keep_estimates=True, estimates={
+                    index: found[estimate_keys[index]] for index, _, _ in pending if estimate_keys[index] in found})
+
+            if not pending:
+                processed = []
+            elif executor is not None:
+                processed = process_parallel(pending, executor, n_jobs, chunk_options, window_cache=window_cache,
+                                             profiler=profiler)
+            else:
+                processed = process_events(pending, panel, firm_data, market_data, ff_factors,
+                                           window_cache=window_cache, profiler=profiler, **chunk_options)
+
+            if store is not None:
+                computed = {index: (record, merged_event) for index, record, merged_event in processed}
+                estimates = []
+                for index, record, _ in processed:
+                    if record.estimates is not None:
+                        estimates.append((estimate_keys[index], record.estimates))
+                        record.estimates = None
+                with profiler.stage('result_store'):
+                    store.put_many([(keys[index], symbol, event_date, computed.get(index))
+                                    for index, symbol, event_date in pending], estimates=estimates)
+                profiler.count('events_reused', len(chunk) - len(pending))
+                for index, _, _ in chunk:
+                    if cached.get(keys[index]) is not None:
+                        # 重复事件共用同一存储键，复制结果记录以免相互影响
+                        record, merged_event = cached[keys[index]]
+                        processed.append((index, record.copy(), merged_event))
+                processed.sort(key=lambda item: item[0])
+
+            yield processed
+
+def report_window_cache(window_cache, profiler):
+    """把因子窗口缓存的块数与命中次数计入 profiler 的计数器，只在 profile 开启时随报告输出。"""
+    if window_cache is None:
+        return
+    cache_stats = window_cache.stats()
+    profiler.count('window_cache_blocks', cache_stats['size'])
+    profiler.count('window_cache_hits', cache_stats['hits'])
+    profiler.count('window_cache_misses', cache_stats['misses'])
+
+def collect_residuals(processed, correlations):
+    """把一块事件的估计窗口标准化残差并入各模型的 ResidualCorrelation，并从结果中移除以释放内存。"""
+    collected = {model: ([], []) for model in correlations}
+    for _, record, _ in processed:
+        estimation_residuals, record.residuals = record.residuals or {}, None
+        for model, (dates, residuals) in estimation_residuals.items():
+            if model in collected:
+                collected[model][0].append(dates)
+                collected[model][1].append(residuals)
+    for model, (dates, residuals) in collected.items():
+        correlations[model].update(dates, residuals)
+
+def stream_event_study(chunks, models_to_use, event_window_days, stream_dir, submit=None, tests=None):
+    """
+    流式模式：逐块把每个事件的结果行追加写入 CSV，只保留每日 AAR/CAAR 的充分统计量，
+    峰值内存与事件总数无关。返回每日平均 AR 表（用于绘图）。tests 为所选检验。
+
+    submit(fn, *args, **kwargs) 为可选的写出函数（如流水线的后台写出线程），默认在当前线程直接写出。
+    """
+    submit = submit or (lambda fn, *args, **kwargs: fn(*args, **kwargs))
+    os.makedirs(stream_dir, exist_ok=True)
+    summary_sink = CsvSink(os.path.join(stream_dir, 'event_study_individual_results.csv'))
+    rows_sink = CsvSink(os.path.join(stream_dir, 'event_study_event_rows.csv'))
+    ar_cols = [f'AbnormalReturn_{model}' for model in models_to_use]
+    car_cols = [f'CAR_{model}' for model in models_to_use]
+    accumulator = DailyAccumulator(ar_cols + car_cols)
+
+    for processed in chunks:
+        if not processed:
+            continue
+        records = [(index, record) for index, record, _ in processed]
+        submit(summary_sink.append,
+               EventResults.from_records(records, models_to_use, event_window_days, tests).to_frame())
+        chunk_rows = pd.concat([
+            merged_event.assign(Symbol=record.symbol, EventDate=record.event_date)
+            for _, record, merged_event in processed
+        ], ignore_index=True)
+        submit(rows_sink.append, chunk_rows)
+        accumulator.update(chunk_rows)
+
+    for kind, cols, mean_label in (('AR', ar_cols, 'AvgAR'), ('CAR', car_cols, 'AvgCAR')):
+        daily = pd.concat([
+            accumulator.summary(col, mean_label, tests).assign(Model=model)
+            for model, col in zip(models_to_use, cols)
+        ], ignore_index=True)
+        submit(daily.to_csv, os.path.join(stream_dir, f'event_study_daily_{kind}_results.csv'), index=False)
+
+    average_AR_per_day = None
+    for col in ar_cols:
+        daily = accumulator.summary(col, col, tests=())[['EventDay', col]]
+        average_AR_per_day = daily if average_AR_per_day is None else average_AR_per_day.merge(daily, on='EventDay', how='outer')
+    return average_AR_per_day
+
+def finish_profile(profiler):
+    """profile 开启时打印并返回 Profiler 报告，否则返回 None。"""
+    report = profiler.report()
+    if report is not None:
+        print(format_report(report))
+    return report
+
+def plot_average_ar(average_AR_per_day, models_to_use, event_window_days):
+    """绘图依赖 matplotlib 与 seaborn，只在需要生成图片时导入。"""
+    from event_study.plotting import plot_average_ar
+    plot_average_ar(average_AR_per_day, models_to_use, event_window_days)
+
+def validate_options(models_to_use, regression_engine, window_unit):
+    check_models(models_to_use)
+    if regression_engine not in ('statsmodels', 'batch'):
+        raise ValueError(f"Unknown regression_engine: {regression_engine}")
+    if window_unit not in ('calendar', 'trading'):
+        raise ValueError(f"Unknown window_unit: {window_unit}")
+
+def prepare_events(event_data, firm_data, market_data, ff_factors, window_unit, window_cache_size, profiler,
+                   compact_dtypes=False):
+    """构建面板索引、交易日历与因子窗口缓存，返回 (panel, calendar, window_cache, events)。"""
+    # 构建一次按股票索引的面板，避免每个事件扫描整张公司表
+    with profiler.stage('build_index'):
+        panel = PanelIndex(firm_data, market_data, ff_factors, compact=compact_dtypes)
+        calendar = TradingCalendar.from_market(market_data) if window_unit == 'trading' else None
+    window_cache = FactorWindowCache(panel, window_cache_size) if window_cache_size > 0 else None
+
+    events = [(index, symbol, event_date) for index, (symbol, event_date)
+              in enumerate(event_data[['Symbol', 'Date']].itertuples(index=False, name=None))]
+    return panel, calendar, window_cache, events
+
+def collect_processed(chunks, n_events, models_to_use, event_window_days, profiler, tests=None):
+    """
+    把各块结果原地写入 EventResults 容器（tests 为所选检验），返回 (results, processed, correlations)，
+    processed 为按事件序号排序的 [(事件序号, merged_event)]（各块可以乱序到达）；
+    估计窗口标准化残差的平均截面相关系数（Kolari-Pynnönen 检验）逐块累计。
+    """
+    results = EventResults(models_to_use, n_events, event_window_days, tests)
+    correlations = {model: ResidualCorrelation() for model in models_to_use}
+    processed = []
+    with profiler.stage('process_events'):
+        for chunk in chunks:
+            collect_residuals(chunk, correlations)
+            for index, record, merged_event in chunk:
+                results.put(index, record)
+                processed.append((index, merged_event))
+    processed.sort(key=lambda item: item[0])
+    return results, processed, correlations
+
+def build_daily_tables(results, processed, correlations, models_to_use, event_window_days, calendar, seed,
+                       test_options, profiler, tests=None):
+    """
+    由逐事件结果（EventResults 与 [(事件序号, merged_event)]）构建每日检验表，只计算 tests 中所选的检验；
+    未选择任何标准化残差检验时，不构建 SAR/SCAR 矩阵。
+
+    返回 (daily_tables, average_AR_per_day)；daily_tables 为 {('AR' 或 'CAR', 模型): DataFrame}。
+    """
+    n_events = len(results.valid)
+    all_event_data = []
+    standardized = any(name in STANDARDIZED_TESTS for name in select_tests(tests))
+    prefixes = ('AbnormalReturn', 'CAR', 'SAR', 'SCAR') if standardized else ('AbnormalReturn', 'CAR')
+
+    # 交易日模式下窗口长度固定，AR/CAR 预分配为稠密数组，未通过筛选的事件整行为 NaN
+    dense_matrices = None
+    if calendar is not None:
+        event_days = np.arange(event_window_days[0], event_window_days[1] + 1)
+        dense_matrices = {
+            f'{prefix}_{model}': np.full((n_events, len(event_days)), np.nan)
+            for prefix in prefixes for model in models_to_use
+        }
+
+    for index, merged_event in processed:
+        all_event_data.append(merged_event)
+        if dense_matrices is not None:
+            cols = merged_event['EventDay'].to_numpy() - event_window_days[0]
+            for col, matrix in dense_matrices.items():
+                if col in merged_event.columns:
+                    matrix[index, cols] = merged_event[col].to_numpy()
+
+    with profiler.stage('daily_tests'):
+        combined_event_data = pd.concat(all_event_data, ignore_index=True)
+
+        rng = None if seed is None else np.random.default_rng(seed)
+
+        ar_cols = {f'AbnormalReturn_{model}': 'mean' for model in models_to_use}
+        average_AR_per_day = combined_event_data.groupby('EventDay').agg(ar_cols).reset_index()
+
+        # 各事件估计窗口残差自由度，按行与 SAR/SCAR 矩阵对齐，用于 Patell 检验的方差
+        dof_columns = [f'dof_{model}' for model in models_to_use]
+        dof_rows = results.statistic('dof')
+        if dense_matrices is None and standardized:
+            lengths = [len(merged_event) for merged_event in all_event_data]
+            event_dofs = dof_rows[[index for index, _ in processed]]
+            dof_frame = pd.DataFrame(np.repeat(event_dofs, lengths, axis=0), columns=dof_columns)
+            dof_frame['EventDay'] = combined_event_data['EventDay'].to_numpy()
+
+        # 每日平均AR/CAR及其测试结果：{('AR' 或 'CAR', 模型): DataFrame}；
+        # 标准化残差检验（Patell、BMP、KP）使用估计窗口方差标准化的 SAR/SCAR 矩阵
+        daily_tables = {}
+        for kind, prefix, std_prefix, mean_label in (('AR', 'AbnormalReturn', 'SAR', 'AvgAR'),
+                                                     ('CAR', 'CAR', 'SCAR', 'AvgCAR')):
+            for j, model in enumerate(models_to_use):
+                col = f'{prefix}_{model}'
+                std_col = f'{std_prefix}_{model}'
+                if dense_matrices is not None:
+                    days, matrix = event_days, dense_matrices[col]
+                else:
+                    days, matrix = event_day_matrix(combined_event_data, col)
+                daily = run_tests_batch(matrix, rng=rng, tests=tests, **(test_options or {}))
+                profiler.count('tests_run', matrix.shape[1])
+                if standardized and std_col in combined_event_data.columns:
+                    if dense_matrices is not None:
+                        std_matrix = dense_matrices[std_col]
+                        dof = np.broadcast_to(dof_rows[:, j:j + 1], std_matrix.shape)
+                    else:
+                        _, std_matrix = event_day_matrix(combined_event_data, std_col)
+                        _, dof = event_day_matrix(dof_frame, dof_columns[j])
+                    daily.update(standardized_tests(std_matrix, dof, correlations[model].value(), tests=tests))
+                test_df = pd.DataFrame({'EventDay': days, mean_label: column_means(matrix), **daily})
+                daily_tables[(kind, model)] = test_df.rename(columns=STATISTIC_NAMES)
+
+    return daily_tables, average_AR_per_day
@@ -0,0 +1,50 @@
+# event_study/excel_output.py
+
+import os
+
+import pandas as pd
+
+from .output_writers import event_statistics
+
+def write_excel_results(summary_df, daily_tables, models_to_use, output_dir='.'):
+    """写出原有的四个 Excel 结果文件（每个模型一个工作表）。"""
+    write_excel_individual(summary_df, models_to_use, output_dir)
+    write_excel_last_day(summary_df, models_to_use, output_dir)
+    for kind in ('AR', 'CAR'):
+        write_excel_daily(daily_tables, models_to_use, kind, output_dir)
+
+def write_excel_individual(summary_df, models_to_use, output_dir='.'):
+    """保存 individual CAR results with tests（逐事件 CAR/AR 及其检验）。"""
+    path = os.path.join(output_dir, "event_study_individual_CAR_results_with_tests.xlsx")
+    with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+        for model in models_to_use:
+            pairs = [(key, name) for key, name in event_statistics(model)[:-1] if key in summary_df.columns]
+            model_df = summary_df[['Symbol', 'EventDate'] + [key for key, _ in pairs]].copy()
+            model_df.rename(columns=dict(pairs), inplace=True)
+            model_df.to_excel(writer, sheet_name=model, index=False)
+    return path
+
+def write_excel_last_day(summary_df, models_to_use, output_dir='.'):
+    """保存事件窗口最后一天的CAR测试结果。"""
+    path = os.path.join(output_dir, "event_study_CAR_last_day_tests.xlsx")
+    with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+        cols = ['Symbol', 'EventDate'] + [f'CAR_LastDay_{model}' for model in models_to_use]
+        existing_cols = [col for col in cols if col in summary_df.columns]
+        summary_df[existing_cols].to_excel(writer, sheet_name='CAR_Last_Day', index=False)
+    return path
+
+def write_excel_daily(daily_tables, models_to_use, kind, output_dir='.'):
+    """保存每日平均AR（kind='AR'）或CAR（kind='CAR'）及其测试结果。"""
+    path = os.path.join(output_dir, f"event_study_daily_{kind}_results_with_tests.xlsx")
+    with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+        for model in models_to_use:
+            daily_tables[(kind, model)].to_excel(writer, sheet_name=f'{model}_{kind}', index=False)
+    return path
+
+def write_excel_summary(daily_tables, output_dir='.'):
+    """把每日 AR/CAR 检验表写入 event_study_summary.xlsx（每个 模型 × 类型 一个工作表），返回文件路径。"""
+    path = os.path.join(output_dir, 'event_study_summary.xlsx')
+    with pd.ExcelWriter(path, engine='xlsxwriter') as excel:
+        for (kind, model), table in daily_tables.items():
+            table.to_excel(excel, sheet_name=f'{model}_{kind}', index=False)
+    return path
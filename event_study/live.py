@@ -0,0 +1,437 @@
+# event_study/live.py
+
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .car_calculations import estimation_window
+from .panel_index import FactorWindowCache, PanelIndex
+from .regression_models import (MODELS, batch_regressions, check_models, coefficient_matrix, design_matrix, predict,
+                                register_model, union_columns, unpack_batch)
+from .trading_calendar import TradingCalendar
+
+# 追加的交易日数据累积到该天数后并入历史表并截断，使内存占用不随运行天数增长
+COMPACT_EVERY = 20
+
+
+class _EventState:
+    """单个事件的状态：事件日（会话交易日序号）、固定的系数矩阵，以及事件窗口内已得到的 AR/CAR。"""
+
+    __slots__ = ('index', 'symbol', 'event_date', 'status', 'day', 'coefficients', 'used', 'ar', 'car')
+
+    def __init__(self, index, symbol, event_date, n_days, n_models):
+        self.index = index
+        self.symbol = symbol
+        self.event_date = event_date
+        self.status = 'pending'
+        self.day = None
+        self.coefficients = None
+        self.used = None
+        self.ar = np.full((n_days, n_models), np.nan)
+        self.car = np.full((n_days, n_models), np.nan)
+
+
+class EventStudySession:
+    """
+    增量（实时）事件研究会话：每个新交易日的数据到达时，只更新仍处于事件窗口内的事件。
+
+    - 事件在其估计窗口结束（事件日前一个交易日的数据已到达）后拟合一次，系数此后固定；
+      事件窗口中已在历史数据内的部分在拟合时一并计算；
+    - append_day 以一次 einsum 计算全部活跃事件当天的 AR，并更新其 CAR 与
+      各 (事件日, 模型) 的截面充分统计量（样本数、和、平方和、正值个数），耗时为 O(活跃事件数)；
+      只有当天有事件开始时，才由保留的历史数据重建一次面板并批量拟合这些事件；
+    - summary 由充分统计量给出每日 AAR/CAAR、t 检验与符号检验（与流式模式的每日表相同）；
+    - snapshot/restore 保存与恢复会话状态（含拟合系数、运行中的 CAR 与保留的历史数据）。
+
+    窗口以交易日计（与 window_unit='trading' 相同），交易日即市场收益表中出现的日期；
+    历史数据只保留估计窗口与事件窗口所需的最近交易日。
+    """
+
+    def __init__(self, firm_data, market_data, ff_factors, models_to_use=None, event_window_days=(-1, 1),
+                 estimation_window_days=250, events=None, window_cache_size=256):
+        """
+        firm_data、market_data、ff_factors 为截至当前的历史数据（与 load_data 的结果相同）；
+        events 为可选的事件表（'Symbol'、'Date' 列），也可之后用 add_events 加入。
+        """
+        if models_to_use is None:
+            models_to_use = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+        check_models(models_to_use)
+        self.models_to_use = list(models_to_use)
+        self.event_window_days = tuple(event_window_days)
+        self.estimation_window_days = estimation_window_days
+        self.window_cache_size = window_cache_size
+        self.columns = union_columns(self.models_to_use)
+        self.models = {name: MODELS[name] for name in self.models_to_use}
+
+        start, end = self.event_window_days
+        self.n_days = end - start + 1
+        # 需要保留的历史交易日数：估计窗口加上事件窗口，使窗口尚未结束的事件仍可加入
+        self.history_days = estimation_window_days + max(end, 0) - min(start, 0) + 1
+
+        # 交易日轴存放在按倍数扩容的缓冲区中，dates 为其已用部分的视图，追加一天为均摊 O(1)
+        self._dates = np.unique(market_data['Date'].to_numpy(dtype='datetime64[ns]'))
+        self._n_dates = len(self._dates)
+        # 截断后保留的第一个交易日的序号；早于它的估计窗口或事件窗口已无法完整取得
+        self._first_day = 0
+        self._firm = [firm_data]
+        self._market = [market_data]
+        self._factors = [ff_factors]
+
+        self.events = []
+        self._pending = []
+        self._active = []
+        # 活跃事件的堆叠数组：系数 (E, M, K)、用到的列、事件日、运行中的 CAR (E, M)
+        self._stacked = None
+        # 只含市场与因子数据的面板、交易日历与因子窗口缓存，以及构建时的 (交易日数, 保留的第一个交易日)
+        self._history = None
+        self._history_key = None
+        # 合并后的公司历史表中各股票的行号 {股票代码: 行号数组}，历史表合并或截断后重建
+        self._firm_rows = None
+
+        n_models = len(self.models_to_use)
+        # 截面充分统计量：{'AR'/'CAR': (事件日数, 模型数, 4)}，最后一维为 样本数、和、平方和、正值个数
+        self.sums = {kind: np.zeros((self.n_days, n_models, 4)) for kind in ('AR', 'CAR')}
+
+        if events is not None:
+            self.add_events(events)
+
+    @property
+    def dates(self):
+        """已到达的全部交易日（升序）。"""
+        return self._dates[:self._n_dates]
+
+    def _append_date(self, date):
+        """在交易日轴末尾追加一天；缓冲区已满时容量翻倍。"""
+        if self._n_dates == len(self._dates):
+            grown = np.empty(max(2 * len(self._dates), 16), dtype='datetime64[ns]')
+            grown[:self._n_dates] = self._dates[:self._n_dates]
+            self._dates = grown
+        self._dates[self._n_dates] = np.datetime64(date, 'ns')
+        self._n_dates += 1
+
+    # ------------------------------------------------------------------ 事件
+
+    def add_events(self, event_data):
+        """
+        加入事件（'Symbol'、'Date' 列）。事件日已到达的事件立即拟合并计算已有的事件窗口部分；
+        事件日在未来的事件等到其事件日的数据到达时再拟合。会话运行后历史数据只保留最近 history_days 个交易日，
+        估计窗口或事件窗口早于此的事件标记为 'skipped'。返回加入的事件数。
+        """
+        for symbol, event_date in event_data[['Symbol', 'Date']].itertuples(index=False, name=None):
+            state = _EventState(len(self.events), str(symbol), pd.Timestamp(event_date), self.n_days,
+                                len(self.models_to_use))
+            self.events.append(state)
+            self._pending.append(state)
+        self._activate_due()
+        return len(event_data)
+
+    def _activate_due(self):
+        """拟合事件日已到达的待处理事件。"""
+        if not len(self.dates):
+            return
+        last = pd.Timestamp(self.dates[-1])
+        due = [state for state in self._pending if state.event_date <= last]
+        if not due:
+            return
+        self._pending = [state for state in self._pending if state.event_date > last]
+        self._activate(due)
+
+    def _activate(self, states):
+        """
+        由保留的历史数据批量拟合事件并计算事件窗口中已到达的部分；
+        估计样本不足（少于估计窗口的 80%）的事件标记为 'skipped'。
+        """
+        panel, calendar, cache = self._history_panel({state.symbol for state in states})
+        windows = []
+        for state in states:
+            state.day = int(np.searchsorted(self.dates, np.datetime64(state.event_date, 'ns')))
+            if self._first_day and state.day + min(self.event_window_days[0], -self.estimation_window_days) \
+                    < self._first_day:
+                windows.append(None)
+                continue
+            windows.append(estimation_window(state.symbol, state.event_date, None, None, None,
+                                             self.estimation_window_days, panel=panel, calendar=calendar,
+                                             window_cache=cache, as_arrays=True))
+        valid = [i for i, window in enumerate(windows) if window is not None]
+        batch = batch_regressions([windows[i] for i in valid], self.models_to_use)
+        for i, state in enumerate(states):
+            if windows[i] is None:
+                state.status = 'skipped'
+        for j, i in enumerate(valid):
+            state = states[i]
+            state.coefficients, state.used = coefficient_matrix(unpack_batch(batch, j), self.models_to_use,
+                                                                self.columns)
+            state.status = 'active'
+            self._replay(state, panel)
+            if state.day + self.event_window_days[1] <= len(self.dates) - 1:
+                self._close(state)
+            else:
+                self._active.append(state)
+        self._stacked = None
+
+    def _replay(self, state, panel):
+        """计算事件窗口中已在历史数据内的部分（事件晚于其窗口开始才加入，或窗口起点早于事件日时）。"""
+        start = max(state.day + self.event_window_days[0], 0)
+        end = min(state.day + self.event_window_days[1], len(self.dates) - 1)
+        if start > end:
+            return
+        window = panel.window(state.symbol, pd.Timestamp(self.dates[start]), pd.Timestamp(self.dates[end]))
+        if window.empty:
+            return
+        offsets = np.searchsorted(self.dates, window['Date'].to_numpy(dtype='datetime64[ns]')) - state.day
+        ar = window['Dretnd'].to_numpy(dtype=float)[:, None] - predict(
+            state.coefficients, design_matrix(window, self.columns), state.used)
+        car = np.nancumsum(ar, axis=0)
+        car[np.isnan(ar)] = np.nan
+        self._record(np.full(len(offsets), state.index), offsets, ar, car)
+
+    def _close(self, state):
+        """事件窗口结束；与批量模式一样，事件窗口内没有任何观测的事件标记为 'skipped'。"""
+        state.status = 'done' if not np.isnan(state.ar).all() else 'skipped'
+
+    # ------------------------------------------------------------------ 每日更新
+
+    def append_day(self, firm_returns, market_row, factor_row):
+        """
+        追加一个新交易日的数据并更新全部活跃事件，返回当天更新的事件行
+        （Symbol、EventDate、EventDay 及各模型的 AbnormalReturn_/CAR_ 列）。
+
+        - firm_returns：当天的公司收益，可为以 'Stkcd' 为索引的 Series，
+          或含 'Stkcd'、'Dretnd' 列的 DataFrame；当天没有收益的公司不产生 AR，其 CAR 保持不变；
+        - market_row、factor_row：当天的市场与因子数据（含 'Date' 的 dict 或 Series），日期须晚于已有数据。
+        """
+        date = pd.Timestamp(market_row['Date'])
+        if len(self.dates) and date <= pd.Timestamp(self.dates[-1]):
+            raise ValueError(f"append_day expects a date after {pd.Timestamp(self.dates[-1]).date()}, got {date.date()}.")
+        if pd.Timestamp(factor_row['Date']) != date:
+            raise ValueError("market_row and factor_row must be for the same date.")
+
+        if isinstance(firm_returns, pd.DataFrame):
+            firm_returns = pd.Series(firm_returns['Dretnd'].to_numpy(dtype=float),
+                                     index=firm_returns['Stkcd'].astype(str).to_numpy())
+        else:
+            firm_returns = pd.Series(np.asarray(firm_returns, dtype=float), index=firm_returns.index.astype(str))
+        market = pd.DataFrame([dict(market_row)]).assign(Date=date)
+        factors = pd.DataFrame([dict(factor_row)]).assign(Date=date)
+
+        self._append_date(date)
+        self._firm.append(pd.DataFrame({'Stkcd': firm_returns.index.to_numpy(), 'Date': date,
+                                        'Dretnd': firm_returns.to_numpy()}))
+        self._market.append(market)
+        self._factors.append(factors)
+        if len(self._firm) > COMPACT_EVERY:
+            self._compact()
+
+        today = len(self.dates) - 1
+        updated = self._update(today, firm_returns, market.merge(factors, on='Date'))
+        # 当天开始的事件在拟合时已由历史数据计算当天，不再重复更新
+        self._activate_due()
+        return updated
+
+    def _stack(self):
+        """活跃事件集合变化后重建堆叠数组；运行中的 CAR 取各事件最近一个非缺失的 CAR。"""
+        if self._stacked is None:
+            running = np.array([self._running_car(state) for state in self._active]).reshape(
+                len(self._active), len(self.models_to_use))
+            self._stacked = dict(
+                coefficients=np.array([state.coefficients for state in self._active]).reshape(
+                    len(self._active), len(self.models_to_use), len(self.columns)),
+                used=np.array([state.used for state in self._active], dtype=bool).reshape(
+                    len(self._active), len(self.models_to_use), len(self.columns)),
+                day=np.array([state.day for state in self._active], dtype=np.int64),
+                index=np.array([state.index for state in self._active], dtype=np.int64),
+                symbols=pd.Index([state.symbol for state in self._active], dtype=object),
+                running=running,
+            )
+        return self._stacked
+
+    def _running_car(self, state):
+        """事件已得到的各模型最后一个非缺失 CAR（没有时为 0），即下一天 CAR 的起点。"""
+        car = state.car
+        valid = ~np.isnan(car)
+        last = np.where(valid.any(axis=0), car.shape[0] - 1 - np.argmax(valid[::-1], axis=0), -1)
+        return np.where(last >= 0, car[np.maximum(last, 0), np.arange(car.shape[1])], 0.0)
+
+    def _update(self, today, firm_returns, row):
+        """以一次 einsum 计算全部活跃事件当天的 AR，并更新 CAR 与截面充分统计量。"""
+        columns = [f'{prefix}_{model}' for prefix in ('AbnormalReturn', 'CAR') for model in self.models_to_use]
+        if not self._active:
+            return pd.DataFrame(columns=['Symbol', 'EventDate', 'EventDay'] + columns)
+        stacked = self._stack()
+        offsets = today - stacked['day']
+        y = firm_returns.reindex(stacked['symbols']).to_numpy(dtype=float)
+        present = ~np.isnan(y)
+
+        # (1, K) 的设计行对所有事件广播：(E, M, K) × (1, K) -> (E, 1, M)
+        design = design_matrix(row, self.columns)
+        ar = y[:, None] - predict(stacked['coefficients'], design, stacked['used'])[:, 0, :]
+        # 事件窗口起点晚于事件日时（如 (2, 5)），窗口开始前的交易日既不计入也不累加到 CAR
+        in_window = offsets >= self.event_window_days[0]
+        ar[~in_window] = np.nan
+        stacked['running'] += np.where(np.isnan(ar), 0.0, ar)
+        car = np.where(np.isnan(ar), np.nan, stacked['running'])
+
+        rows = np.flatnonzero(present & in_window)
+        self._record(stacked['index'][rows], offsets[rows], ar[rows], car[rows])
+
+        finished = offsets >= self.event_window_days[1]
+        if finished.any():
+            for state in self._active:
+                if today - state.day >= self.event_window_days[1]:
+                    self._close(state)
+            self._active = [state for state in self._active if state.status == 'active']
+            self._stacked = None
+
+        return pd.DataFrame({
+            'Symbol': stacked['symbols'][rows],
+            'EventDate': [self.events[i].event_date for i in stacked['index'][rows]],
+            'EventDay': offsets[rows],
+            **dict(zip(columns, np.concatenate([ar[rows], car[rows]], axis=1).T)),
+        })
+
+    def _record(self, indices, offsets, ar, car):
+        """把 (事件, 事件日) 的 AR/CAR 写入事件状态，并并入截面充分统计量。"""
+        cols = offsets - self.event_window_days[0]
+        for index, col, ar_row, car_row in zip(indices, cols, ar, car):
+            self.events[index].ar[col] = ar_row
+            self.events[index].car[col] = car_row
+        model_axis = np.arange(len(self.models_to_use))
+        for kind, values in (('AR', ar), ('CAR', car)):
+            finite = ~np.isnan(values)
+            clean = np.where(finite, values, 0.0)
+            block = np.stack([finite, clean, clean * clean, finite & (clean > 0)], axis=-1).astype(float)
+            np.add.at(self.sums[kind], (cols[:, None], model_axis[None, :]), block)
+
+    # ------------------------------------------------------------------ 历史数据
+
+    def _compact(self, trim=True):
+        """把追加的交易日并入历史表；trim=True 时只保留最近 history_days 个交易日。"""
+        cutoff = None
+        if trim and len(self.dates) > self.history_days:
+            self._first_day = len(self.dates) - self.history_days
+            cutoff = self.dates[self._first_day]
+        for name in ('_firm', '_market', '_factors'):
+            frame = pd.concat(getattr(self, name), ignore_index=True) if len(getattr(self, name)) > 1 \
+                else getattr(self, name)[0]
+            if cutoff is not None:
+                frame = frame[frame['Date'] >= cutoff].reset_index(drop=True)
+            setattr(self, name, [frame])
+        self._firm_rows = None
+
+    def _history_panel(self, symbols):
+        """
+        由历史数据构建只含 symbols 的面板、交易日历与因子窗口缓存。此时不截断历史数据，
+        使构建会话时传入的较早事件仍可由完整的历史数据拟合。
+
+        市场与因子部分（日期轴、因子数组、交易日历与窗口缓存）只在历史数据变化
+        （追加交易日或截断）后重建，同一天内多次加入事件时复用。公司部分不合并历史表：
+        合并后的历史表按股票行号索引取出 symbols 的行，只在之后追加的交易日上做筛选。
+        """
+        key = (len(self.dates), self._first_day)
+        if self._history_key != key:
+            market_data = pd.concat(self._market, ignore_index=True) if len(self._market) > 1 else self._market[0]
+            ff_factors = pd.concat(self._factors, ignore_index=True) if len(self._factors) > 1 else self._factors[0]
+            base = PanelIndex(self._firm[0].iloc[:0], market_data, ff_factors)
+            self._history = (base, TradingCalendar.from_market(market_data),
+                             FactorWindowCache(base, self.window_cache_size))
+            self._history_key = key
+        base, calendar, cache = self._history
+
+        history = self._firm[0]
+        if self._firm_rows is None:
+            codes = history['Stkcd'].astype(str).to_numpy()
+            self._firm_rows = pd.Series(np.arange(len(codes))).groupby(codes).indices
+        rows = [self._firm_rows[symbol] for symbol in symbols if symbol in self._firm_rows]
+        pieces = [history.take(np.concatenate(rows)) if rows else history.iloc[:0]]
+        pieces += [piece[piece['Stkcd'].isin(symbols)] for piece in self._firm[1:]]
+        firm = pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0]
+        return base.with_firms(firm), calendar, cache
+
+    # ------------------------------------------------------------------ 结果
+
+    def summary(self, kind='CAR'):
+        """
+        返回每日截面统计表（kind 为 'AR' 或 'CAR'）：Model、EventDay、AvgAR/AvgCAR、N、
+        t 检验与符号检验，与流式模式的 event_study_daily_{kind}_results.csv 相同。
+        """
+        if kind not in self.sums:
+            raise ValueError(f"Unknown kind: {kind}")
+        n, total, squares, positive = np.moveaxis(self.sums[kind], -1, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / n
+            variance = np.where(n > 1, (squares - total * mean) / (n - 1), np.nan)
+            t_stat = np.where(variance > 0, mean / np.sqrt(variance / n), np.nan)
+            t_p = 2 * stats.t.sf(np.abs(t_stat), n - 1)
+            binomial = positive / n
+        binom_p = np.minimum(1.0, 2 * stats.binom.cdf(np.minimum(positive, n - positive), n, 0.5))
+
+        days = np.arange(self.event_window_days[0], self.event_window_days[1] + 1)
+        day, model = np.nonzero(n > 0)
+        return pd.DataFrame({
+            'EventDay': days[day],
+            f'Avg{kind}': mean[day, model],
+            'N': n[day, model].astype(np.int64),
+            't_statistic': t_stat[day, model],
+            't_p_value': t_p[day, model],
+            'Binomial_statistic': binomial[day, model],
+            'Binomial_p_value': binom_p[day, model],
+            'Model': np.array(self.models_to_use, dtype=object)[model],
+        }).sort_values(['Model', 'EventDay'], kind='mergesort').reset_index(drop=True)
+
+    def event_frame(self):
+        """
+        返回逐事件的当前状态：Symbol、EventDate、Status（pending/active/done/skipped）、
+        已得到的事件日数，以及各模型截至目前的 CAR（最后一个非缺失值）。
+        """
+        data = {
+            'Symbol': [state.symbol for state in self.events],
+            'EventDate': [state.event_date for state in self.events],
+            'Status': [state.status for state in self.events],
+            'DaysObserved': [int(np.sum(~np.isnan(state.ar).all(axis=1))) for state in self.events],
+        }
+        cars = np.array([np.where(np.isnan(state.car).all(axis=0), np.nan, self._running_car(state))
+                         for state in self.events]).reshape(len(self.events), len(self.models_to_use))
+        for m, model in enumerate(self.models_to_use):
+            data[f'CAR_{model}'] = cars[:, m]
+        return pd.DataFrame(data)
+
+    def event_rows(self, index):
+        """返回第 index 个事件的逐日 AR/CAR（只含已得到的事件日）。"""
+        state = self.events[index]
+        days = np.arange(self.event_window_days[0], self.event_window_days[1] + 1)
+        observed = ~np.isnan(state.ar).all(axis=1)
+        frame = pd.DataFrame({'EventDay': days[observed]})
+        for m, model in enumerate(self.models_to_use):
+            frame[f'AbnormalReturn_{model}'] = state.ar[observed, m]
+            frame[f'CAR_{model}'] = state.car[observed, m]
+        return frame
+
+    # ------------------------------------------------------------------ 快照
+
+    def snapshot(self, path):
+        """
+        把会话状态写入 path（pickle）：事件状态与固定系数、截面充分统计量、保留的历史数据，
+        以及所用模型的定义。先写临时文件再改名，中途失败不会损坏已有的快照。
+        """
+        self._compact()
+        self._dates = self.dates.copy()
+        self._stacked = None
+        self._history = self._history_key = self._firm_rows = None
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    @classmethod
+    def restore(cls, path):
+        """由 snapshot 写出的文件恢复会话；快照中的模型定义重新注册，使新进程中同样可用。"""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        for name, spec in state['models'].items():
+            register_model(name, spec.regressors, spec.intercept, spec.coefficients)
+        session = cls.__new__(cls)
+        session.__dict__.update(state)
+        return session
@@ -1,17 +1,153 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import warnings
-from event_study.data_loader import load_data
-from event_study.car_calculations import calculate_CAR_AR
-from event_study.statistical_tests import run_tests
+from contextlib import ExitStack
+from event_study.data_loader import compact_table, load_data
+from event_study.engine import (build_daily_tables, collect_processed, finish_profile, iter_processed,
+                                plot_average_ar, prepare_events, report_window_cache, stream_event_study,
+                                validate_options)
+from event_study.statistical_tests import select_tests
+from event_study.result_store import ResultStore, data_version, event_key
+from event_study.output_writers import WRITERS, write_results
+from event_study.results import RESULT_FORMAT, STATISTIC_INDEX
+from event_study.profiling import NULL_PROFILER, Profiler
 
-warnings.filterwarnings("ignore")
+def compute_event_study(event_data, firm_data, market_data, ff_factors, models_to_use=None,
+                        event_window_days=(-1, 1), estimation_window_days=250, regression_engine='batch',
+                        batch_size=1024, n_jobs=1, seed=None, test_options=None, window_unit='calendar',
+                        chunk_size=5000, window_cache_size=256, profiler=None, tests=None, compact_dtypes=False):
+    """
+    只计算的事件研究入口：输入为已加载的 DataFrame，不读写文件、不绘图，
+    也不导入 matplotlib、seaborn 与（默认的批量回归引擎下）statsmodels，适合短任务的工作进程。
+
+    参数与 run_event_study 相同；regression_engine 默认为 'batch'。
+    profiler 为可选的 Profiler 实例，调用方可在返回后读取其 report()。
+    compact_dtypes=True 时输入先由 compact_table 转为紧凑类型（已是紧凑类型的输入不受影响）。
+
+    返回：(results, daily_tables)。results 为 EventResults（事件 × 模型 × 统计量 的数组容器），
+    results.to_frame() 得到逐事件汇总表；没有有效事件时为 (None, {})。
+    """
+    results, _, daily_tables = _compute(event_data, firm_data, market_data, ff_factors, models_to_use,
+                                        event_window_days, estimation_window_days, regression_engine, batch_size,
+                                        n_jobs, seed, test_options, window_unit, chunk_size, window_cache_size,
+                                        profiler, tests, compact_dtypes)
+    return results, daily_tables
+
+def _compute(event_data, firm_data, market_data, ff_factors, models_to_use=None, event_window_days=(-1, 1),
+             estimation_window_days=250, regression_engine='batch', batch_size=1024, n_jobs=1, seed=None,
+             test_options=None, window_unit='calendar', chunk_size=5000, window_cache_size=256, profiler=None,
+             tests=None, compact_dtypes=False):
+    """compute_event_study 的实现，另外返回逐事件的 [(事件序号, merged_event)]：(results, processed, daily_tables)。"""
+    if models_to_use is None:
+        models_to_use = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+    validate_options(models_to_use, regression_engine, window_unit)
+    tests = select_tests(tests)
+    profiler = profiler or NULL_PROFILER
+    if compact_dtypes:
+        event_data, firm_data, market_data, ff_factors = (
+            compact_table(table) for table in (event_data, firm_data, market_data, ff_factors))
+
+    panel, calendar, window_cache, events = prepare_events(event_data, firm_data, market_data, ff_factors,
+                                                           window_unit, window_cache_size, profiler, compact_dtypes)
+    options = dict(
+        event_window_days=event_window_days,
+        estimation_window_days=estimation_window_days,
+        models_to_use=models_to_use,
+        regression_engine=regression_engine,
+        batch_size=batch_size,
+        seed=seed,
+        test_options=test_options,
+        calendar=calendar,
+        tests=tests,
+        compact_dtypes=compact_dtypes
+    )
+    chunks = iter_processed(events, chunk_size, panel, firm_data, market_data, ff_factors, n_jobs, options,
+                            window_cache=window_cache, profiler=profiler)
+    results, processed, correlations = collect_processed(chunks, len(events), models_to_use, event_window_days,
+                                                         profiler, tests)
+    if not processed:
+        return None, [], {}
+
+    daily_tables, _ = build_daily_tables(results, processed, correlations, models_to_use, event_window_days, calendar,
+                                         seed, test_options, profiler, tests)
+    return results, processed, daily_tables
+
+def _deviation(reference, compact):
+    """
+    比较两组数值：返回 (两边都非缺失的值数, 只有一边缺失的值数, 最大绝对偏差, 最大相对偏差)，
+    相对偏差以 max(|float64 值|, 1) 为分母，使接近零的 AR 不放大偏差。
+    """
+    reference = np.asarray(reference, dtype=float).ravel()
+    compact = np.asarray(compact, dtype=float).ravel()
+    both = ~np.isnan(reference) & ~np.isnan(compact)
+    mismatched = int(np.sum(np.isnan(reference) != np.isnan(compact)))
+    if not both.any():
+        return 0, mismatched, 0.0, 0.0
+    diff = np.abs(reference[both] - compact[both])
+    return int(both.sum()), mismatched, float(diff.max()), float(np.max(diff / np.maximum(np.abs(reference[both]), 1.0)))
+
+def check_compact_accuracy(event_data, firm_data, market_data, ff_factors, tolerance=1e-4, **options):
+    """
+    在同一份数据上分别以 float64 与紧凑类型模式（compact_dtypes=True）运行 compute_event_study，
+    报告紧凑类型模式相对 float64 的最大偏差，用于在采用紧凑类型模式前确认其精度。
+
+    比较的量：
+    - 'AR'、'CAR'：逐事件、逐事件日的异常收益与累计异常收益（各模型合并）；
+    - 'event:<统计量>'：逐事件结果中的各统计量（均值、检验统计量与 p 值、CAR_LastDay、sigma2 等）；
+    - 'daily_AR:<列>'、'daily_CAR:<列>'：每日 AR/CAR 检验表中的各列；
+    - 'events'：只在一种模式下有效的事件数（计入 NaNMismatch）。
+
+    options 为传给 compute_event_study 的其他参数（如 window_unit、tests、seed；置换检验请给定 seed）。
+    返回按 Quantity 排列的 DataFrame：Compared（两边都非缺失的值数）、NaNMismatch（只一边缺失的值数）、
+    MaxAbsDeviation、MaxRelDeviation（以 max(|float64 值|, 1) 为分母）与
+    Passed（MaxRelDeviation 不超过 tolerance 且没有缺失不一致）。
+    """
+    options.pop('compact_dtypes', None)
+    runs = [_compute(event_data, firm_data, market_data, ff_factors, **options, compact_dtypes=compact)
+            for compact in (False, True)]
+    (reference, reference_rows, reference_daily), (compact, compact_rows, compact_daily) = runs
+    if reference is None or compact is None:
+        raise ValueError("No valid event result was found.")
+
+    rows = {'events': (0, int(np.sum(reference.valid != compact.valid)), 0.0, 0.0)}
+    compact_frames = dict(compact_rows)
+    for prefix, label in (('AbnormalReturn', 'AR'), ('CAR', 'CAR')):
+        pairs = [(frame, compact_frames[index]) for index, frame in reference_rows
+                 if index in compact_frames and len(frame) == len(compact_frames[index])]
+        columns = [f'{prefix}_{model}' for model in reference.models]
+        rows[label] = _deviation(np.concatenate([a[columns].to_numpy(dtype=float) for a, _ in pairs]),
+                                 np.concatenate([b[columns].to_numpy(dtype=float) for _, b in pairs]))
+
+    both = reference.valid & compact.valid
+    for name in reference.statistics:
+        s = STATISTIC_INDEX[name]
+        rows[f'event:{name}'] = _deviation(reference.values[both, :, s], compact.values[both, :, s])
+
+    for (kind, model), table in reference_daily.items():
+        other = compact_daily[(kind, model)].set_index('EventDay')
+        table = table.set_index('EventDay')
+        for column in table.columns:
+            key = f'daily_{kind}:{column}'
+            a, b = table[column].to_numpy(dtype=float), other[column].reindex(table.index).to_numpy(dtype=float)
+            current = _deviation(a, b)
+            if key in rows:
+                previous = rows[key]
+                current = (previous[0] + current[0], previous[1] + current[1],
+                           max(previous[2], current[2]), max(previous[3], current[3]))
+            rows[key] = current
+
+    report = pd.DataFrame.from_dict(rows, orient='index',
+                                    columns=['Compared', 'NaNMismatch', 'MaxAbsDeviation', 'MaxRelDeviation'])
+    report['Passed'] = (report['MaxRelDeviation'] <= tolerance) & (report['NaNMismatch'] == 0)
+    return report.rename_axis('Quantity').reset_index()
 
 def run_event_study(models_to_use=None, event_window_days=(-1, 1), estimation_window_days=250,
                     generate_plots=True, event_file='Event.xlsx', firm_file='Firm.xlsx',
-                    market_file='Market.xlsx', ff_factors_file='FF factor.xlsx'):
+                    market_file='Market.xlsx', ff_factors_file='FF factor.xlsx',
+                    regression_engine='batch', batch_size=1024, n_jobs=1, seed=None,
+                    cache_dir=None, use_cache=True, test_options=None, window_unit='calendar',
+                    stream_dir=None, chunk_size=5000, result_store=None, window_cache_size=256,
+                    output_format='excel', excel_summary=False, profile=False, profile_hooks=(), tests=None,
+                    compact_dtypes=False):
     """
     运行事件研究分析。
 
@@ -20,212 +156,145 @@ def run_event_study(models_to_use=None, event_window_days=(-1, 1), estimation_wi
     - event_window_days：事件窗口大小（区间，如 (-1, 1) 表示 [前 1 天，后 1 天]）。
     - estimation_window_days：估计窗口大小。
     - generate_plots：是否生成可视化结果。
-    - event_file：事件数据文件路径。
+    - event_file：事件数据文件路径（支持 Excel、CSV、Parquet）。
     - firm_file：公司数据文件路径。
     - market_file：市场数据文件路径。
     - ff_factors_file：FF因子数据文件路径。
+    - regression_engine：回归引擎，默认 'batch' 为批量估计，与 compute_event_study 相同；
+      'statsmodels' 为逐事件拟合，保留用于与早期结果对照（基准测试以它为参照）。
+    - batch_size：批量估计时每批的事件数。
+    - n_jobs：并行进程数，大于 1 时将事件分片到进程池中计算。
+    - seed：置换检验的随机种子；给定种子时，串行与并行运行的结果完全一致。
+    - cache_dir：输入数据列式缓存的目录，默认为按用户区分的 ~/.cache/event_study（设置了 $XDG_CACHE_HOME 时为其下的 event_study）。
+    - use_cache：是否使用输入数据的列式缓存。
+    - test_options：传给 run_tests 的参数，如 {'adaptive': True, 'exact_max_n': 10}。
+    - window_unit：窗口单位，'calendar' 为自然日，'trading' 为由市场收益序列构建的交易日；
+      交易日模式下每个事件窗口长度固定，AR/CAR 直接写入预分配的 (事件数, 窗口长度) 数组。
+    - stream_dir：流式输出目录。提供时按 chunk_size 分块处理事件，逐块追加写入 CSV，
+      每日 AAR/CAAR 只由运行中的充分统计量汇总（t 检验与符号检验），内存占用不随事件数增长。
+    - chunk_size：每块处理的事件数（流式输出与结果存储均按块进行）。
+    - result_store：持久化结果存储（SQLite 文件路径）。事件按 (股票代码, 事件日期, 模型, 窗口参数,
+      数据版本) 建键，已有结果直接复用，只计算新增或失效的事件；每块完成后提交，中断后可继续。
+      各事件的拟合系数与估计窗口方差另按 (股票代码, 事件日期, 模型, 估计窗口, 数据版本) 保存，
+      只改变事件窗口、检验或随机种子时复用这些拟合结果，不再回归。数据版本由输入文件内容的 SHA-256 得到，
+      只改变文件修改时间不会使结果失效。
+    - window_cache_size：按窗口缓存市场+因子数据块与设计矩阵的 LRU 容量，0 表示不缓存；
+      运行结束时报告缓存大小与命中率。
+    - output_format：输出格式。'excel' 为原有的四个 Excel 文件；'parquet'、'feather'、'csv'
+      一次性写出逐事件长表（事件 × 模型 × 统计量）及每日 AR/CAR 检验表，不受 Excel 行数上限限制。
+    - excel_summary：非 Excel 输出时，是否另外写出只含每日汇总表的 event_study_summary.xlsx。
+    - profile：是否记录各阶段（加载、窗口提取、回归、检验、输出等）的墙钟与 CPU 时间，
+      以及处理/跳过的事件数（含跳过原因）、扫描行数、回归与检验次数；开启时打印并返回结构化报告。
+    - profile_hooks：profile 开启时的可选钩子，'cprofile'（各阶段耗时最多的函数）
+      与 'tracemalloc'（各阶段的内存峰值）。
+    - tests：要计算并输出的检验，默认为全部。逐事件与每日截面检验取自
+      't'、'patell'、'wilcoxon'、'binomial'、'permutation'、'corrado'，
+      标准化残差检验取自 'patell_sr'、'bmp'、'kp'，如 tests=('t', 'binomial')；
+      未选择的检验不计算，输出中也没有对应的列。
+    - compact_dtypes：紧凑类型模式。代码列以 categorical（整数编码）读取，收益与因子以 float32 存放，
+      保留到每日汇总的逐事件 AR/CAR 为 float32、EventDay 为 int32；回归仍在 float64 下累加。
+      内存约减半，结果与 float64 模式有微小差异，可用 check_compact_accuracy 在同一数据上检查其大小。
     """
     if models_to_use is None:
         models_to_use = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+    validate_options(models_to_use, regression_engine, window_unit)
+    tests = select_tests(tests)
+    if output_format != 'excel' and output_format not in WRITERS:
+        raise ValueError(f"Unknown output_format: {output_format}")
+
+    profiler = Profiler(profile_hooks) if profile else NULL_PROFILER
 
     # 加载数据
-    event_data, firm_data, market_data, ff_factors = load_data(
-        event_file=event_file,
-        firm_file=firm_file,
-        market_file=market_file,
-        ff_factors_file=ff_factors_file
+    with profiler.stage('load_data'):
+        event_data, firm_data, market_data, ff_factors = load_data(
+            event_file=event_file,
+            firm_file=firm_file,
+            market_file=market_file,
+            ff_factors_file=ff_factors_file,
+            cache_dir=cache_dir,
+            use_cache=use_cache,
+            compact=compact_dtypes
+        )
+
+    panel, calendar, window_cache, events = prepare_events(event_data, firm_data, market_data, ff_factors,
+                                                           window_unit, window_cache_size, profiler, compact_dtypes)
+    options = dict(
+        event_window_days=event_window_days,
+        estimation_window_days=estimation_window_days,
+        models_to_use=models_to_use,
+        regression_engine=regression_engine,
+        batch_size=batch_size,
+        seed=seed,
+        test_options=test_options,
+        calendar=calendar,
+        tests=tests,
+        compact_dtypes=compact_dtypes
     )
 
-    summary_results = []
-    all_event_data = []
-
-    for idx, row in event_data.iterrows():
-        symbol = row['Symbol']
-        event_date = row['Date']
-
-        res = calculate_CAR_AR(
-            symbol=symbol,
-            event_date=event_date,
-            firm_data=firm_data,
-            market_data=market_data,
-            ff_factors=ff_factors,
-            event_window_days=event_window_days,  # 传入事件窗口范围
-            estimation_window_days=estimation_window_days,
-            models_to_use=models_to_use
-        )
+    with ExitStack() as stack:
+        store = keys = estimate_keys = None
+        if result_store is not None:
+            store = stack.enter_context(ResultStore(result_store))
+            # 拟合结果只取决于模型、估计窗口与数据，事件窗口、检验与随机种子改变后仍可复用
+            estimate_params = dict(
+                models_to_use=list(models_to_use),
+                estimation_window_days=estimation_window_days,
+                window_unit=window_unit,
+                data_version=data_version(firm_file, market_file, ff_factors_file),
+                result_format=RESULT_FORMAT
+            )
+            if compact_dtypes:
+                # 只在开启时加入键参数，使 float64 模式下已存储的结果仍可复用
+                estimate_params['compact_dtypes'] = True
+            params = dict(
+                estimate_params,
+                event_window_days=list(event_window_days),
+                test_options=test_options,
+                tests=list(tests),
+                seed=seed
+            )
+            keys = {index: event_key(symbol, event_date, params) for index, symbol, event_date in events}
+            estimate_keys = {index: event_key(symbol, event_date, estimate_params)
+                             for index, symbol, event_date in events}
+
+        chunks = iter_processed(events, chunk_size, panel, firm_data, market_data, ff_factors, n_jobs, options,
+                                store=store, keys=keys, window_cache=window_cache, profiler=profiler,
+                                estimate_keys=estimate_keys)
+
+        if stream_dir is not None:
+            with profiler.stage('process_events'):
+                average_AR_per_day = stream_event_study(chunks, models_to_use, event_window_days, stream_dir,
+                                                        tests=tests)
+            report_window_cache(window_cache, profiler)
+            if generate_plots and average_AR_per_day is not None:
+                with profiler.stage('plots'):
+                    plot_average_ar(average_AR_per_day, models_to_use, event_window_days)
+            print("The event study analysis has been successfully completed and all output files have been generated.")
+            return finish_profile(profiler)
 
-        if res:
-            result, merged_event = res
-            summary_results.append(result)
-            all_event_data.append(merged_event)
+        results, processed, correlations = collect_processed(chunks, len(events), models_to_use,
+                                                             event_window_days, profiler, tests)
+        report_window_cache(window_cache, profiler)
 
-    if not summary_results:
+    if not processed:
         print("No valid event result was found.")
-        return
-
-    summary_df = pd.DataFrame(summary_results)
-
-    # 保存 individual CAR results with tests
-    with pd.ExcelWriter("event_study_individual_CAR_results_with_tests.xlsx", engine='xlsxwriter') as writer:
-        for model in models_to_use:
-            cols = ['Symbol', 'EventDate',
-                    f'AvgCAR_{model}', f't_statistic_{model}', f't_p_value_{model}',
-                    f'patell_statistic_{model}', f'patell_p_value_{model}',
-                    f'wilcoxon_statistic_{model}', f'wilcoxon_p_value_{model}',
-                    f'binomial_statistic_{model}', f'binomial_p_value_{model}',
-                    f'permutation_statistic_{model}', f'permutation_p_value_{model}',
-                    f'corrado_statistic_{model}', f'corrado_p_value_{model}',
-                    f'AvgAR_{model}', f't_statistic_AR_{model}', f't_p_value_AR_{model}',
-                    f'patell_statistic_AR_{model}', f'patell_p_value_AR_{model}',
-                    f'wilcoxon_statistic_AR_{model}', f'wilcoxon_p_value_AR_{model}',
-                    f'binomial_statistic_AR_{model}', f'binomial_p_value_AR_{model}',
-                    f'permutation_statistic_AR_{model}', f'permutation_p_value_AR_{model}',
-                    f'corrado_statistic_AR_{model}', f'corrado_p_value_AR_{model}']
-            existing_cols = [col for col in cols if col in summary_df.columns]
-            model_df = summary_df[existing_cols].copy()
-            model_df.rename(columns={
-                f'AvgCAR_{model}': 'AvgCAR',
-                f't_statistic_{model}': 't_statistic',
-                f't_p_value_{model}': 't_p_value',
-                f'patell_statistic_{model}': 'Patell_statistic',
-                f'patell_p_value_{model}': 'Patell_p_value',
-                f'wilcoxon_statistic_{model}': 'Wilcoxon_statistic',
-                f'wilcoxon_p_value_{model}': 'Wilcoxon_p_value',
-                f'binomial_statistic_{model}': 'Binomial_statistic',
-                f'binomial_p_value_{model}': 'Binomial_p_value',
-                f'permutation_statistic_{model}': 'Permutation_statistic',
-                f'permutation_p_value_{model}': 'Permutation_p_value',
-                f'corrado_statistic_{model}': 'Corrado_statistic',
-                f'corrado_p_value_{model}': 'Corrado_p_value',
-                f'AvgAR_{model}': 'AvgAR',
-                f't_statistic_AR_{model}': 't_statistic_AR',
-                f't_p_value_AR_{model}': 't_p_value_AR',
-                f'patell_statistic_AR_{model}': 'Patell_statistic_AR',
-                f'patell_p_value_AR_{model}': 'Patell_p_value_AR',
-                f'wilcoxon_statistic_AR_{model}': 'Wilcoxon_statistic_AR',
-                f'wilcoxon_p_value_AR_{model}': 'Wilcoxon_p_value_AR',
-                f'binomial_statistic_AR_{model}': 'Binomial_statistic_AR',
-                f'binomial_p_value_AR_{model}': 'Binomial_p_value_AR',
-                f'permutation_statistic_AR_{model}': 'Permutation_statistic_AR',
-                f'permutation_p_value_AR_{model}': 'Permutation_p_value_AR',
-                f'corrado_statistic_AR_{model}': 'Corrado_statistic_AR',
-                f'corrado_p_value_AR_{model}': 'Corrado_p_value_AR'
-            }, inplace=True)
-            model_df.to_excel(writer, sheet_name=model, index=False)
-
-    # 保存事件窗口最后一天的CAR测试结果
-    with pd.ExcelWriter("event_study_CAR_last_day_tests.xlsx", engine='xlsxwriter') as writer:
-        cols = ['Symbol', 'EventDate'] + [f'CAR_LastDay_{model}' for model in models_to_use]
-        existing_cols = [col for col in cols if col in summary_df.columns]
-        model_df = summary_df[existing_cols].copy()
-        model_df.to_excel(writer, sheet_name='CAR_Last_Day', index=False)
-
-    # 保存每日平均AR及其测试结果
-    combined_event_data = pd.concat(all_event_data, ignore_index=True)
-
-    ar_cols = {f'AbnormalReturn_{model}': 'mean' for model in models_to_use}
-    average_AR_per_day = combined_event_data.groupby('EventDay').agg(ar_cols).reset_index()
-
-    with pd.ExcelWriter("event_study_daily_AR_results_with_tests.xlsx", engine='xlsxwriter') as writer:
-        for model in models_to_use:
-            ar_col = f'AbnormalReturn_{model}'
-            ar_grouped = combined_event_data.groupby('EventDay')[ar_col]
-
-            test_results = []
-            for day, group in ar_grouped:
-                data = group.dropna().values
-                if len(data) > 0:
-                    tests = run_tests(data)
-                else:
-                    tests = {}
-                result = {'EventDay': day, 'AvgAR': average_AR_per_day.loc[average_AR_per_day['EventDay'] == day, ar_col].values[0]}
-                for key, value in tests.items():
-                    result[f'{key}'] = value
-                test_results.append(result)
-
-            test_df = pd.DataFrame(test_results)
-
-            test_df.rename(columns={
-                't_statistic': 't_statistic',
-                't_p_value': 't_p_value',
-                'patell_statistic': 'Patell_statistic',
-                'patell_p_value': 'Patell_p_value',
-                'wilcoxon_statistic': 'Wilcoxon_statistic',
-                'wilcoxon_p_value': 'Wilcoxon_p_value',
-                'binomial_statistic': 'Binomial_statistic',
-                'binomial_p_value': 'Binomial_p_value',
-                'permutation_statistic': 'Permutation_statistic',
-                'permutation_p_value': 'Permutation_p_value',
-                'corrado_statistic': 'Corrado_statistic',
-                'corrado_p_value': 'Corrado_p_value'
-            }, inplace=True)
-
-            test_df.to_excel(writer, sheet_name=f'{model}_AR', index=False)
-
-    # 保存每日平均CAR及其测试结果
-    car_cols = {f'CAR_{model}': 'mean' for model in models_to_use}
-    average_CAR_per_day = combined_event_data.groupby('EventDay').agg(car_cols).reset_index()
-
-    with pd.ExcelWriter("event_study_daily_CAR_results_with_tests.xlsx", engine='xlsxwriter') as writer:
-        for model in models_to_use:
-            car_col = f'CAR_{model}'
-            car_grouped = combined_event_data.groupby('EventDay')[car_col]
-
-            test_results = []
-            for day, group in car_grouped:
-                data = group.dropna().values
-                if len(data) > 0:
-                    tests = run_tests(data)
-                else:
-                    tests = {}
-                result = {'EventDay': day, 'AvgCAR': average_CAR_per_day.loc[average_CAR_per_day['EventDay'] == day, car_col].values[0]}
-                for key, value in tests.items():
-                    result[f'{key}'] = value
-                test_results.append(result)
-
-            test_df = pd.DataFrame(test_results)
-
-            test_df.rename(columns={
-                't_statistic': 't_statistic',
-                't_p_value': 't_p_value',
-                'patell_statistic': 'Patell_statistic',
-                'patell_p_value': 'Patell_p_value',
-                'wilcoxon_statistic': 'Wilcoxon_statistic',
-                'wilcoxon_p_value': 'Wilcoxon_p_value',
-                'binomial_statistic': 'Binomial_statistic',
-                'binomial_p_value': 'Binomial_p_value',
-                'permutation_statistic': 'Permutation_statistic',
-                'permutation_p_value': 'Permutation_p_value',
-                'corrado_statistic': 'Corrado_statistic',
-                'corrado_p_value': 'Corrado_p_value'
-            }, inplace=True)
-
-            test_df.to_excel(writer, sheet_name=f'{model}_CAR', index=False)
+        return finish_profile(profiler)
+
+    daily_tables, average_AR_per_day = build_daily_tables(results, processed, correlations, models_to_use,
+                                                          event_window_days, calendar, seed, test_options, profiler,
+                                                          tests)
+
+    with profiler.stage('write_output'):
+        if output_format == 'excel':
+            from event_study.excel_output import write_excel_results
+            write_excel_results(results.to_frame(), daily_tables, models_to_use)
+        else:
+            write_results(results, daily_tables, models_to_use, output_format, excel_summary=excel_summary)
 
     # 可视化部分
     if generate_plots:
-        plot_models = []
-        color_map = {'MarketModel': 'blue', 'MarketAdjusted': 'green', '3F': 'purple', '4F': 'orange', '5F': 'red'}
-        for model in models_to_use:
-            plot_models.append({
-                "model": model,
-                "color": color_map.get(model, 'black'),
-                "title": f"Average AR by Event Day ({model})"
-            })
-
-        for plot_model in plot_models:
-            model = plot_model['model']
-            ar_col = f'AbnormalReturn_{model}'
-            plt.figure(figsize=(10, 6))
-            sns.lineplot(data=average_AR_per_day, x='EventDay', y=ar_col, color=plot_model['color'], marker='o')
-            plt.title(plot_model['title'], fontsize=14, fontweight='bold')
-            plt.xlabel("Event Day (Relative to Event Date)", fontsize=12)
-            plt.ylabel("Average Abnormal Return (AR)", fontsize=12)
-            plt.axvline(x=0, linestyle='--', color='gray')
-            plt.xticks(ticks=range(event_window_days[0], event_window_days[1] + 1))
-            plt.grid(True, which='both', linestyle='--', linewidth=0.5)
-            plt.tight_layout()
-            plt.savefig(f"AR_{model}.png")
-            plt.close()
-
-    print("The event study analysis has been successfully completed and all output files have been generated.")
\ No newline at end of file
+        with profiler.stage('plots'):
+            plot_average_ar(average_AR_per_day, models_to_use, event_window_days)
+
+    print("The event study analysis has been successfully completed and all output files have been generated.")
+    return finish_profile(profiler)
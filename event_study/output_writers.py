@@ -0,0 +1,137 @@
+# event_study/output_writers.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .statistical_tests import TEST_KEYS
+
+# run_tests 与 standardized_tests 的检验键对应的输出列名
+STATISTIC_NAMES = {
+    't_statistic': 't_statistic',
+    't_p_value': 't_p_value',
+    'patell_statistic': 'Patell_statistic',
+    'patell_p_value': 'Patell_p_value',
+    'wilcoxon_statistic': 'Wilcoxon_statistic',
+    'wilcoxon_p_value': 'Wilcoxon_p_value',
+    'binomial_statistic': 'Binomial_statistic',
+    'binomial_p_value': 'Binomial_p_value',
+    'permutation_statistic': 'Permutation_statistic',
+    'permutation_p_value': 'Permutation_p_value',
+    'corrado_statistic': 'Corrado_statistic',
+    'corrado_p_value': 'Corrado_p_value',
+    'patell_sr_statistic': 'PatellSR_statistic',
+    'patell_sr_p_value': 'PatellSR_p_value',
+    'bmp_statistic': 'BMP_statistic',
+    'bmp_p_value': 'BMP_p_value',
+    'kp_statistic': 'KP_statistic',
+    'kp_p_value': 'KP_p_value',
+}
+
+def event_statistics(model):
+    """
+    返回单个模型的逐事件统计量 [(结果键, 输出名)]，顺序与原 Excel 输出一致：
+    先是 CAR 均值及其检验，再是 AR 均值及其检验，最后是事件窗口最后一天的 CAR。
+    """
+    pairs = [(f'AvgCAR_{model}', 'AvgCAR')]
+    pairs += [(f'{key}_{model}', STATISTIC_NAMES[key]) for key in TEST_KEYS]
+    pairs.append((f'AvgAR_{model}', 'AvgAR'))
+    pairs += [(f'{key}_AR_{model}', f'{STATISTIC_NAMES[key]}_AR') for key in TEST_KEYS]
+    pairs.append((f'CAR_LastDay_{model}', 'CAR_LastDay'))
+    return pairs
+
+def long_results(summary_df, models_to_use):
+    """
+    一次性把逐事件结果整理为长表（事件 × 模型 × 统计量），列为
+    Symbol、EventDate、Model、Statistic、Value；结果中不存在的统计量被跳过。
+    """
+    keys, models, statistics = [], [], []
+    for model in models_to_use:
+        for key, name in event_statistics(model):
+            if key in summary_df.columns:
+                keys.append(key)
+                models.append(model)
+                statistics.append(name)
+
+    n_events, n_stats = len(summary_df), len(keys)
+    # (事件, 模型×统计量) 矩阵按行展开即为事件优先的顺序
+    values = summary_df[keys].to_numpy(dtype=float).ravel() if n_stats else np.empty(0)
+    return pd.DataFrame({
+        'Symbol': np.repeat(summary_df['Symbol'].to_numpy(), n_stats),
+        'EventDate': np.repeat(summary_df['EventDate'].to_numpy(), n_stats),
+        'Model': np.tile(np.array(models, dtype=object), n_events),
+        'Statistic': np.tile(np.array(statistics, dtype=object), n_events),
+        'Value': values,
+    })
+
+def long_statistic_names():
+    """EventResults 的统计量名 -> 长表中的输出名（与 event_statistics 的命名一致）。"""
+    names = {}
+    for key in TEST_KEYS:
+        names[key] = STATISTIC_NAMES[key]
+        names[f'{key}_AR'] = f'{STATISTIC_NAMES[key]}_AR'
+    return names
+
+def _write_parquet(frame, path):
+    frame.to_parquet(path, index=False)
+
+def _write_feather(frame, path):
+    frame.reset_index(drop=True).to_feather(path)
+
+def _write_csv(frame, path):
+    frame.to_csv(path, index=False)
+
+# 输出格式 -> (文件扩展名, 写出函数)；可通过 register_writer 扩展
+WRITERS = {
+    'parquet': ('.parquet', _write_parquet),
+    'feather': ('.feather', _write_feather),
+    'csv': ('.csv', _write_csv),
+}
+
+def register_writer(name, extension, writer):
+    """注册新的输出格式；writer(frame, path) 负责把 DataFrame 写入 path。"""
+    WRITERS[name] = (extension, writer)
+
+def daily_frame(daily_tables, kind):
+    """把各模型的每日检验表（{(类型, 模型): DataFrame}）拼接为带 Model 列的单张表。"""
+    frames = [table.assign(Model=model) for (table_kind, model), table in daily_tables.items() if table_kind == kind]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def write_results(summary_df, daily_tables, models_to_use, output_format, output_dir='.', excel_summary=False):
+    """
+    以列式或文本格式写出结果：逐事件长表一个文件，每日 AR/CAR 检验表各一个文件。
+
+    summary_df 可以是逐事件汇总表，也可以是 EventResults；后者直接由数组构建长表，不经过宽表。
+
+    excel_summary=True 时另外写出只含每日汇总表的 Excel 文件（不受 Excel 行数上限影响），
+    此时才导入 excel_output 模块。返回写出的文件路径列表。
+    """
+    if output_format not in WRITERS:
+        raise ValueError(f"Unknown output_format: {output_format}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = [write_event_table(summary_df, models_to_use, output_format, output_dir)]
+    paths += [write_daily_table(daily_tables, kind, output_format, output_dir) for kind in ('AR', 'CAR')]
+
+    if excel_summary:
+        from .excel_output import write_excel_summary
+        paths.append(write_excel_summary(daily_tables, output_dir))
+
+    return paths
+
+def write_event_table(summary_df, models_to_use, output_format, output_dir='.'):
+    """写出逐事件长表 event_study_results（summary_df 为汇总表或 EventResults），返回文件路径。"""
+    extension, writer = WRITERS[output_format]
+    frame = (summary_df.long_frame(names=long_statistic_names())
+             if hasattr(summary_df, 'long_frame') else long_results(summary_df, models_to_use))
+    path = os.path.join(output_dir, 'event_study_results' + extension)
+    writer(frame, path)
+    return path
+
+def write_daily_table(daily_tables, kind, output_format, output_dir='.'):
+    """写出 kind（'AR' 或 'CAR'）的每日检验表 event_study_daily_{kind}_results，返回文件路径。"""
+    extension, writer = WRITERS[output_format]
+    path = os.path.join(output_dir, f'event_study_daily_{kind}_results' + extension)
+    writer(daily_frame(daily_tables, kind), path)
+    return path
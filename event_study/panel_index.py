@@ -0,0 +1,253 @@
+# event_study/panel_index.py
+
+import json
+import os
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .regression_models import EstimationSample
+
+# 预先拼接的市场+因子数据块：first 为块首行在日期轴上的位置，design 为含常数项的设计矩阵
+FactorBlock = namedtuple('FactorBlock', ['first', 'dates', 'values', 'design'])
+
+def _to_datetime64(value):
+    """将日期标量转换为 numpy datetime64[ns]。"""
+    return pd.Timestamp(value).to_datetime64().astype('datetime64[ns]')
+
+
+class PanelIndex:
+    """
+    预先索引的面板数据存储，在 run_event_study 中只构建一次。
+
+    - 公司收益按 'Stkcd' 分组，存放在连续且按日期排序的数组中；
+    - 市场收益与因子序列对齐到同一个交易日期轴（市场与因子日期的交集）；
+    - 每只股票的每一行都预先记录其在日期轴上的位置（不在轴上的记为 -1）。
+
+    窗口提取因此只需一次二分查找（searchsorted）和切片，而无需对整张表做布尔掩码。
+    只保留公司表中的数值列以及 'Stkcd'、'Date' 两列。
+
+    compact=True 时收益与因子以 float32、日期轴位置以 int32 存放，且只保留日期轴上的公司行、
+    行日期由日期轴位置给出，公司数组每行由 24 字节降为 8 字节（单个收益列时）；
+    取出的估计窗口样本与设计矩阵仍为 float64，回归在 float64 下累加。
+    'Stkcd' 为 categorical 时按整数编码分组，不为每一行构造字符串。
+    """
+
+    compact = False
+
+    def __init__(self, firm_data, market_data, ff_factors, compact=False):
+        self.compact = compact
+        factors = market_data.merge(ff_factors, on='Date', how='inner')
+        factors = factors.sort_values('Date', kind='mergesort')
+        self.factor_columns = [col for col in factors.columns
+                               if col != 'Date' and pd.api.types.is_numeric_dtype(factors[col])]
+        self.dates = factors['Date'].to_numpy(dtype='datetime64[ns]')
+        self.factor_values = factors[self.factor_columns].to_numpy(dtype=self._value_dtype)
+        self._index_firms(firm_data)
+
+    @property
+    def _value_dtype(self):
+        return np.float32 if self.compact else np.float64
+
+    def _index_firms(self, firm_data):
+        """按 'Stkcd' 分组存放公司收益，并记录每一行在日期轴上的位置。"""
+        self.firm_columns = [col for col in firm_data.columns
+                             if col in ('Stkcd', 'Date') or pd.api.types.is_numeric_dtype(firm_data[col])]
+        self.value_columns = [col for col in self.firm_columns if col not in ('Stkcd', 'Date')]
+
+        firm = firm_data[self.firm_columns]
+        if firm['Stkcd'].isna().any():
+            # 缺失代码的行无法与任何事件匹配
+            firm = firm[firm['Stkcd'].notna()]
+        categorical = isinstance(firm['Stkcd'].dtype, pd.CategoricalDtype)
+        if categorical:
+            # 类别按字符串排序后的名次作为分组键，排序结果与按字符串排序相同
+            labels = firm['Stkcd'].cat.categories.to_numpy().astype(str)
+            label_order = np.argsort(labels, kind='stable')
+            rank = np.empty(len(labels), dtype=np.int64)
+            rank[label_order] = np.arange(len(labels))
+            key = rank[firm['Stkcd'].cat.codes.to_numpy()]
+            order = np.lexsort((firm['Date'].to_numpy(dtype='datetime64[ns]'), key))
+            firm, key, labels = firm.iloc[order], key[order], labels[label_order]
+        else:
+            # 先转换为字符串再排序，使整数等非字符串代码的分组顺序与 symbol_bounds 的字符串查找一致
+            key = firm['Stkcd'].to_numpy().astype(str)
+            order = np.lexsort((firm['Date'].to_numpy(dtype='datetime64[ns]'), key))
+            firm, key = firm.iloc[order], key[order]
+        firm_dates = firm['Date'].to_numpy(dtype='datetime64[ns]')
+        firm_values = firm[self.value_columns].to_numpy(dtype=self._value_dtype)
+
+        pos = np.searchsorted(self.dates, firm_dates)
+        matched = pos < len(self.dates)
+        matched[matched] = self.dates[pos[matched]] == firm_dates[matched]
+        if self.compact:
+            # 不在日期轴上的行不会被任何窗口取到，直接丢弃；行的日期由日期轴位置给出，不再单独存放
+            key, firm_values, pos = key[matched], firm_values[matched], pos[matched]
+            self.firm_dates = np.empty(0, dtype='datetime64[ns]')
+            self.firm_pos = pos.astype(np.int32)
+        else:
+            self.firm_dates = firm_dates
+            self.firm_pos = np.where(matched, pos, -1).astype(np.int64)
+        self.firm_values = firm_values
+
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.array([], dtype=np.int64)
+        self.symbols = labels[key[starts]] if categorical else key[starts]
+        self.offsets = np.r_[starts, len(key)].astype(np.int64)
+
+    def with_firms(self, firm_data):
+        """
+        返回只含 firm_data 中公司的新面板，日期轴与市场/因子数组与本面板共用（不复制），
+        因此基于本面板的 FactorWindowCache 对新面板同样有效。流水线运行时按股票分组逐步构建面板。
+        """
+        panel = PanelIndex.__new__(PanelIndex)
+        panel.compact = self.compact
+        panel.factor_columns, panel.dates, panel.factor_values = self.factor_columns, self.dates, self.factor_values
+        panel._index_firms(firm_data)
+        return panel
+
+    _ARRAYS = ('dates', 'factor_values', 'firm_dates', 'firm_values', 'symbols', 'offsets', 'firm_pos')
+
+    def save(self, directory):
+        """将面板数组逐个保存为 .npy 文件，供其他进程以内存映射方式加载。"""
+        os.makedirs(directory, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        meta = {
+            'factor_columns': self.factor_columns,
+            'firm_columns': self.firm_columns,
+            'value_columns': self.value_columns,
+            'compact': self.compact,
+        }
+        with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """从 save 写出的目录加载面板；默认以只读内存映射方式打开，不复制数据。"""
+        panel = cls.__new__(cls)
+        with open(os.path.join(directory, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        for key, value in meta.items():
+            setattr(panel, key, value)
+        for name in cls._ARRAYS:
+            setattr(panel, name, np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode))
+        return panel
+
+    def symbol_bounds(self, symbol):
+        """返回股票在公司数组中的 [起始, 结束) 行号；股票不存在时返回 (0, 0)。"""
+        symbol = str(symbol)
+        slot = np.searchsorted(self.symbols, symbol)
+        if slot >= len(self.symbols) or self.symbols[slot] != symbol:
+            return 0, 0
+        return int(self.offsets[slot]), int(self.offsets[slot + 1])
+
+    def window_rows(self, symbol, start, end):
+        """
+        返回股票在 [start, end] 区间内、且日期在市场/因子轴上的公司行号，
+        以及这些行在日期轴上的位置。
+        """
+        lo, hi = self.symbol_bounds(symbol)
+        if self.compact:
+            # 紧凑模式下各行都在日期轴上，按日期轴位置二分查找
+            positions = self.firm_pos[lo:hi]
+            first = lo + np.searchsorted(positions, np.searchsorted(self.dates, _to_datetime64(start), side='left'))
+            last = lo + np.searchsorted(positions, np.searchsorted(self.dates, _to_datetime64(end), side='right'))
+            return np.arange(first, last), self.firm_pos[first:last]
+        dates = self.firm_dates[lo:hi]
+        first = lo + np.searchsorted(dates, _to_datetime64(start), side='left')
+        last = lo + np.searchsorted(dates, _to_datetime64(end), side='right')
+        rows = np.arange(first, last)
+        pos = self.firm_pos[first:last]
+        keep = pos >= 0
+        return rows[keep], pos[keep]
+
+    def window(self, symbol, start, end, cache=None):
+        """
+        提取股票在 [start, end] 区间内的合并数据，
+        结果与 firm/market/ff 三表按 'Date' 内连接得到的 DataFrame 一致。
+
+        若提供 cache（FactorWindowCache），市场与因子部分取自缓存的数据块，只需拼接公司收益。
+        """
+        rows, pos = self.window_rows(symbol, start, end)
+        firm_dates = self.dates[pos] if self.compact else self.firm_dates[rows]
+        factor_values = self.factor_values
+        if cache is not None:
+            block = cache.get(start, end)
+            factor_values, pos = block.values, pos - block.first
+        data = {}
+        for col in self.firm_columns:
+            if col == 'Stkcd':
+                data[col] = np.full(len(rows), str(symbol), dtype=object)
+            elif col == 'Date':
+                data[col] = firm_dates
+            else:
+                data[col] = self.firm_values[rows, self.value_columns.index(col)]
+        for j, col in enumerate(self.factor_columns):
+            data[col] = factor_values[pos, j]
+        return pd.DataFrame(data)
+
+    def estimation_sample(self, symbol, start, end, cache, column='Dretnd'):
+        """
+        以数组形式提取估计窗口样本（EstimationSample）：设计矩阵直接取自缓存中
+        预先构建的含常数项设计矩阵，只需按公司收益所在日期取行。
+        """
+        rows, pos = self.window_rows(symbol, start, end)
+        block = cache.get(start, end)
+        y = self.firm_values[rows, self.value_columns.index(column)].astype(np.float64, copy=False)
+        local = pos - block.first
+        return EstimationSample(y=y, design=block.design[local], columns=['const'] + self.factor_columns,
+                                dates=block.dates[local])
+
+
+class FactorWindowCache:
+    """
+    按 (窗口起点, 窗口终点) 缓存预先拼接的市场+因子数据块及含常数项的设计矩阵（LRU）。
+
+    事件集中的日期（如财报季、指数调整）上，大量事件共享同一窗口，只需拼接各自的公司收益。
+    """
+
+    def __init__(self, panel, maxsize=256):
+        self.panel = panel
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # 并行运行时各工作进程的缓存块数（按进程号），由主进程汇总报告
+        self.worker_sizes = {}
+        self._blocks = OrderedDict()
+
+    def get(self, start, end):
+        """返回 [start, end] 区间的 FactorBlock，必要时构建并放入缓存。"""
+        key = (_to_datetime64(start), _to_datetime64(end))
+        block = self._blocks.get(key)
+        if block is not None:
+            self.hits += 1
+            self._blocks.move_to_end(key)
+            return block
+
+        self.misses += 1
+        dates = self.panel.dates
+        first = int(np.searchsorted(dates, key[0], side='left'))
+        last = int(np.searchsorted(dates, key[1], side='right'))
+        values = self.panel.factor_values[first:last]
+        design = np.empty((len(values), values.shape[1] + 1))
+        design[:, 0] = 1.0
+        design[:, 1:] = values
+        block = FactorBlock(first=first, dates=dates[first:last], values=values, design=design)
+
+        if self.maxsize > 0:
+            self._blocks[key] = block
+            if len(self._blocks) > self.maxsize:
+                self._blocks.popitem(last=False)
+        return block
+
+    def stats(self):
+        """返回缓存大小与命中情况；并行运行时大小与容量为各进程之和。"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._blocks) + sum(self.worker_sizes.values()),
+            'maxsize': self.maxsize * max(len(self.worker_sizes), 1),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else np.nan,
+        }
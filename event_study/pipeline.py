@@ -0,0 +1,351 @@
+# event_study/pipeline.py
+
+import math
+import queue
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import compact_table, load_table, read_table_chunks
+from .engine import (EMPTY_FIRMS, build_daily_tables, collect_processed, finish_profile, merge_worker_stats,
+                     plot_average_ar, process_events, process_shard, report_window_cache, stream_event_study,
+                     validate_options, worker_pool)
+from .output_writers import WRITERS, write_daily_table, write_event_table
+from .panel_index import FactorWindowCache, PanelIndex
+from .profiling import NULL_PROFILER, Profiler
+from .statistical_tests import select_tests
+from .trading_calendar import TradingCalendar
+
+# 读取队列与写出队列的默认容量（块数）；队列满时上游阻塞，读取与计算不会无限领先于下游
+QUEUE_SIZE = 4
+
+# 队列结束标记
+_DONE = object()
+
+
+class BackgroundWriter:
+    """
+    后台写出线程：submit(fn, *args, **kwargs) 把写出任务放入有界队列，由单个线程按提交顺序执行。
+
+    队列满时 submit 阻塞，计算因此不会无限领先于写出；写出任务抛出的异常在之后的 submit 或 close
+    时于调用线程重新抛出，出错后剩余的任务不再执行。作为上下文管理器使用时，退出时等待全部任务完成。
+    """
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='event_study_writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is _DONE:
+                return
+            if self._error is not None:
+                continue
+            fn, args, kwargs = job
+            try:
+                fn(*args, **kwargs)
+            except BaseException as exc:
+                self._error = exc
+
+    def submit(self, fn, *args, **kwargs):
+        self._raise_error()
+        self._queue.put((fn, args, kwargs))
+
+    def close(self):
+        """等待已提交的写出任务全部完成；有任务出错时抛出其异常。"""
+        self._join()
+        self._raise_error()
+
+    def _join(self):
+        if self._thread.is_alive():
+            self._queue.put(_DONE)
+            self._thread.join()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._join()
+
+
+def _put(items, item, stop):
+    """向有界队列放入 item；stop 被设置（主线程已退出）时放弃，避免读取线程永久阻塞。"""
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _feed(iterator, pieces, stop):
+    """读取线程：把 iterator 产出的数据块依次放入队列 pieces，结束时放入 _DONE，出错时放入异常。"""
+    try:
+        for piece in iterator:
+            if not _put(pieces, piece, stop):
+                return
+        item = _DONE
+    except BaseException as exc:
+        item = exc
+    _put(pieces, item, stop)
+
+def _iter_pieces(pieces, profiler=NULL_PROFILER):
+    """在主线程中逐块取出读取线程放入的数据块，等待时间计入 'wait_for_data' 阶段。"""
+    while True:
+        with profiler.stage('wait_for_data'):
+            item = pieces.get()
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+
+class _EventFeeder:
+    """
+    边读取公司表边处理事件：事件按股票分组，某只股票的公司数据读完后，其事件进入待处理队列，
+    累计到 chunk_size 个事件时即开始计算（串行时在主线程，并行时提交到进程池），与后续数据块的读取重叠。
+    没有事件的股票的行不保留，已处理股票的公司数据在计算后随即释放。
+
+    firm_sorted=True 时假定公司表中同一股票的行连续（如按代码与日期排序导出的文件），
+    一只股票之后出现其他股票即视为其数据已读完；已读完的股票再次出现时抛出 ValueError。
+    否则只有整个文件读完后才开始计算（读取、计算与写出仍相互重叠）。
+    """
+
+    def __init__(self, events, base_panel, chunk_size, executor, n_jobs, options, firm_sorted=False,
+                 window_cache=None, profiler=NULL_PROFILER):
+        self.base_panel = base_panel
+        self.chunk_size = chunk_size
+        self.executor = executor
+        self.n_jobs = n_jobs
+        self.options = options
+        self.firm_sorted = firm_sorted
+        self.window_cache = window_cache
+        self.profiler = profiler
+
+        self.pending = defaultdict(list)
+        for event in events:
+            self.pending[str(event[1])].append(event)
+        self.event_symbols = np.array(list(self.pending), dtype=str)
+        self.rows = defaultdict(list)
+        self.closed = set()
+        self.current = None
+        self.template = EMPTY_FIRMS
+        self.ready_events, self.ready_rows = [], []
+        self.in_flight = deque()
+
+    def run(self, pieces):
+        """逐块产出 [(事件序号, EventRecord, merged_event)]；块按完成顺序产出，不一定按事件顺序。"""
+        for piece in pieces:
+            self._add(piece)
+            if len(self.ready_events) >= self.chunk_size:
+                yield from self._dispatch()
+            yield from self._drain(2 * self.n_jobs)
+        self._release(list(self.pending))
+        yield from self._dispatch()
+        yield from self._drain(0)
+
+    def _add(self, piece):
+        """并入一个公司表数据块，并释放数据已完整的股票的事件。"""
+        if len(piece) == 0:
+            return
+        self.template = piece.iloc[:0]
+        stkcd = piece['Stkcd'].to_numpy().astype(str)
+        runs = stkcd[np.flatnonzero(np.r_[True, stkcd[1:] != stkcd[:-1]])]
+
+        keep = np.isin(stkcd, self.event_symbols)
+        if keep.any():
+            for symbol, group in piece[keep].groupby('Stkcd', sort=False, observed=True):
+                self.rows[str(symbol)].append(group)
+
+        if not self.firm_sorted:
+            return
+        continuing = runs[0] == self.current
+        started = runs[1:] if continuing else runs
+        if len(set(started)) < len(started) or self.closed.intersection(started):
+            raise ValueError("firm_sorted=True but the firm file is not grouped by Stkcd.")
+        finished = list(runs[:-1]) if continuing else ([self.current] if self.current is not None else []) + list(runs[:-1])
+        self.closed.update(finished)
+        self.current = runs[-1]
+        self._release(finished)
+
+    def _release(self, symbols):
+        for symbol in symbols:
+            self.ready_events.extend(self.pending.pop(symbol, ()))
+            self.ready_rows.extend(self.rows.pop(symbol, ()))
+
+    def _dispatch(self):
+        """处理待处理队列中的全部事件：串行时逐块计算并产出，并行时按任务提交到进程池。"""
+        events = sorted(self.ready_events, key=lambda event: event[0])
+        rows = self.ready_rows
+        self.ready_events, self.ready_rows = [], []
+        if not events:
+            return
+        firm = pd.concat(rows, ignore_index=True) if rows else self.template
+
+        if self.executor is None:
+            with self.profiler.stage('build_index'):
+                panel = self.base_panel.with_firms(firm)
+            for begin in range(0, len(events), self.chunk_size):
+                yield process_events(events[begin:begin + self.chunk_size], panel, None, None, None,
+                                     window_cache=self.window_cache, profiler=self.profiler, **self.options)
+            return
+
+        task_size = max(1, min(self.chunk_size, math.ceil(len(events) / self.n_jobs)))
+        profile_hooks = self.profiler.hooks if self.profiler.enabled else None
+        for begin in range(0, len(events), task_size):
+            task = events[begin:begin + task_size]
+            task_firm = firm
+            if task_size < len(events):
+                task_firm = firm[firm['Stkcd'].isin({str(symbol) for _, symbol, _ in task})]
+            self.in_flight.append(self.executor.submit(process_shard, task, self.options, profile_hooks, task_firm))
+            yield from self._drain(2 * self.n_jobs)
+
+    def _drain(self, limit):
+        """产出已完成的任务结果；进行中的任务多于 limit 个时等待最早提交的任务。"""
+        while self.in_flight and (len(self.in_flight) > limit or self.in_flight[0].done()):
+            future = self.in_flight.popleft()
+            with self.profiler.stage('wait_for_workers'):
+                processed, cache_stats, report = future.result()
+            merge_worker_stats(cache_stats, report, self.window_cache, self.profiler)
+            yield processed
+
+
+def run_event_study_pipelined(models_to_use=None, event_window_days=(-1, 1), estimation_window_days=250,
+                              generate_plots=True, event_file='Event.xlsx', firm_file='Firm.xlsx',
+                              market_file='Market.xlsx', ff_factors_file='FF factor.xlsx',
+                              regression_engine='batch', batch_size=1024, n_jobs=1, seed=None,
+                              cache_dir=None, use_cache=True, test_options=None, window_unit='calendar',
+                              stream_dir=None, chunk_size=5000, window_cache_size=256, output_format='excel',
+                              excel_summary=False, profile=False, profile_hooks=(), firm_sorted=False,
+                              read_chunk_rows=500000, queue_size=QUEUE_SIZE, tests=None, compact_dtypes=False,
+                              result_store=None):
+    """
+    以流水线方式运行事件研究，读取、计算与写出三个阶段相互重叠，适合 I/O 延迟较高的存储（如 NFS）。
+
+    - 读取：四个输入文件由线程并发读取；公司表分块读取（CSV 按 read_chunk_rows 行，Parquet 按批次），
+      数据块经容量为 queue_size 的队列交给主线程；
+    - 计算：事件按股票分组，firm_sorted=True 时某只股票的公司数据读完即可开始计算其事件，
+      否则等公司表读完后开始；n_jobs > 1 时任务提交到进程池，公司数据随任务传递；
+    - 写出：结果由后台写出线程经容量为 queue_size 的队列写出。逐事件结果在每日检验表计算的同时写出；
+      流式模式（stream_dir）下每块结果完成后即追加写入 CSV。
+
+    其余参数与 run_event_study 相同，输出文件也相同（流式模式下 CSV 中的事件按完成顺序排列）。
+    compact_dtypes=True 时各表与公司表的每个数据块在读取线程中转为紧凑类型；
+    不支持 result_store，传入时抛出 ValueError。profile 开启时另外报告等待数据（wait_for_data）与等待工作进程的时间。
+    """
+    if models_to_use is None:
+        models_to_use = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+    validate_options(models_to_use, regression_engine, window_unit)
+    tests = select_tests(tests)
+    if output_format != 'excel' and output_format not in WRITERS:
+        raise ValueError(f"Unknown output_format: {output_format}")
+    if result_store is not None:
+        raise ValueError("result_store is not supported by run_event_study_pipelined; use run_event_study.")
+
+    profiler = Profiler(profile_hooks) if profile else NULL_PROFILER
+
+    with ExitStack() as stack:
+        readers = stack.enter_context(ThreadPoolExecutor(max_workers=4, thread_name_prefix='event_study_reader'))
+        stop = threading.Event()
+        stack.callback(stop.set)
+
+        pieces = queue.Queue(maxsize=queue_size)
+        firm_chunks = read_table_chunks(firm_file, read_chunk_rows, cache_dir=cache_dir, use_cache=use_cache)
+        if compact_dtypes:
+            firm_chunks = map(compact_table, firm_chunks)
+        readers.submit(_feed, firm_chunks, pieces, stop)
+        tables = [readers.submit(load_table, path, cache_dir=cache_dir, use_cache=use_cache, compact=compact_dtypes)
+                  for path in (event_file, market_file, ff_factors_file)]
+        with profiler.stage('wait_for_data'):
+            event_data, market_data, ff_factors = [future.result() for future in tables]
+
+        with profiler.stage('build_index'):
+            base_panel = PanelIndex(EMPTY_FIRMS, market_data, ff_factors, compact=compact_dtypes)
+            calendar = TradingCalendar.from_market(market_data) if window_unit == 'trading' else None
+        window_cache = FactorWindowCache(base_panel, window_cache_size) if window_cache_size > 0 else None
+        events = [(index, symbol, event_date) for index, (symbol, event_date)
+                  in enumerate(event_data[['Symbol', 'Date']].itertuples(index=False, name=None))]
+        options = dict(
+            event_window_days=event_window_days,
+            estimation_window_days=estimation_window_days,
+            models_to_use=models_to_use,
+            regression_engine=regression_engine,
+            batch_size=batch_size,
+            seed=seed,
+            test_options=test_options,
+            calendar=calendar,
+            tests=tests,
+            compact_dtypes=compact_dtypes
+        )
+
+        executor = stack.enter_context(worker_pool(base_panel, n_jobs, window_cache_size)) if n_jobs > 1 else None
+        writer = stack.enter_context(BackgroundWriter(queue_size))
+        feeder = _EventFeeder(events, base_panel, chunk_size, executor, n_jobs, options, firm_sorted=firm_sorted,
+                              window_cache=window_cache, profiler=profiler)
+        chunks = feeder.run(_iter_pieces(pieces, profiler))
+
+        if stream_dir is not None:
+            with profiler.stage('process_events'):
+                average_AR_per_day = stream_event_study(chunks, models_to_use, event_window_days, stream_dir,
+                                                        submit=writer.submit, tests=tests)
+            report_window_cache(window_cache, profiler)
+            if generate_plots and average_AR_per_day is not None:
+                with profiler.stage('plots'):
+                    plot_average_ar(average_AR_per_day, models_to_use, event_window_days)
+            with profiler.stage('write_output'):
+                writer.close()
+            print("The event study analysis has been successfully completed and all output files have been generated.")
+            return finish_profile(profiler)
+
+        results, processed, correlations = collect_processed(chunks, len(events), models_to_use,
+                                                             event_window_days, profiler, tests)
+        report_window_cache(window_cache, profiler)
+        if not processed:
+            print("No valid event result was found.")
+            return finish_profile(profiler)
+
+        # 逐事件结果只依赖 results，先交给写出线程，与每日检验表的计算重叠
+        if output_format == 'excel':
+            from .excel_output import write_excel_daily, write_excel_individual, write_excel_last_day
+            summary_df = results.to_frame()
+            writer.submit(write_excel_individual, summary_df, models_to_use)
+            writer.submit(write_excel_last_day, summary_df, models_to_use)
+        else:
+            writer.submit(write_event_table, results, models_to_use, output_format)
+
+        daily_tables, average_AR_per_day = build_daily_tables(results, processed, correlations, models_to_use,
+                                                              event_window_days, calendar, seed, test_options, profiler,
+                                                              tests)
+        for kind in ('AR', 'CAR'):
+            if output_format == 'excel':
+                writer.submit(write_excel_daily, daily_tables, models_to_use, kind)
+            else:
+                writer.submit(write_daily_table, daily_tables, kind, output_format)
+        if output_format != 'excel' and excel_summary:
+            from .excel_output import write_excel_summary
+            writer.submit(write_excel_summary, daily_tables)
+
+        # 绘图与写出线程并行
+        if generate_plots:
+            with profiler.stage('plots'):
+                plot_average_ar(average_AR_per_day, models_to_use, event_window_days)
+        with profiler.stage('write_output'):
+            writer.close()
+
+    print("The event study analysis has been successfully completed and all output files have been generated.")
+    return finish_profile(profiler)
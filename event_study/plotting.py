@@ -0,0 +1,30 @@
+# event_study/plotting.py
+
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+def plot_average_ar(average_AR_per_day, models_to_use, event_window_days):
+    """为每个模型绘制每日平均 AR 折线图并保存为 PNG。"""
+    plot_models = []
+    color_map = {'MarketModel': 'blue', 'MarketAdjusted': 'green', '3F': 'purple', '4F': 'orange', '5F': 'red'}
+    for model in models_to_use:
+        plot_models.append({
+            "model": model,
+            "color": color_map.get(model, 'black'),
+            "title": f"Average AR by Event Day ({model})"
+        })
+
+    for plot_model in plot_models:
+        model = plot_model['model']
+        ar_col = f'AbnormalReturn_{model}'
+        plt.figure(figsize=(10, 6))
+        sns.lineplot(data=average_AR_per_day, x='EventDay', y=ar_col, color=plot_model['color'], marker='o')
+        plt.title(plot_model['title'], fontsize=14, fontweight='bold')
+        plt.xlabel("Event Day (Relative to Event Date)", fontsize=12)
+        plt.ylabel("Average Abnormal Return (AR)", fontsize=12)
+        plt.axvline(x=0, linestyle='--', color='gray')
+        plt.xticks(ticks=range(event_window_days[0], event_window_days[1] + 1))
+        plt.grid(True, which='both', linestyle='--', linewidth=0.5)
+        plt.tight_layout()
+        plt.savefig(f"AR_{model}.png")
+        plt.close()
@@ -0,0 +1,202 @@
+# event_study/profiling.py
+
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 可选的阶段钩子
+PROFILE_HOOKS = ('cprofile', 'tracemalloc')
+
+
+class Profiler:
+    """
+    事件研究流程的阶段计时与计数器。
+
+    - stage(name)：上下文管理器，累计该阶段的墙钟时间、CPU 时间与调用次数；
+      阶段可以嵌套，嵌套阶段的时间同时计入外层阶段；
+    - count(name, n)：累加计数器（如扫描行数、回归次数、检验次数）；
+    - skip(reason)：记录跳过的事件及原因；
+    - hooks 可包含 'cprofile'（在最外层阶段内运行 cProfile，报告各阶段耗时最多的函数）
+      与 'tracemalloc'（报告各阶段的内存峰值）。
+
+    report() 返回可序列化的字典；merge(report) 用于并入工作进程的报告。
+    tracemalloc 在第一个阶段开始时启动；若由本 Profiler 启动，report() 时即停止，
+    之后的代码不再承担内存跟踪的开销（调用方事先启动的跟踪保持不变）。
+    """
+
+    enabled = True
+
+    def __init__(self, hooks=(), top=20):
+        unknown = set(hooks) - set(PROFILE_HOOKS)
+        if unknown:
+            raise ValueError(f"Unknown profile hooks: {sorted(unknown)}")
+        self.hooks = tuple(hooks)
+        self.top = top
+        self.stages = defaultdict(lambda: {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+        self.counters = defaultdict(int)
+        self.skipped = defaultdict(int)
+        self._profiles = {}
+        self._merged_profiles = {}
+        self._profiling = False
+        self._peaks = {}
+        self._peak_stack = []
+        self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        profile = None
+        if 'cprofile' in self.hooks and not self._profiling:
+            profile = self._profiles.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profile.enable()
+        if 'tracemalloc' in self.hooks:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._enter_peak()
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record = self.stages[name]
+            record['calls'] += 1
+            record['wall'] += time.perf_counter() - wall
+            record['cpu'] += time.process_time() - cpu
+            if 'tracemalloc' in self.hooks:
+                self._peaks[name] = max(self._peaks.get(name, 0), self._exit_peak())
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+
+    def _enter_peak(self):
+        """进入阶段前把当前峰值计入所有外层阶段，再重置峰值。"""
+        peak = tracemalloc.get_traced_memory()[1]
+        self._peak_stack = [max(value, peak) for value in self._peak_stack]
+        self._peak_stack.append(0)
+        tracemalloc.reset_peak()
+
+    def _exit_peak(self):
+        """返回本阶段的内存峰值，并把它计入外层阶段。"""
+        peak = max(self._peak_stack.pop(), tracemalloc.get_traced_memory()[1])
+        if self._peak_stack:
+            self._peak_stack[-1] = max(self._peak_stack[-1], peak)
+        return peak
+
+    def count(self, name, n=1):
+        self.counters[name] += int(n)
+
+    def skip(self, reason):
+        self.skipped[reason] += 1
+
+    def merge(self, report):
+        """并入另一个 Profiler 的报告（如工作进程返回的报告）。"""
+        if not report:
+            return
+        for name, record in report['stages'].items():
+            for key in ('calls', 'wall', 'cpu'):
+                self.stages[name][key] += record[key]
+            if 'peak_memory' in record:
+                self._peaks[name] = max(self._peaks.get(name, 0), record['peak_memory'])
+        for name, value in report['counters'].items():
+            self.counters[name] += value
+        for reason, value in report['skipped'].items():
+            self.skipped[reason] += value
+        for name, rows in report.get('cprofile', {}).items():
+            self._add_rows(self._merged_profiles.setdefault(name, {}), rows)
+
+    @staticmethod
+    def _add_rows(merged, rows):
+        """按函数累加 cProfile 统计行。"""
+        for row in rows:
+            total = merged.setdefault(row['function'], dict(row, calls=0, total_time=0.0, cumulative_time=0.0))
+            for key in ('calls', 'total_time', 'cumulative_time'):
+                total[key] += row[key]
+
+    def _profile_rows(self, profile):
+        """返回 cProfile 结果中累计耗时最多的 top 个函数。"""
+        profile_stats = pstats.Stats(profile, stream=io.StringIO())
+        rows = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in profile_stats.stats.items():
+            rows.append({'function': f'{filename}:{line}({function})', 'calls': calls,
+                         'total_time': total, 'cumulative_time': cumulative})
+        rows.sort(key=lambda row: row['cumulative_time'], reverse=True)
+        return rows[:self.top]
+
+    def report(self):
+        """
+        返回结构化报告：
+        {'stages': {阶段: {'calls', 'wall', 'cpu'[, 'peak_memory']}}, 'counters': {...},
+         'skipped': {原因: 事件数}[, 'cprofile': {阶段: [函数统计]}]}。
+        由本 Profiler 启动的 tracemalloc 在此停止。
+        """
+        self.stop_tracing()
+        stages = {}
+        for name, record in self.stages.items():
+            stages[name] = dict(record)
+            if name in self._peaks:
+                stages[name]['peak_memory'] = self._peaks[name]
+        report = {
+            'stages': stages,
+            'counters': dict(self.counters),
+            'skipped': dict(self.skipped),
+        }
+        if 'cprofile' in self.hooks:
+            profiles = {}
+            for name in set(self._profiles) | set(self._merged_profiles):
+                merged = {key: dict(row) for key, row in self._merged_profiles.get(name, {}).items()}
+                if name in self._profiles:
+                    self._add_rows(merged, self._profile_rows(self._profiles[name]))
+                rows = sorted(merged.values(), key=lambda row: row['cumulative_time'], reverse=True)
+                profiles[name] = rows[:self.top]
+            report['cprofile'] = profiles
+        return report
+
+    def stop_tracing(self):
+        """停止由本 Profiler 启动的 tracemalloc；之后再进入阶段时重新启动。"""
+        if self._started_tracing and not self._peak_stack:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+class NullProfiler:
+    """不记录任何信息的 Profiler，未开启 profile 时使用，调用处无需判断。"""
+
+    enabled = False
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def count(self, name, n=1):
+        pass
+
+    def skip(self, reason):
+        pass
+
+    def merge(self, report):
+        pass
+
+    def report(self):
+        return None
+
+
+NULL_PROFILER = NullProfiler()
+
+def format_report(report):
+    """把 Profiler.report() 的结果格式化为便于阅读的文本。"""
+    lines = [f"{'stage':<24}{'calls':>10}{'wall (s)':>12}{'cpu (s)':>12}"]
+    for name, record in sorted(report['stages'].items(), key=lambda item: -item[1]['wall']):
+        line = f"{name:<24}{record['calls']:>10}{record['wall']:>12.3f}{record['cpu']:>12.3f}"
+        if 'peak_memory' in record:
+            line += f"  peak {record['peak_memory'] / 2 ** 20:.1f} MiB"
+        lines.append(line)
+    for name, value in sorted(report['counters'].items()):
+        lines.append(f"{name}: {value}")
+    for reason, value in sorted(report['skipped'].items()):
+        lines.append(f"skipped ({reason}): {value}")
+    return '\n'.join(lines)
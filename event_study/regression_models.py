@@ -1,68 +1,324 @@
 # event_study/regression_models.py
 
-import statsmodels.api as sm
+from collections import namedtuple
 
-def perform_regressions(merged_estimation_data, models_to_use):
+import numpy as np
+import pandas as pd
+
+# 因子模型的声明：regressors 为解释变量列（市场或因子表中的列），intercept 为是否含常数项；
+# coefficients 不为 None 时为固定系数（与 model_columns 的列对应），不做估计
+ModelSpec = namedtuple('ModelSpec', ['regressors', 'intercept', 'coefficients'])
+
+# 模型注册表：模型名 -> ModelSpec；3F、4F、5F 的设计矩阵依次嵌套
+MODELS = {}
+
+def register_model(name, regressors, intercept=True, coefficients=None):
     """
-    针对不同模型执行回归分析，并返回拟合的模型。
+    注册因子模型，注册后即可在 models_to_use 中使用，如
+    register_model('Carhart', ['RiskPremium1', 'SMB1', 'HML1', 'UMD1'])（UMD1 须为因子表中的列）。
+
+    coefficients 给定时为固定系数模型（如市场调整模型），长度须与 model_columns(name) 一致。
     """
-    models = {}
+    regressors = list(regressors)
+    if coefficients is not None:
+        coefficients = [float(value) for value in coefficients]
+        if len(coefficients) != len(regressors) + bool(intercept):
+            raise ValueError(f"Model {name} needs {len(regressors) + bool(intercept)} coefficients, "
+                             f"got {len(coefficients)}.")
+    MODELS[name] = ModelSpec(regressors, bool(intercept), coefficients)
+
+register_model('MarketModel', ['Retindex'])
+register_model('MarketAdjusted', ['Retindex'], intercept=False, coefficients=[1.0])
+register_model('3F', ['RiskPremium1', 'SMB1', 'HML1'])
+register_model('4F', ['RiskPremium1', 'SMB1', 'HML1', 'RMW1'])
+register_model('5F', ['RiskPremium1', 'SMB1', 'HML1', 'RMW1', 'CMA1'])
+
+def check_models(models_to_use):
+    """models_to_use 中有未注册的模型时抛出 ValueError。"""
+    unknown = [model for model in models_to_use if model not in MODELS]
+    if unknown:
+        raise ValueError(f"Unknown models: {unknown}; register them with register_model first.")
 
-    if 'MarketModel' in models_to_use:
-        X_market = sm.add_constant(merged_estimation_data['Retindex'])
-        models['MarketModel'] = sm.OLS(merged_estimation_data['Dretnd'], X_market).fit()
+def model_columns(model):
+    """模型的设计矩阵列名：含常数项时为 'const' + 解释变量，与 statsmodels 的 params 索引一致。"""
+    spec = MODELS[model]
+    return (['const'] if spec.intercept else []) + spec.regressors
 
-    if '3F' in models_to_use or '4F' in models_to_use or '5F' in models_to_use:
-        X_3F = sm.add_constant(merged_estimation_data[['RiskPremium1', 'SMB1', 'HML1']])
-        models['3F'] = sm.OLS(merged_estimation_data['Dretnd'], X_3F).fit()
+def estimated_models(models_to_use):
+    """需要在估计窗口回归的模型（非固定系数），按注册顺序排列。"""
+    return [model for model, spec in MODELS.items() if model in models_to_use and spec.coefficients is None]
 
-    if '4F' in models_to_use or '5F' in models_to_use:
-        X_4F = sm.add_constant(merged_estimation_data[['RiskPremium1', 'SMB1', 'HML1', 'RMW1']])
-        models['4F'] = sm.OLS(merged_estimation_data['Dretnd'], X_4F).fit()
+def union_columns(models_to_use):
+    """各模型设计矩阵列的并集，'const' 总在第一列。"""
+    columns = ['const']
+    for model in models_to_use:
+        for col in MODELS[model].regressors:
+            if col not in columns:
+                columns.append(col)
+    return columns
 
-    if '5F' in models_to_use:
-        X_5F = sm.add_constant(merged_estimation_data[['RiskPremium1', 'SMB1', 'HML1', 'RMW1', 'CMA1']])
-        models['5F'] = sm.OLS(merged_estimation_data['Dretnd'], X_5F).fit()
+def design_matrix(frame, columns):
+    """由 DataFrame 构建设计矩阵（'const' 列为 1），列顺序与 columns 一致。"""
+    design = np.empty((len(frame), len(columns)))
+    for j, col in enumerate(columns):
+        design[:, j] = 1.0 if col == 'const' else frame[col].to_numpy(dtype=float)
+    return design
+
+def coefficient_matrix(models, models_to_use, columns):
+    """
+    把各模型的系数排成 (模型数, 列数) 的系数矩阵（列为 columns），模型未用到的列为 0；
+    同时返回同形状的布尔矩阵，标记各模型用到的列。
+    models 为拟合结果（statsmodels 或 OLSEstimate），固定系数模型取注册的系数。
+    """
+    coefficients = np.zeros((len(models_to_use), len(columns)))
+    used = np.zeros(coefficients.shape, dtype=bool)
+    for m, model in enumerate(models_to_use):
+        cols = [columns.index(col) for col in model_columns(model)]
+        fixed = MODELS[model].coefficients
+        if fixed is not None:
+            coefficients[m, cols] = fixed
+        else:
+            # params 为按列名索引的 Series（statsmodels 或 OLSEstimate）
+            coefficients[m, cols] = np.asarray(models[model].params[model_columns(model)], dtype=float)
+        used[m, cols] = True
+    return coefficients, used
+
+def predict(coefficients, design, used=None):
+    """
+    一次 einsum 计算所有模型的预测收益：coefficients 为 (..., 模型数, 列数)，design 为 (..., 观测数, 列数)，
+    返回 (..., 观测数, 模型数)；前导维度（如事件）按广播对齐。
+
+    提供 used（模型用到的列）时，设计矩阵中的 NaN 只使用到该列的模型的预测为 NaN，
+    与逐模型计算一致。
+    """
+    if used is None:
+        return np.einsum('...mk,...tk->...tm', coefficients, design)
+    missing = np.isnan(design)
+    predicted = np.einsum('...mk,...tk->...tm', coefficients, np.where(missing, 0.0, design))
+    if missing.any():
+        predicted[np.einsum('...mk,...tk->...tm', used.astype(float), missing.astype(float)) > 0] = np.nan
+    return predicted
+
+# 单个事件、单个模型的估计结果；params 的索引与 statsmodels 一致（'const' + 解释变量）
+OLSEstimate = namedtuple('OLSEstimate', ['params', 'sigma2', 'xtx_inv', 'nobs'])
+
+# 以数组表示的估计窗口样本：y 为公司收益，design 为含常数项的完整设计矩阵，columns 为其列名，dates 为对应日期
+EstimationSample = namedtuple('EstimationSample', ['y', 'design', 'columns', 'dates'])
+
+# 单个事件、单个模型的估计窗口方差信息：残差方差、(X'X)^-1（无估计参数的模型为 None）、
+# 残差自由度，以及估计窗口的残差与日期
+EstimationVariance = namedtuple('EstimationVariance', ['sigma2', 'xtx_inv', 'dof', 'resid', 'dates'])
+
+def perform_regressions(merged_estimation_data, models_to_use):
+    """
+    针对不同模型执行回归分析，并返回拟合的模型（固定系数模型不做回归）。
+
+    statsmodels 只在这里导入：批量引擎（batch_regressions）的计算路径不会加载它。
+    """
+    import statsmodels.api as sm
+
+    models = {}
+    for model in estimated_models(models_to_use):
+        spec = MODELS[model]
+        # 紧凑类型模式下输入为 float32，回归仍在 float64 下计算
+        X = merged_estimation_data[spec.regressors].astype(np.float64)
+        if spec.intercept:
+            X = sm.add_constant(X)
+        models[model] = sm.OLS(merged_estimation_data['Dretnd'].astype(np.float64), X).fit()
 
     return models
 
-def calculate_abnormal_returns(models, merged_event_data, models_to_use):
+def calculate_abnormal_returns(models, merged_event_data, models_to_use, design=None):
     """
     计算不同模型下的异常收益（AR）。
+
+    所有模型的预测收益由系数矩阵与事件窗口设计矩阵的一次 einsum 得到，
+    AR 列一次性拼接到 merged_event_data 之后（返回新的 DataFrame）。
+    design 为可选的、已按 union_columns(models_to_use) 构建的设计矩阵。
     """
-    if 'MarketModel' in models_to_use:
-        merged_event_data['AbnormalReturn_MarketModel'] = merged_event_data['Dretnd'] - (
-            models['MarketModel'].params['const'] + models['MarketModel'].params['Retindex'] * merged_event_data['Retindex']
-        )
+    columns = union_columns(models_to_use)
+    if design is None:
+        design = design_matrix(merged_event_data, columns)
+    coefficients, used = coefficient_matrix(models, models_to_use, columns)
+    returns = merged_event_data['Dretnd'].to_numpy(dtype=float)
+    abnormal = returns[:, None] - predict(coefficients, design, used)
+    abnormal = pd.DataFrame(abnormal, index=merged_event_data.index,
+                            columns=[f'AbnormalReturn_{model}' for model in models_to_use])
+    return pd.concat([merged_event_data, abnormal], axis=1)
 
-    if 'MarketAdjusted' in models_to_use:
-        merged_event_data['AbnormalReturn_MarketAdjusted'] = merged_event_data['Dretnd'] - merged_event_data['Retindex']
 
-    if '3F' in models_to_use:
-        merged_event_data['AbnormalReturn_3F'] = merged_event_data['Dretnd'] - (
-            models['3F'].params['const'] +
-            models['3F'].params['RiskPremium1'] * merged_event_data['RiskPremium1'] +
-            models['3F'].params['SMB1'] * merged_event_data['SMB1'] +
-            models['3F'].params['HML1'] * merged_event_data['HML1']
-        )
+def _nested_chains(models):
+    """将模型按设计矩阵列的前缀嵌套关系分组，每组只需一次 Cholesky 分解。"""
+    chains = []
+    for model in sorted(models, key=lambda m: -len(model_columns(m))):
+        columns = model_columns(model)
+        for chain in chains:
+            if chain['columns'][:len(columns)] == columns:
+                chain['models'].append(model)
+                break
+        else:
+            chains.append({'columns': columns, 'models': [model]})
+    return chains
 
-    if '4F' in models_to_use:
-        merged_event_data['AbnormalReturn_4F'] = merged_event_data['Dretnd'] - (
-            models['4F'].params['const'] +
-            models['4F'].params['RiskPremium1'] * merged_event_data['RiskPremium1'] +
-            models['4F'].params['SMB1'] * merged_event_data['SMB1'] +
-            models['4F'].params['HML1'] * merged_event_data['HML1'] +
-            models['4F'].params['RMW1'] * merged_event_data['RMW1']
-        )
+def _solve_nested(gram, xty, yty, nobs, sizes):
+    """
+    对一批 Gram 矩阵做一次 Cholesky 分解，并利用其左上角子块求解所有嵌套模型。
 
-    if '5F' in models_to_use:
-        merged_event_data['AbnormalReturn_5F'] = merged_event_data['Dretnd'] - (
-            models['5F'].params['const'] +
-            models['5F'].params['RiskPremium1'] * merged_event_data['RiskPremium1'] +
-            models['5F'].params['SMB1'] * merged_event_data['SMB1'] +
-            models['5F'].params['HML1'] * merged_event_data['HML1'] +
-            models['5F'].params['RMW1'] * merged_event_data['RMW1'] +
-            models['5F'].params['CMA1'] * merged_event_data['CMA1']
-        )
+    gram 形状为 (E, k, k)，sizes 为各嵌套模型的参数个数（含常数项）。
+    返回 {size: (params, sigma2, xtx_inv)}。
+    """
+    chol = np.linalg.cholesky(gram)
+    solved = {}
+    for k in sizes:
+        chol_inv = np.linalg.inv(chol[:, :k, :k])
+        xtx_inv = np.einsum('eji,ejk->eik', chol_inv, chol_inv)
+        params = np.einsum('eij,ej->ei', xtx_inv, xty[:, :k])
+        rss = yty - np.einsum('ei,ei->e', params, xty[:, :k])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sigma2 = rss / (nobs - k)
+        solved[k] = (params, sigma2, xtx_inv)
+    return solved
+
+def _solve_pinv(gram, xty, yty, nobs, sizes):
+    """Cholesky 分解失败（设计矩阵奇异）时，逐个事件用伪逆求解。"""
+    solved = {k: (np.full((len(gram), k), np.nan), np.full(len(gram), np.nan), np.full((len(gram), k, k), np.nan))
+              for k in sizes}
+    for e in range(len(gram)):
+        for k in sizes:
+            xtx_inv = np.linalg.pinv(gram[e, :k, :k])
+            params = xtx_inv @ xty[e, :k]
+            solved[k][0][e] = params
+            solved[k][1][e] = (yty[e] - params @ xty[e, :k]) / (nobs[e] - k) if nobs[e] > k else np.nan
+            solved[k][2][e] = xtx_inv
+    return solved
+
+def _window_arrays(window, columns):
+    """返回估计窗口的 (设计矩阵, y)，窗口可为合并后的 DataFrame 或 EstimationSample。"""
+    if isinstance(window, EstimationSample):
+        cols = [window.columns.index(col) for col in columns]
+        return window.design[:, cols], window.y
+    return design_matrix(window, columns), window['Dretnd'].to_numpy(dtype=float)
+
+def as_estimates(models):
+    """把拟合结果（statsmodels 或 OLSEstimate）统一转换为 {模型: OLSEstimate}，便于持久化与复用。"""
+    estimates = {}
+    for model, fitted in models.items():
+        if not isinstance(fitted, OLSEstimate):
+            fitted = OLSEstimate(params=fitted.params, sigma2=fitted.scale,
+                                 xtx_inv=np.asarray(fitted.normalized_cov_params), nobs=int(fitted.nobs))
+        estimates[model] = fitted
+    return estimates
+
+def estimation_variance(models, estimation_data, models_to_use):
+    """
+    由拟合结果（statsmodels 或 OLSEstimate）与估计窗口数据计算各模型的 EstimationVariance，
+    供标准化残差检验使用，不再做额外的回归。
+
+    固定系数模型（如 MarketAdjusted）没有估计参数，其方差为估计窗口内残差
+    （如 Dretnd - Retindex）的样本方差，预测误差修正项为零。
+    """
+    variances = {}
+    if isinstance(estimation_data, EstimationSample):
+        dates = np.asarray(estimation_data.dates)
+    else:
+        dates = estimation_data['Date'].to_numpy()
+
+    # 一次取出所有模型用到的列，各模型只按列号取子矩阵
+    columns = union_columns(models_to_use)
+    design, y = _window_arrays(estimation_data, columns)
+
+    for model in models_to_use:
+        cols = [columns.index(col) for col in model_columns(model)]
+        fixed = MODELS[model].coefficients
+        if fixed is not None:
+            resid = y - design[:, cols] @ np.asarray(fixed)
+            dof = len(resid) - 1
+            sigma2 = np.var(resid, ddof=1) if dof > 0 else np.nan
+            variances[model] = EstimationVariance(sigma2, None, dof, resid, dates)
+            continue
+        if model not in models:
+            continue
+
+        # statsmodels 结果取未包装的数组，避免每次访问都构造 pandas 对象
+        fitted = getattr(models[model], '_results', models[model])
+        resid = y - design[:, cols] @ np.asarray(fitted.params, dtype=float)
+        if isinstance(fitted, OLSEstimate):
+            sigma2, xtx_inv, dof = fitted.sigma2, fitted.xtx_inv, fitted.nobs - len(cols)
+        else:
+            sigma2, xtx_inv, dof = fitted.scale, np.asarray(fitted.normalized_cov_params), fitted.df_resid
+        variances[model] = EstimationVariance(sigma2, xtx_inv, dof, resid, dates)
+
+    return variances
 
-    return merged_event_data
+def batch_regressions(estimation_windows, models_to_use, batch_size=1024):
+    """
+    批量估计多个事件的回归模型，替代逐事件的 statsmodels 拟合。
+
+    每批事件的估计窗口被堆叠为 (事件, 观测, 变量) 的三维设计张量（不足部分以零填充），
+    一次性计算所有事件的 X'X、X'y；嵌套的模型（如 3F/4F/5F）共用一次 Cholesky 分解。
+
+    参数：
+    - estimation_windows：各事件估计窗口的合并数据（DataFrame 或 EstimationSample 列表）。
+    - models_to_use：要使用的模型列表（无需估计的模型会被忽略）。
+    - batch_size：每批堆叠的事件数，用于控制内存。
+
+    返回：{模型: {'columns', 'params', 'sigma2', 'xtx_inv', 'nobs'}}，
+    其中 params 形状为 (事件数, k)，xtx_inv 形状为 (事件数, k, k)。
+    """
+    models = estimated_models(models_to_use)
+    chains = _nested_chains(models)
+    n_events = len(estimation_windows)
+    nobs = np.array([len(window.y) if isinstance(window, EstimationSample) else len(window)
+                     for window in estimation_windows], dtype=np.int64)
+
+    results = {}
+    for model in models:
+        k = len(model_columns(model))
+        results[model] = {
+            'columns': model_columns(model),
+            'params': np.full((n_events, k), np.nan),
+            'sigma2': np.full(n_events, np.nan),
+            'xtx_inv': np.full((n_events, k, k), np.nan),
+            'nobs': nobs,
+        }
+
+    for chain in chains:
+        columns = chain['columns']
+        sizes = sorted(len(model_columns(model)) for model in chain['models'])
+        for begin in range(0, n_events, batch_size):
+            windows = estimation_windows[begin:begin + batch_size]
+            batch_nobs = nobs[begin:begin + batch_size]
+            n_max = int(batch_nobs.max()) if len(windows) else 0
+            design = np.zeros((len(windows), n_max, len(columns)))
+            y = np.zeros((len(windows), n_max))
+            for e, window in enumerate(windows):
+                n = batch_nobs[e]
+                design[e, :n], y[e, :n] = _window_arrays(window, columns)
+
+            gram = np.einsum('eni,enj->eij', design, design)
+            xty = np.einsum('eni,en->ei', design, y)
+            yty = np.einsum('en,en->e', y, y)
+            try:
+                solved = _solve_nested(gram, xty, yty, batch_nobs, sizes)
+            except np.linalg.LinAlgError:
+                solved = _solve_pinv(gram, xty, yty, batch_nobs, sizes)
+
+            for model in chain['models']:
+                params, sigma2, xtx_inv = solved[len(model_columns(model))]
+                results[model]['params'][begin:begin + batch_size] = params
+                results[model]['sigma2'][begin:begin + batch_size] = sigma2
+                results[model]['xtx_inv'][begin:begin + batch_size] = xtx_inv
+
+    return results
+
+def unpack_batch(batch_results, index):
+    """从批量估计结果中取出第 index 个事件的 {模型: OLSEstimate}，可直接用于 calculate_abnormal_returns。"""
+    models = {}
+    for model, res in batch_results.items():
+        models[model] = OLSEstimate(
+            params=pd.Series(res['params'][index], index=res['columns']),
+            sigma2=res['sigma2'][index],
+            xtx_inv=res['xtx_inv'][index],
+            nobs=int(res['nobs'][index]),
+        )
+    return models
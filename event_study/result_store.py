@@ -0,0 +1,103 @@
+# event_study/result_store.py
+
+import hashlib
+import json
+import pickle
+import sqlite3
+
+import pandas as pd
+
+from .data_loader import file_signature
+
+
+def data_version(*paths):
+    """
+    由数据文件内容计算数据版本哈希：取 file_signature(validate='hash') 中的大小与 SHA-256，
+    不含修改时间，因此只改变修改时间（如 touch、重新复制同一文件）不会使已存储的结果失效。
+
+    通常只传入公司、市场和因子文件：事件文件新增事件不应使已有事件的结果失效。
+    """
+    signatures = []
+    for path in paths:
+        signature = file_signature(path, 'hash')
+        signatures.append({'size': signature['size'], 'sha256': signature['sha256']})
+    return hashlib.sha256(json.dumps(signatures, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def event_key(symbol, event_date, params):
+    """由 (股票代码, 事件日期, 参数与数据版本) 计算事件结果的存储键。"""
+    payload = json.dumps([str(symbol), pd.Timestamp(event_date).isoformat(), params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultStore:
+    """
+    基于 SQLite 的持久化事件结果存储。
+
+    每个事件的 (result, merged_event)（含各模型的 AR/CAR 序列）以 pickle 形式按键保存；
+    未通过筛选的事件也会记录（payload 为 NULL），重新运行时同样不必重算。
+    各事件的拟合结果（{模型: OLSEstimate} 与估计窗口方差信息）另存于 estimates 表，
+    其键只含估计窗口相关的参数：事件窗口或检验等参数改变后，结果失效但拟合结果仍可复用，不必重新回归。
+    每处理完一块事件提交一次事务，中断的运行可从最后完成的块继续。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, symbol TEXT, event_date TEXT, payload BLOB)'
+        )
+        self.conn.execute('CREATE TABLE IF NOT EXISTS estimates (key TEXT PRIMARY KEY, payload BLOB)')
+        self.conn.commit()
+
+    def get_many(self, keys):
+        """返回 {键: (result, merged_event) 或 None}；不在存储中的键不出现在结果里。"""
+        return self._get('results', keys)
+
+    def get_estimates(self, keys):
+        """返回 {键: ({模型: OLSEstimate}, {模型: EstimationVariance})}；不在存储中的键不出现在结果里。"""
+        return self._get('estimates', keys)
+
+    def _get(self, table, keys):
+        found = {}
+        keys = list(keys)
+        for begin in range(0, len(keys), 500):
+            batch = keys[begin:begin + 500]
+            rows = self.conn.execute(
+                f"SELECT key, payload FROM {table} WHERE key IN ({','.join('?' * len(batch))})", batch
+            )
+            for key, payload in rows:
+                found[key] = pickle.loads(payload) if payload is not None else None
+        return found
+
+    def put_many(self, entries, estimates=()):
+        """
+        写入 [(键, 股票代码, 事件日期, (result, merged_event) 或 None)]，
+        以及 estimates 中的 [(估计键, 拟合结果)]，在同一事务中提交。
+        """
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO estimates (key, payload) VALUES (?, ?)',
+            [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)) for key, value in estimates]
+        )
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO results (key, symbol, event_date, payload) VALUES (?, ?, ?, ?)',
+            [
+                (key, str(symbol), pd.Timestamp(event_date).isoformat(),
+                 pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) if value is not None else None)
+                for key, symbol, event_date, value in entries
+            ]
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,231 @@
+# event_study/results.py
+
+import numpy as np
+import pandas as pd
+
+from .statistical_tests import TESTS, TEST_KEYS, select_tests, test_keys
+
+# 逐事件 CAR/AR 序列上计算的检验（Patell 与 Corrado 只在每日截面上计算）
+EVENT_TEST_KEYS = tuple(key for key in TEST_KEYS if not key.startswith(('patell', 'corrado')))
+EVENT_TESTS = tuple(name for name in TESTS if f'{name}_statistic' in EVENT_TEST_KEYS)
+
+# 每个模型的逐事件统计量轴；结果键（summary_df 的列名）为 f'{统计量}_{模型}'
+EVENT_STATISTICS = (('AvgCAR',) + EVENT_TEST_KEYS + ('AvgAR',) + tuple(f'{key}_AR' for key in EVENT_TEST_KEYS)
+                    + ('CAR_LastDay', 'sigma2', 'dof'))
+STATISTIC_INDEX = {name: i for i, name in enumerate(EVENT_STATISTICS)}
+CAR_TESTS = slice(STATISTIC_INDEX[EVENT_TEST_KEYS[0]], STATISTIC_INDEX[EVENT_TEST_KEYS[-1]] + 1)
+AR_TESTS = slice(STATISTIC_INDEX[f'{EVENT_TEST_KEYS[0]}_AR'], STATISTIC_INDEX[f'{EVENT_TEST_KEYS[-1]}_AR'] + 1)
+
+# 结果字典与汇总表中每个模型的列顺序（与原先 calculate_CAR_AR 构建结果字典的顺序一致）
+_COLUMN_TESTS = ('t_statistic', 't_p_value', 'binomial_statistic', 'binomial_p_value',
+                 'wilcoxon_statistic', 'wilcoxon_p_value', 'permutation_statistic', 'permutation_p_value')
+COLUMN_ORDER = (('AvgCAR',) + _COLUMN_TESTS + ('AvgAR',) + tuple(f'{key}_AR' for key in _COLUMN_TESTS))
+
+def reported_statistics(tests=None):
+    """
+    所选检验（见 select_tests）下输出的逐事件统计量，为 EVENT_STATISTICS 的子集且顺序不变；
+    均值、CAR_LastDay、sigma2 与 dof 总是保留。
+    """
+    keys = set(test_keys(tests))
+    return tuple(name for name in EVENT_STATISTICS
+                 if (name[:-3] if name.endswith('_AR') else name) not in EVENT_TEST_KEYS
+                 or (name[:-3] if name.endswith('_AR') else name) in keys)
+
+# 结果存储中事件结果的格式版本；格式变化时递增，使旧存储中的结果失效
+RESULT_FORMAT = 3
+
+
+class EventRecord:
+    """
+    单个事件的紧凑结果，由 calculate_CAR_AR 原地填充。
+
+    - values：(模型数, 统计量数) 数组，统计量轴为 EVENT_STATISTICS，缺失为 NaN；
+    - days、daily_means：该事件出现的事件日及各模型每日平均 CAR，形状 (模型数, 事件日数)；
+    - daily_tests：每日 CAR 检验 (模型数, 事件日数, 检验数)，检验轴为 TEST_KEYS；
+      全部为 NaN 或未计算时（每个事件日只有一行，检验退化）为 None，不分配数组；
+    - residuals：{模型: (日期, 标准化残差)}，供 Kolari-Pynnönen 检验使用，汇总后即被清空；
+    - estimates：({模型: OLSEstimate}, {模型: EstimationVariance})，只在需要写入结果存储时保存，写入后即被清空。
+    """
+
+    __slots__ = ('symbol', 'event_date', 'values', 'days', 'daily_means', 'daily_tests', 'residuals', 'estimates')
+
+    def __init__(self, symbol, event_date, n_models):
+        self.symbol = symbol
+        self.event_date = event_date
+        self.values = np.full((n_models, len(EVENT_STATISTICS)), np.nan)
+        self.days = np.empty(0, dtype=np.int64)
+        self.daily_means = np.empty((n_models, 0))
+        self.daily_tests = None
+        self.residuals = None
+        self.estimates = None
+
+    def copy(self):
+        """浅复制：数组共用，residuals 字典独立，以便重复事件各自汇总残差。"""
+        other = EventRecord.__new__(EventRecord)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        other.residuals = dict(self.residuals) if self.residuals is not None else None
+        return other
+
+    def set_tests(self, model_index, car_mean, car_tests, ar_mean, ar_tests):
+        """写入一个模型的 CAR/AR 均值及 run_tests 的检验结果。"""
+        row = self.values[model_index]
+        row[STATISTIC_INDEX['AvgCAR']] = car_mean
+        row[CAR_TESTS] = [car_tests.get(key, np.nan) for key in EVENT_TEST_KEYS]
+        row[STATISTIC_INDEX['AvgAR']] = ar_mean
+        row[AR_TESTS] = [ar_tests.get(key, np.nan) for key in EVENT_TEST_KEYS]
+
+    def set_daily(self, model_index, days, means, tests=None):
+        """写入一个模型的每日平均 CAR 及其检验（run_tests_batch 的结果；None 表示未计算）。"""
+        if self.daily_means.shape[1] != len(days):
+            self.days = np.asarray(days, dtype=np.int64)
+            self.daily_means = np.full((self.values.shape[0], len(days)), np.nan)
+        self.daily_means[model_index] = means
+        if not tests or not len(days):
+            return
+        missing = np.full(len(days), np.nan)
+        block = np.column_stack([tests.get(key, missing) for key in TEST_KEYS])
+        if self.daily_tests is None and not np.isnan(block).all():
+            self.daily_tests = np.full((self.values.shape[0], len(days), len(TEST_KEYS)), np.nan)
+        if self.daily_tests is not None:
+            self.daily_tests[model_index] = block
+
+    def to_dict(self, models, tests=None):
+        """
+        转换为原有的逐事件结果字典（含嵌套的 daily_avgCAR_* 字典），只在需要时调用；
+        tests 为所选检验，未选择的检验不出现在字典中。
+        """
+        statistics = set(reported_statistics(tests))
+        daily_keys = [(k, key) for k, key in enumerate(TEST_KEYS) if key in test_keys(tests)]
+        result = {'Symbol': self.symbol, 'EventDate': self.event_date}
+        for m, model in enumerate(models):
+            for name in COLUMN_ORDER:
+                if name not in statistics:
+                    continue
+                result[f'{name}_{model}'] = self.values[m, STATISTIC_INDEX[name]]
+        for m, model in enumerate(models):
+            result[f'CAR_LastDay_{model}'] = self.values[m, STATISTIC_INDEX['CAR_LastDay']]
+        for m, model in enumerate(models):
+            if not np.isnan(self.values[m, STATISTIC_INDEX['sigma2']]):
+                result[f'sigma2_{model}'] = self.values[m, STATISTIC_INDEX['sigma2']]
+                result[f'dof_{model}'] = self.values[m, STATISTIC_INDEX['dof']]
+        if self.residuals:
+            result['estimation_residuals'] = self.residuals
+        for m, model in enumerate(models):
+            means = self.daily_means[m]
+            result[f'daily_avgCAR_{model}_means'] = {int(day): mean for day, mean in zip(self.days, means)}
+            result[f'daily_avgCAR_{model}_tests'] = {
+                int(day): {key: (self.daily_tests[m, j, k] if self.daily_tests is not None else np.nan)
+                           for k, key in daily_keys}
+                for j, day in enumerate(self.days) if not np.isnan(means[j])
+            }
+        return result
+
+
+class EventResults:
+    """
+    整个运行的逐事件结果容器，轴固定为 事件 × 模型 × 统计量。
+
+    - values：(事件数, 模型数, 统计量数) 的 float64 数组，未通过筛选的事件整行为 NaN；
+    - valid：事件是否有结果；symbols、event_dates：各事件的股票代码与事件日期；
+    - daily_means：(事件数, 模型数, 窗口天数) 的每日平均 CAR，事件日轴为事件窗口内的全部天数；
+    - daily_tests：(事件数, 模型数, 窗口天数, 检验数)，只在出现非退化的逐事件每日检验时分配；
+    - tests：所选检验（见 select_tests），未选择的检验不计算，也不出现在输出的表中。
+
+    事件按序号由 put 原地写入；to_frame、long_frame、daily_frame 只在需要时构建 DataFrame。
+    """
+
+    def __init__(self, models, n_events, event_window_days, tests=None):
+        self.models = list(models)
+        self.tests = select_tests(tests)
+        self.statistics = reported_statistics(self.tests)
+        self.days = np.arange(event_window_days[0], event_window_days[1] + 1)
+        self.values = np.full((n_events, len(self.models), len(EVENT_STATISTICS)), np.nan)
+        self.valid = np.zeros(n_events, dtype=bool)
+        self.symbols = np.empty(n_events, dtype=object)
+        self.event_dates = np.full(n_events, np.datetime64('NaT'), dtype='datetime64[ns]')
+        self.daily_means = np.full((n_events, len(self.models), len(self.days)), np.nan)
+        self.daily_tests = None
+
+    def __len__(self):
+        return int(self.valid.sum())
+
+    def put(self, index, record):
+        """把 EventRecord 写入第 index 个事件的位置。"""
+        self.valid[index] = True
+        self.symbols[index] = record.symbol
+        self.event_dates[index] = np.datetime64(pd.Timestamp(record.event_date), 'ns')
+        self.values[index] = record.values
+        cols = record.days - self.days[0]
+        self.daily_means[index][:, cols] = record.daily_means
+        if record.daily_tests is not None:
+            if self.daily_tests is None:
+                self.daily_tests = np.full(self.daily_means.shape + (len(TEST_KEYS),), np.nan)
+            self.daily_tests[index][:, cols] = record.daily_tests
+
+    def statistic(self, name):
+        """返回某个统计量的 (事件数, 模型数) 视图。"""
+        return self.values[:, :, STATISTIC_INDEX[name]]
+
+    def to_frame(self):
+        """
+        构建逐事件汇总表（每个有结果的事件一行），列为 Symbol、EventDate 与各 f'{统计量}_{模型}'，
+        与原先由结果字典构建的 summary_df 相同（不含嵌套的每日字典）。
+        """
+        rows = np.flatnonzero(self.valid)
+        data = {'Symbol': self.symbols[rows], 'EventDate': self.event_dates[rows]}
+        for m, model in enumerate(self.models):
+            for name in COLUMN_ORDER:
+                if name in self.statistics:
+                    data[f'{name}_{model}'] = self.values[rows, m, STATISTIC_INDEX[name]]
+        for m, model in enumerate(self.models):
+            data[f'CAR_LastDay_{model}'] = self.values[rows, m, STATISTIC_INDEX['CAR_LastDay']]
+        for m, model in enumerate(self.models):
+            data[f'sigma2_{model}'] = self.values[rows, m, STATISTIC_INDEX['sigma2']]
+            data[f'dof_{model}'] = self.values[rows, m, STATISTIC_INDEX['dof']]
+        return pd.DataFrame(data)
+
+    def long_frame(self, statistics=None, names=None):
+        """
+        直接由数组构建长表（事件 × 模型 × 统计量），列为 Symbol、EventDate、Model、Statistic、Value。
+
+        statistics 为要输出的统计量（默认为所选检验下除 sigma2、dof 外的全部），names 为 {统计量: 输出名}。
+        """
+        statistics = [name for name in self.statistics if name not in ('sigma2', 'dof')] \
+            if statistics is None else list(statistics)
+        names = names or {}
+        rows = np.flatnonzero(self.valid)
+        block = self.values[rows][:, :, [STATISTIC_INDEX[name] for name in statistics]]
+        n_events, n_models, n_stats = block.shape
+        return pd.DataFrame({
+            'Symbol': np.repeat(self.symbols[rows], n_models * n_stats),
+            'EventDate': np.repeat(self.event_dates[rows], n_models * n_stats),
+            'Model': np.tile(np.repeat(np.array(self.models, dtype=object), n_stats), n_events),
+            'Statistic': np.tile(np.array([names.get(name, name) for name in statistics], dtype=object),
+                                 n_events * n_models),
+            'Value': block.ravel(),
+        })
+
+    def daily_frame(self):
+        """逐事件的每日平均 CAR 及其检验的长表（只含有数值的 事件 × 模型 × 事件日）。"""
+        event, model, day = np.nonzero(~np.isnan(self.daily_means))
+        frame = pd.DataFrame({
+            'Symbol': self.symbols[event],
+            'EventDate': self.event_dates[event],
+            'Model': np.array(self.models, dtype=object)[model],
+            'EventDay': self.days[day],
+            'AvgCAR': self.daily_means[event, model, day],
+        })
+        selected = test_keys(self.tests)
+        for k, key in enumerate(TEST_KEYS):
+            if key in selected:
+                frame[key] = self.daily_tests[event, model, day, k] if self.daily_tests is not None else np.nan
+        return frame
+
+    @classmethod
+    def from_records(cls, records, models, event_window_days, tests=None):
+        """由 [(事件序号, EventRecord)] 构建只含这些事件的容器，事件按给定顺序排列。"""
+        results = cls(models, len(records), event_window_days, tests)
+        for position, (_, record) in enumerate(records):
+            results.put(position, record)
+        return results
@@ -0,0 +1,223 @@
+# event_study/sensitivity.py
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .data_loader import load_data
+from .panel_index import PanelIndex
+from .regression_models import (MODELS, _nested_chains, _solve_nested, _solve_pinv, check_models, estimated_models,
+                                model_columns, predict, union_columns)
+
+
+def _union_columns(panel, models_to_use):
+    """返回各模型设计矩阵列的并集（含常数项）及其在面板因子数组中的列号。"""
+    columns = union_columns(models_to_use)
+    return columns, [panel.factor_columns.index(col) for col in columns[1:]]
+
+def _event_positions(panel, event_data):
+    """事件日（事件日期当天或之后的第一个交易日）在面板日期轴上的位置。"""
+    dates = event_data['Date'].to_numpy(dtype='datetime64[ns]')
+    return np.searchsorted(panel.dates, dates, side='left')
+
+def _span_returns(panel, symbols, positions, before, length, column='Dretnd'):
+    """
+    把每个事件在日期轴 [事件日 - before, 事件日 - before + length) 上的公司收益排成稠密矩阵，
+    缺失或超出日期轴的位置为 NaN。
+    """
+    y = np.full((len(symbols), length), np.nan)
+    value_column = panel.value_columns.index(column)
+    for e, (symbol, position) in enumerate(zip(symbols, positions)):
+        lo, hi = panel.symbol_bounds(symbol)
+        pos = panel.firm_pos[lo:hi]
+        local = pos - (position - before)
+        keep = (pos >= 0) & (local >= 0) & (local < length)
+        y[e, local[keep]] = panel.firm_values[lo:hi][keep, value_column]
+    return y
+
+def window_cars(panel, event_data, event_windows, estimation_windows, models_to_use, batch_size=256):
+    """
+    一次遍历计算多个估计窗口 × 事件窗口组合下每个事件的 CAR。
+
+    每批事件在覆盖全部窗口的日期跨度上排成稠密的 (事件, 交易日) 数组，
+    沿跨度累积 Gram 矩阵 X'X、X'y 与 y'y 的前缀和：任一估计窗口 [-L, -1] 的
+    Gram 矩阵是两个前缀之差，嵌套的模型（如 3F/4F/5F）共用一次 Cholesky 分解。
+    所有事件、所有模型的预测收益由 (事件, 模型, 列) 系数张量与设计张量的一次 einsum 得到，
+    AR 再做一次前缀和，任意 CAR(a, b) 对每个事件都是 O(1) 的差分。
+
+    窗口以面板日期轴（市场与因子的共同交易日）计，事件日为事件日期当天或之后的第一个交易日；
+    估计窗口样本量不足 80% 的事件在该估计窗口下为 NaN，与 run_event_study 的交易日模式一致。
+
+    返回：{(估计窗口长度, 模型): 形状为 (事件数, 事件窗口数) 的 CAR 数组}。
+    """
+    event_windows = [tuple(window) for window in event_windows]
+    columns, factor_index = _union_columns(panel, models_to_use)
+    longest = max(estimation_windows)
+    before = max(longest, -min(a for a, _ in event_windows), 0)
+    length = before + max(max(b for _, b in event_windows), -1) + 1
+    n_events = len(event_data)
+
+    chains = _nested_chains(estimated_models(models_to_use))
+    chain_index = [[columns.index(col) for col in chain['columns']] for chain in chains]
+
+    # 固定系数模型的系数行对所有事件相同，估计模型的系数行逐估计窗口填入
+    fixed = np.zeros((len(models_to_use), len(columns)))
+    for m, model in enumerate(models_to_use):
+        if MODELS[model].coefficients is not None:
+            fixed[m, [columns.index(col) for col in model_columns(model)]] = MODELS[model].coefficients
+
+    cars = {(L, model): np.full((n_events, len(event_windows)), np.nan)
+            for L in estimation_windows for model in models_to_use}
+    symbols = event_data['Symbol'].astype(str).to_numpy()
+    positions = _event_positions(panel, event_data)
+    starts = np.array([before + a for a, _ in event_windows])
+    ends = np.array([before + b + 1 for _, b in event_windows])
+
+    for begin in range(0, n_events, batch_size):
+        batch = slice(begin, begin + batch_size)
+        y = _span_returns(panel, symbols[batch], positions[batch], before, length)
+        axis = positions[batch, None] - before + np.arange(length)
+        inside = (axis >= 0) & (axis < len(panel.dates))
+        design = np.zeros(y.shape + (len(columns),))
+        design[..., 0] = 1.0
+        design[..., 1:] = panel.factor_values[np.clip(axis, 0, len(panel.dates) - 1)][..., factor_index]
+        mask = inside & ~np.isnan(y)
+        y = np.where(mask, y, 0.0)
+        design_masked = design * mask[..., None]
+
+        # 沿日期跨度的前缀和（首位为 0），任意区间的统计量为两个前缀之差
+        gram = np.zeros((len(y), length + 1, len(columns), len(columns)))
+        gram[:, 1:] = np.cumsum(np.einsum('esi,esj->esij', design_masked, design_masked), axis=1)
+        xty = np.zeros((len(y), length + 1, len(columns)))
+        xty[:, 1:] = np.cumsum(design_masked * y[..., None], axis=1)
+        yty = np.concatenate([np.zeros((len(y), 1)), np.cumsum(y * y, axis=1)], axis=1)
+        nobs = np.concatenate([np.zeros((len(y), 1), dtype=np.int64), np.cumsum(mask, axis=1)], axis=1)
+
+        for L in estimation_windows:
+            window_gram = gram[:, before] - gram[:, before - L]
+            window_xty = xty[:, before] - xty[:, before - L]
+            window_yty = yty[:, before] - yty[:, before - L]
+            window_nobs = nobs[:, before] - nobs[:, before - L]
+            valid = window_nobs >= L * 0.8
+            if not valid.any():
+                continue
+
+            coefficients = np.repeat(fixed[None], int(valid.sum()), axis=0)
+            for chain, index in zip(chains, chain_index):
+                sizes = sorted(len(model_columns(model)) for model in chain['models'])
+                sub_gram = window_gram[np.ix_(valid, index, index)]
+                sub_xty = window_xty[valid][:, index]
+                try:
+                    solved = _solve_nested(sub_gram, sub_xty, window_yty[valid], window_nobs[valid], sizes)
+                except np.linalg.LinAlgError:
+                    solved = _solve_pinv(sub_gram, sub_xty, window_yty[valid], window_nobs[valid], sizes)
+                for model in chain['models']:
+                    k = len(model_columns(model))
+                    coefficients[:, models_to_use.index(model), index[:k]] = solved[k][0]
+
+            # (事件, 交易日, 模型) 的 AR，无效位置为 0；沿交易日的前缀和给出任意窗口的 CAR
+            ar = y[valid][..., None] - predict(coefficients, design[valid])
+            ar = np.where(mask[valid][..., None], ar, 0.0)
+            prefix = np.concatenate([np.zeros((len(ar), 1, len(models_to_use))), np.cumsum(ar, axis=1)], axis=1)
+            counts = nobs[valid]
+            car = prefix[:, ends] - prefix[:, starts]
+            car[(counts[:, ends] - counts[:, starts]) == 0] = np.nan
+            for m, model in enumerate(models_to_use):
+                cars[(L, model)][np.flatnonzero(valid) + begin] = car[..., m]
+
+    return cars
+
+def bootstrap_caar(cars, num_bootstrap=1000, confidence=0.95, rng=None, chunk_size=None):
+    """
+    对 (事件, 列) 的 CAR 矩阵做截面自助法，返回各列 CAAR 的百分位置信区间 (lower, upper)。
+
+    每次重抽样以多项分布权重表示（各事件被抽中的次数），所有列共用同一组权重，
+    因此全部重抽样的 CAAR 只需一次矩阵乘法：(权重 @ CAR) / (权重 @ 有效标记)。
+    某列中为 NaN 的事件在该列不参与计算。
+    """
+    cars = np.asarray(cars, dtype=float)
+    n_events = cars.shape[0]
+    random = np.random.default_rng() if rng is None else rng
+    valid = ~np.isnan(cars)
+    filled = np.where(valid, cars, 0.0)
+    if chunk_size is None:
+        chunk_size = max(1, (1 << 22) // max(n_events, 1))
+
+    means = []
+    drawn = 0
+    while drawn < num_bootstrap:
+        size = min(chunk_size, num_bootstrap - drawn)
+        weights = random.multinomial(n_events, np.full(n_events, 1.0 / n_events), size=size).astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means.append((weights @ filled) / (weights @ valid))
+        drawn += size
+    means = np.concatenate(means)
+
+    tail = (1 - confidence) / 2 * 100
+    lower = np.full(cars.shape[1], np.nan)
+    upper = np.full(cars.shape[1], np.nan)
+    cols = np.flatnonzero(valid.any(axis=0))
+    if len(cols):
+        lower[cols], upper[cols] = np.nanpercentile(means[:, cols], [tail, 100 - tail], axis=0)
+    return lower, upper
+
+def run_sensitivity(event_windows, estimation_windows=(250,), models_to_use=None, event_file='Event.xlsx',
+                    firm_file='Firm.xlsx', market_file='Market.xlsx', ff_factors_file='FF factor.xlsx',
+                    num_bootstrap=1000, confidence=0.95, seed=None, batch_size=256, cache_dir=None,
+                    use_cache=True):
+    """
+    多窗口敏感性分析：一次加载数据、一次遍历，评估所有 估计窗口 × 事件窗口 组合。
+
+    参数：
+    - event_windows：事件窗口列表，如 [(-1, 1), (-2, 2), (0, 5), (-10, 10)]（交易日）。
+    - estimation_windows：估计窗口长度列表（交易日）。
+    - models_to_use：要使用的模型列表。
+    - num_bootstrap：CAAR 截面自助法的重抽样次数，0 表示不计算置信区间。
+    - confidence：置信区间的置信水平。
+    - seed：自助法的随机种子。
+    - batch_size：每批堆叠的事件数，用于控制内存。
+    - 其余参数同 run_event_study。
+
+    返回：每个 (估计窗口, 模型, 事件窗口) 一行的 DataFrame，包含有效事件数、CAAR、
+    截面 t 检验及自助法置信区间。
+    """
+    if models_to_use is None:
+        models_to_use = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+    check_models(models_to_use)
+    event_windows = [tuple(window) for window in event_windows]
+
+    event_data, firm_data, market_data, ff_factors = load_data(
+        event_file=event_file,
+        firm_file=firm_file,
+        market_file=market_file,
+        ff_factors_file=ff_factors_file,
+        cache_dir=cache_dir,
+        use_cache=use_cache
+    )
+    panel = PanelIndex(firm_data, market_data, ff_factors)
+    cars = window_cars(panel, event_data, event_windows, list(estimation_windows), models_to_use,
+                       batch_size=batch_size)
+
+    keys = list(cars)
+    matrix = np.concatenate([cars[key] for key in keys], axis=1)
+    n = np.sum(~np.isnan(matrix), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        caar = np.nansum(matrix, axis=0) / n
+        sd = np.sqrt(np.nansum((matrix - caar) ** 2, axis=0) / (n - 1))
+        t_stat = np.where(n > 1, caar / (sd / np.sqrt(n)), np.nan)
+    t_p = 2 * stats.t.sf(np.abs(t_stat), np.maximum(n - 1, 1))
+
+    if num_bootstrap > 0:
+        lower, upper = bootstrap_caar(matrix, num_bootstrap, confidence, np.random.default_rng(seed))
+    else:
+        lower = upper = np.full(matrix.shape[1], np.nan)
+
+    rows = [(L, model, a, b) for L, model in keys for a, b in event_windows]
+    summary = pd.DataFrame(rows, columns=['EstimationWindow', 'Model', 'EventWindowStart', 'EventWindowEnd'])
+    summary['N'] = n
+    summary['CAAR'] = caar
+    summary['t_statistic'] = t_stat
+    summary['t_p_value'] = t_p
+    summary['CI_lower'] = lower
+    summary['CI_upper'] = upper
+    return summary
@@ -0,0 +1,421 @@
+# event_study/sharding.py
+
+import argparse
+import glob
+import json
+import os
+import pickle
+import socket
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import (load_table, parquet_available, read_npz, read_table_chunks, restore_code_columns, typed_table,
+                          write_npz)
+from .engine import (EMPTY_FIRMS, build_daily_tables, collect_processed, collect_residuals, finish_profile,
+                     plot_average_ar, process_events, validate_options)
+from .output_writers import WRITERS, write_results
+from .panel_index import FactorWindowCache, PanelIndex
+from .profiling import NULL_PROFILER, Profiler
+from .regression_models import MODELS, register_model
+from .results import RESULT_FORMAT
+from .statistical_tests import ResidualCorrelation, select_tests
+from .trading_calendar import TradingCalendar
+
+# 分片目录布局：config.json、queue.sqlite、market/factors 表、firm/<分片>/<块> 与 events/<分片>、results/<分片>.pkl
+CONFIG_FILE = 'config.json'
+QUEUE_FILE = 'queue.sqlite'
+
+# 部分结果中保留的 merged_event 列（归约时构建每日检验表所需）
+_ROW_PREFIXES = ('AbnormalReturn', 'CAR', 'SAR', 'SCAR')
+
+
+def shard_of(symbols, n_shards):
+    """
+    返回各股票代码所属的分片号。
+
+    使用 pandas 的固定密钥哈希（不受 PYTHONHASHSEED 影响），因此不同进程与节点上的结果一致；
+    公司表的 'Stkcd' 与事件表的 'Symbol' 均以字符串参与哈希。
+    """
+    hashed = pd.util.hash_pandas_object(pd.Series(symbols, dtype=object).astype(str), index=False)
+    return (hashed.to_numpy() % np.uint64(n_shards)).astype(np.int64)
+
+def _shard_name(shard):
+    return f'{shard:05d}'
+
+def _save_table(df, path):
+    """以带类型的列式格式（有 pyarrow 时为 Parquet，否则为 NPZ）写出 df，path 不含扩展名。"""
+    typed = typed_table(df)
+    if parquet_available():
+        typed.to_parquet(path + '.parquet', index=False)
+    else:
+        write_npz(typed, path + '.npz')
+
+def _load_tables(paths):
+    """读取 _save_table 写出的一个或多个文件并按顺序拼接；代码列还原为字符串。"""
+    frames = [pd.read_parquet(path) if path.endswith('.parquet') else read_npz(path) for path in sorted(paths)]
+    if not frames:
+        return None
+    return restore_code_columns(pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0])
+
+def _table_files(pattern):
+    return glob.glob(pattern + '.parquet') + glob.glob(pattern + '.npz')
+
+def _atomic_pickle(value, path):
+    """先写临时文件再改名，共享文件系统上的读取方不会看到写了一半的部分结果。"""
+    tmp = f'{path}.{socket.gethostname()}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+class ShardQueue:
+    """
+    基于 SQLite 的分片工作队列，多个节点通过共享文件系统上的同一文件领取分片。
+
+    每个分片的状态为 'pending'、'running' 或 'done'。claim 在一个 IMMEDIATE 事务中
+    选取一个待处理分片（或租约已过期的运行中分片，即其工作进程可能已退出）并登记工作进程与租约到期时间；
+    complete 把分片标记为完成。部分结果以原子改名写出且内容确定，
+    因此租约过期后被重复处理的分片不影响结果。
+    注意：SQLite 依赖文件锁，共享文件系统须支持 POSIX 锁（如启用锁的 NFSv4）。
+    """
+
+    def __init__(self, path, timeout=60.0):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS shards ('
+            'shard INTEGER PRIMARY KEY, status TEXT NOT NULL, worker TEXT, '
+            'lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, finished_at REAL)'
+        )
+
+    def add(self, shards):
+        """登记待处理的分片。"""
+        self.conn.execute('BEGIN IMMEDIATE')
+        self.conn.executemany("INSERT OR IGNORE INTO shards (shard, status) VALUES (?, 'pending')",
+                              [(int(shard),) for shard in shards])
+        self.conn.execute('COMMIT')
+
+    def claim(self, worker, lease_seconds=3600):
+        """领取一个分片并返回其编号；没有可领取的分片时返回 None。"""
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute(
+                "SELECT shard FROM shards WHERE status = 'pending' "
+                "OR (status = 'running' AND lease_expires < ?) ORDER BY shard LIMIT 1", (now,)
+            ).fetchone()
+            if row is not None:
+                self.conn.execute(
+                    "UPDATE shards SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                    "WHERE shard = ?", (worker, now + lease_seconds, row[0])
+                )
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return None if row is None else int(row[0])
+
+    def complete(self, shard):
+        """把分片标记为完成。"""
+        self.conn.execute("UPDATE shards SET status = 'done', lease_expires = NULL, finished_at = ? WHERE shard = ?",
+                          (time.time(), int(shard)))
+
+    def status(self):
+        """返回 {状态: 分片数}。"""
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM shards GROUP BY status').fetchall())
+
+    def unfinished(self):
+        """返回尚未完成的分片编号列表。"""
+        return [row[0] for row in self.conn.execute("SELECT shard FROM shards WHERE status != 'done' ORDER BY shard")]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def prepare_shards(shard_dir, event_file='Event.xlsx', firm_file='Firm.xlsx', market_file='Market.xlsx',
+                   ff_factors_file='FF factor.xlsx', n_shards=64, models_to_use=None, event_window_days=(-1, 1),
+                   estimation_window_days=250, regression_engine='batch', batch_size=1024, seed=None,
+                   test_options=None, window_unit='calendar', tests=None, read_chunk_rows=500000,
+                   cache_dir=None, use_cache=True):
+    """
+    把公司表按 'Stkcd' 的哈希分为 n_shards 个磁盘分片，并把事件路由到其股票所属的分片。
+
+    公司表按 read_chunk_rows 行分块读取（CSV 分块、Parquet 按批次；Excel 无法分块，整表读取），
+    每块按分片写出一个文件，内存占用只与块大小有关。事件、市场与因子表较小，整表读取；
+    事件保留其在事件文件中的序号，归约后的输出顺序与 run_event_study 相同。
+    运行参数与模型注册表写入 config.json，有事件的分片登记到 queue.sqlite 中等待领取。
+    参数含义与 run_event_study 相同；返回待处理的分片数。
+    """
+    if models_to_use is None:
+        models_to_use = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+    validate_options(models_to_use, regression_engine, window_unit)
+    tests = select_tests(tests)
+    if n_shards < 1:
+        raise ValueError(f"n_shards must be at least 1, got {n_shards}")
+    if os.path.exists(os.path.join(shard_dir, CONFIG_FILE)):
+        raise ValueError(f"{shard_dir} already holds prepared shards; use a new shard_dir.")
+    for sub in ('firm', 'events', 'results'):
+        os.makedirs(os.path.join(shard_dir, sub), exist_ok=True)
+
+    event_data, market_data, ff_factors = [load_table(path, cache_dir=cache_dir, use_cache=use_cache)
+                                           for path in (event_file, market_file, ff_factors_file)]
+    _save_table(market_data, os.path.join(shard_dir, 'market'))
+    _save_table(ff_factors, os.path.join(shard_dir, 'factors'))
+
+    events = pd.DataFrame({'Index': np.arange(len(event_data), dtype=np.int64),
+                           'Symbol': event_data['Symbol'].to_numpy(), 'Date': event_data['Date'].to_numpy()})
+    event_shards = shard_of(events['Symbol'], n_shards)
+    for shard, group in events.groupby(event_shards):
+        _save_table(group, os.path.join(shard_dir, 'events', _shard_name(shard)))
+
+    # CSV 的列式缓存需要整表留在内存中，分块写出分片时不使用
+    csv = os.path.splitext(firm_file)[1].lower() == '.csv'
+    pieces = read_table_chunks(firm_file, read_chunk_rows, cache_dir=cache_dir, use_cache=use_cache and not csv)
+    for number, piece in enumerate(pieces):
+        for shard, group in piece.groupby(shard_of(piece['Stkcd'], n_shards)):
+            directory = os.path.join(shard_dir, 'firm', _shard_name(shard))
+            os.makedirs(directory, exist_ok=True)
+            _save_table(group, os.path.join(directory, f'{number:06d}'))
+
+    config = dict(
+        n_shards=n_shards,
+        n_events=len(events),
+        models_to_use=list(models_to_use),
+        models={name: MODELS[name]._asdict() for name in models_to_use},
+        event_window_days=list(event_window_days),
+        estimation_window_days=estimation_window_days,
+        regression_engine=regression_engine,
+        batch_size=batch_size,
+        seed=seed,
+        test_options=test_options,
+        window_unit=window_unit,
+        tests=list(tests),
+        result_format=RESULT_FORMAT,
+    )
+    with open(os.path.join(shard_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    shards = np.unique(event_shards)
+    with ShardQueue(os.path.join(shard_dir, QUEUE_FILE)) as shard_queue:
+        shard_queue.add(shards)
+    return len(shards)
+
+def _load_config(shard_dir):
+    """读取分片运行参数，并注册其中的模型，使其他节点上的工作进程也能使用运行时注册的模型。"""
+    with open(os.path.join(shard_dir, CONFIG_FILE), encoding='utf-8') as f:
+        config = json.load(f)
+    if config['result_format'] != RESULT_FORMAT:
+        raise ValueError(f"{shard_dir} was prepared by a version with another result format; prepare it again.")
+    for name, spec in config['models'].items():
+        register_model(name, **spec)
+    config['event_window_days'] = tuple(config['event_window_days'])
+    return config
+
+def _load_factors(shard_dir, config):
+    """读取市场与因子表，返回 (market_data, ff_factors, calendar)。"""
+    market_data = _load_tables(_table_files(os.path.join(shard_dir, 'market')))
+    ff_factors = _load_tables(_table_files(os.path.join(shard_dir, 'factors')))
+    calendar = TradingCalendar.from_market(market_data) if config['window_unit'] == 'trading' else None
+    return market_data, ff_factors, calendar
+
+def _shard_rows(merged_event, models_to_use):
+    """只保留归约时构建每日检验表所需的列，缩小部分结果。"""
+    columns = ['Date', 'EventDay'] + [col for col in (f'{prefix}_{model}' for prefix in _ROW_PREFIXES
+                                                       for model in models_to_use) if col in merged_event.columns]
+    return merged_event[columns]
+
+def process_shard(shard_dir, shard, config=None, base_panel=None, calendar=None, window_cache=None,
+                  profiler=NULL_PROFILER):
+    """
+    计算一个分片的事件并写出部分结果 results/<分片>.pkl，返回有结果的事件数。
+
+    部分结果含 [(事件序号, EventRecord, merged_event)]（merged_event 只保留 AR/CAR/SAR/SCAR 列）
+    与按日期汇总的估计窗口残差和（ResidualCorrelation），估计窗口残差本身不写出。
+    """
+    config = config or _load_config(shard_dir)
+    if base_panel is None:
+        market_data, ff_factors, calendar = _load_factors(shard_dir, config)
+        base_panel = PanelIndex(EMPTY_FIRMS, market_data, ff_factors)
+    models_to_use = config['models_to_use']
+
+    name = _shard_name(shard)
+    with profiler.stage('load_data'):
+        events = _load_tables(_table_files(os.path.join(shard_dir, 'events', name)))
+        firm_data = _load_tables(_table_files(os.path.join(shard_dir, 'firm', name, '*')))
+    with profiler.stage('build_index'):
+        panel = base_panel.with_firms(firm_data if firm_data is not None else EMPTY_FIRMS)
+
+    options = {key: config[key] for key in ('event_window_days', 'estimation_window_days', 'models_to_use',
+                                            'regression_engine', 'batch_size', 'seed', 'test_options', 'tests')}
+    event_list = list(zip(events['Index'].to_numpy(dtype=np.int64), events['Symbol'], events['Date']))
+    processed = process_events(event_list, panel, None, None, None, calendar=calendar, window_cache=window_cache,
+                               profiler=profiler, **options)
+
+    correlations = {model: ResidualCorrelation() for model in models_to_use}
+    collect_residuals(processed, correlations)
+    partial = {
+        'shard': shard,
+        'processed': [(index, record, _shard_rows(merged_event, models_to_use))
+                      for index, record, merged_event in processed],
+        'correlations': {model: correlation.sums for model, correlation in correlations.items()},
+    }
+    with profiler.stage('write_output'):
+        _atomic_pickle(partial, os.path.join(shard_dir, 'results', name + '.pkl'))
+    return len(processed)
+
+def run_shard_worker(shard_dir, worker_id=None, lease_seconds=3600, window_cache_size=256, max_shards=None,
+                     profile=False):
+    """
+    工作进程主循环：从 queue.sqlite 领取分片、计算并写出部分结果，直到没有可领取的分片。
+
+    任何能访问 shard_dir 的节点都可以运行（命令行：python -m event_study.sharding worker SHARD_DIR）。
+    市场与因子面板及其窗口缓存在同一工作进程处理的各分片间共用。
+    lease_seconds 为分片租约：领取后超过该时间仍未完成的分片可被其他工作进程重新领取。
+    max_shards 限制本进程处理的分片数。返回本进程完成的分片编号列表（profile=True 时另返回 Profiler 报告）。
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    profiler = Profiler() if profile else NULL_PROFILER
+    config = _load_config(shard_dir)
+    market_data, ff_factors, calendar = _load_factors(shard_dir, config)
+    base_panel = PanelIndex(EMPTY_FIRMS, market_data, ff_factors)
+    window_cache = FactorWindowCache(base_panel, window_cache_size) if window_cache_size > 0 else None
+
+    done = []
+    with ShardQueue(os.path.join(shard_dir, QUEUE_FILE)) as shard_queue:
+        while max_shards is None or len(done) < max_shards:
+            shard = shard_queue.claim(worker_id, lease_seconds)
+            if shard is None:
+                break
+            process_shard(shard_dir, shard, config, base_panel, calendar, window_cache, profiler)
+            shard_queue.complete(shard)
+            done.append(shard)
+    if profile:
+        return done, profiler.report()
+    return done
+
+def _iter_partials(shard_dir, correlations):
+    """逐个读取部分结果，产出其事件块，并把各分片的残差和并入 correlations。"""
+    for path in sorted(glob.glob(os.path.join(shard_dir, 'results', '*.pkl'))):
+        with open(path, 'rb') as f:
+            partial = pickle.load(f)
+        for model, sums in partial['correlations'].items():
+            other = ResidualCorrelation()
+            other.sums = sums
+            correlations[model].merge(other)
+        yield partial['processed']
+
+def reduce_shards(shard_dir, output_format='excel', output_dir='.', excel_summary=False, generate_plots=False,
+                  profile=False):
+    """
+    归约步骤：合并全部分片的部分结果，计算每日 AAR/CAAR 检验表并写出与 run_event_study 相同的输出文件。
+
+    每日截面检验（含秩检验与置换检验）需要全部事件的 AR/CAR，因此在归约时统一计算；
+    估计窗口残差的平均截面相关系数由各分片的按日期累计和相加得到。
+    尚有分片未完成时引发 ValueError。返回 (results, daily_tables)，没有有效事件时为 (None, {})。
+    """
+    if output_format != 'excel' and output_format not in WRITERS:
+        raise ValueError(f"Unknown output_format: {output_format}")
+    config = _load_config(shard_dir)
+    with ShardQueue(os.path.join(shard_dir, QUEUE_FILE)) as shard_queue:
+        unfinished = shard_queue.unfinished()
+    if unfinished:
+        raise ValueError(f"Shards not finished: {unfinished}; run more workers before reducing.")
+
+    profiler = Profiler() if profile else NULL_PROFILER
+    models_to_use, event_window_days = config['models_to_use'], config['event_window_days']
+    _, _, calendar = _load_factors(shard_dir, config)
+    correlations = {model: ResidualCorrelation() for model in models_to_use}
+    results, processed, _ = collect_processed(_iter_partials(shard_dir, correlations), config['n_events'],
+                                              models_to_use, event_window_days, profiler, config['tests'])
+    if not processed:
+        print("No valid event result was found.")
+        finish_profile(profiler)
+        return None, {}
+
+    daily_tables, average_AR_per_day = build_daily_tables(results, processed, correlations, models_to_use,
+                                                          event_window_days, calendar, config['seed'],
+                                                          config['test_options'], profiler, config['tests'])
+    with profiler.stage('write_output'):
+        os.makedirs(output_dir, exist_ok=True)
+        if output_format == 'excel':
+            from .excel_output import write_excel_results
+            write_excel_results(results.to_frame(), daily_tables, models_to_use, output_dir)
+        else:
+            write_results(results, daily_tables, models_to_use, output_format, output_dir, excel_summary)
+    if generate_plots:
+        with profiler.stage('plots'):
+            plot_average_ar(average_AR_per_day, models_to_use, event_window_days)
+    finish_profile(profiler)
+    return results, daily_tables
+
+def run_event_study_sharded(shard_dir, n_shards=64, n_workers=2, models_to_use=None, event_window_days=(-1, 1),
+                            estimation_window_days=250, generate_plots=True, event_file='Event.xlsx',
+                            firm_file='Firm.xlsx', market_file='Market.xlsx', ff_factors_file='FF factor.xlsx',
+                            regression_engine='batch', batch_size=1024, seed=None, cache_dir=None, use_cache=True,
+                            test_options=None, window_unit='calendar', tests=None, window_cache_size=256,
+                            read_chunk_rows=500000, output_format='excel', output_dir='.', excel_summary=False):
+    """
+    在本机上运行完整的分片流程：prepare_shards 写出分片，n_workers 个工作进程（代替多个节点）
+    经 queue.sqlite 领取并计算分片，最后由 reduce_shards 合并并写出结果。
+
+    多节点运行时，先在任一节点调用 prepare_shards，再在各节点运行
+    python -m event_study.sharding worker SHARD_DIR，全部完成后运行
+    python -m event_study.sharding reduce SHARD_DIR。其余参数与 run_event_study 相同。
+    """
+    prepare_shards(shard_dir, event_file=event_file, firm_file=firm_file, market_file=market_file,
+                   ff_factors_file=ff_factors_file, n_shards=n_shards, models_to_use=models_to_use,
+                   event_window_days=event_window_days, estimation_window_days=estimation_window_days,
+                   regression_engine=regression_engine, batch_size=batch_size, seed=seed,
+                   test_options=test_options, window_unit=window_unit, tests=tests,
+                   read_chunk_rows=read_chunk_rows, cache_dir=cache_dir, use_cache=use_cache)
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(run_shard_worker, shard_dir, f'{socket.gethostname()}:local-{i}',
+                                   window_cache_size=window_cache_size) for i in range(n_workers)]
+        for future in futures:
+            future.result()
+    reduce_shards(shard_dir, output_format=output_format, output_dir=output_dir, excel_summary=excel_summary,
+                  generate_plots=generate_plots)
+    print("The event study analysis has been successfully completed and all output files have been generated.")
+
+def main(argv=None):
+    """命令行入口：worker 在本节点运行一个工作进程，reduce 合并部分结果，status 查看队列状态。"""
+    parser = argparse.ArgumentParser(prog='python -m event_study.sharding')
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='claim and process shards until the queue is empty')
+    worker.add_argument('shard_dir')
+    worker.add_argument('--worker-id')
+    worker.add_argument('--lease-seconds', type=float, default=3600)
+    worker.add_argument('--window-cache-size', type=int, default=256)
+    reduce = commands.add_parser('reduce', help='merge partial results and write the outputs')
+    reduce.add_argument('shard_dir')
+    reduce.add_argument('--output-format', default='excel')
+    reduce.add_argument('--output-dir', default='.')
+    reduce.add_argument('--excel-summary', action='store_true')
+    status = commands.add_parser('status', help='print the number of shards per state')
+    status.add_argument('shard_dir')
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        done = run_shard_worker(args.shard_dir, args.worker_id, args.lease_seconds, args.window_cache_size)
+        print(f"Processed {len(done)} shards.")
+    elif args.command == 'reduce':
+        reduce_shards(args.shard_dir, args.output_format, args.output_dir, args.excel_summary)
+    else:
+        with ShardQueue(os.path.join(args.shard_dir, QUEUE_FILE)) as shard_queue:
+            print(json.dumps(shard_queue.status()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
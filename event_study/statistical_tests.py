@@ -1,8 +1,13 @@
 import numpy as np
+import pandas as pd
 from scipy import stats
 
 def patell_z_test(data):
-    """Patell Z 检验"""
+    """
+    Patell Z 检验（以样本自身的标准差标准化）。
+
+    该版本不使用估计窗口的残差方差；基于估计窗口方差与预测误差修正的版本见 standardized_tests。
+    """
     if len(data) < 2:
         return np.nan, np.nan
     standardized_data = (data - np.mean(data)) / np.std(data, ddof=1)
@@ -20,68 +25,395 @@ def corrado_signed_rank_test(data):
     p_value = 2 * (1 - stats.norm.cdf(abs(z_stat)))
     return z_stat, p_value
 
-def run_tests(data, num_permutations=1000):
-    """执行统计检验并返回结果字典"""
+def _extreme_count(signs, data, threshold):
+    """统计符号翻转后样本和的绝对值不小于观测值的次数。"""
+    return int(np.sum(np.abs(signs @ data) >= threshold))
+
+def permutation_test(data, num_permutations=1000, rng=None, exact_max_n=10, adaptive=False, alpha=0.05,
+                     chunk_size=None):
+    """
+    符号翻转置换检验，返回 (观测均值, p 值)。
+
+    - 样本量不超过 exact_max_n 时，精确枚举全部 2^n 种符号组合；
+    - 否则按块生成 (块大小, n) 的 ±1 矩阵，以一次矩阵乘法得到所有置换样本的和；
+    - adaptive=True 时逐块抽样，一旦 p 值的 99.9% Clopper-Pearson 区间完全位于
+      显著性水平 alpha 之上或之下即提前停止。
+
+    rng 为 np.random.Generator；为 None 时使用 numpy 全局随机状态。
+    """
+    data = np.asarray(data, dtype=float)
+    total = len(data)
+    observed_mean = np.mean(data)
+    # 容差避免浮点求和顺序不同导致观测组合本身未被计入
+    threshold = np.abs(np.sum(data)) - 1e-12 * np.sum(np.abs(data))
+
+    if total <= exact_max_n:
+        patterns = (np.arange(2 ** total)[:, None] >> np.arange(total)) & 1
+        signs = 1 - 2 * patterns
+        return observed_mean, _extreme_count(signs, data, threshold) / len(signs)
+
+    random = np.random if rng is None else rng
+    if chunk_size is None:
+        chunk_size = 100 if adaptive else max(1, (1 << 20) // total)
+
+    drawn = 0
+    extreme = 0
+    while drawn < num_permutations:
+        size = min(chunk_size, num_permutations - drawn)
+        signs = random.choice([1, -1], size=(size, total))
+        extreme += _extreme_count(signs, data, threshold)
+        drawn += size
+        if adaptive and drawn < num_permutations:
+            lower = stats.beta.ppf(0.0005, extreme, drawn - extreme + 1) if extreme > 0 else 0.0
+            upper = stats.beta.ppf(0.9995, extreme + 1, drawn - extreme) if extreme < drawn else 1.0
+            if upper < alpha or lower > alpha:
+                break
+
+    return observed_mean, extreme / drawn
+
+def run_tests(data, num_permutations=1000, rng=None, exact_max_n=10, adaptive=False, alpha=0.05, tests=None):
+    """
+    执行统计检验并返回结果字典。
+
+    rng 为置换检验使用的 np.random.Generator；为 None 时使用 numpy 全局随机状态。
+    exact_max_n、adaptive、alpha 见 permutation_test。
+    tests 为要计算的检验（TESTS 中的名称，见 select_tests），默认为全部；
+    未选择的检验不计算，其结果键也不出现在返回的字典中。
+    """
+    tests = select_tests(tests)
     results = {}
-    unique_data = np.unique(data)
+    total = len(data)
 
     # T检验
-    if len(unique_data) > 1:
-        t_stat, t_p = stats.ttest_1samp(data, 0, nan_policy='omit')
-        results['t_statistic'] = t_stat
-        results['t_p_value'] = t_p
-    else:
-        results['t_statistic'] = np.nan
-        results['t_p_value'] = np.nan
+    if 't' in tests:
+        if len(np.unique(data)) > 1:
+            t_stat, t_p = stats.ttest_1samp(data, 0, nan_policy='omit')
+            results['t_statistic'] = t_stat
+            results['t_p_value'] = t_p
+        else:
+            results['t_statistic'] = np.nan
+            results['t_p_value'] = np.nan
 
     # Patell Z 检验
-    patell_z_stat, patell_p_value = patell_z_test(data)
-    results['patell_statistic'] = patell_z_stat
-    results['patell_p_value'] = patell_p_value
+    if 'patell' in tests:
+        results['patell_statistic'], results['patell_p_value'] = patell_z_test(data)
 
     # Wilcoxon 符号秩检验
-    try:
-        if np.all(data == 0):
+    if 'wilcoxon' in tests:
+        try:
+            if np.all(data == 0):
+                results['wilcoxon_statistic'] = np.nan
+                results['wilcoxon_p_value'] = np.nan
+            else:
+                wilcoxon_stat, wilcoxon_p = stats.wilcoxon(data, zero_method='wilcox', correction=False, alternative='two-sided')
+                results['wilcoxon_statistic'] = wilcoxon_stat
+                results['wilcoxon_p_value'] = wilcoxon_p
+        except Exception as e:
             results['wilcoxon_statistic'] = np.nan
             results['wilcoxon_p_value'] = np.nan
-        else:
-            wilcoxon_stat, wilcoxon_p = stats.wilcoxon(data, zero_method='wilcox', correction=False, alternative='two-sided')
-            results['wilcoxon_statistic'] = wilcoxon_stat
-            results['wilcoxon_p_value'] = wilcoxon_p
-    except Exception as e:
-        results['wilcoxon_statistic'] = np.nan
-        results['wilcoxon_p_value'] = np.nan
 
     # 单变量符号检验
-    num_positive = np.sum(data > 0)
-    total = len(data)
-    if total > 0:
-        binom_result = stats.binomtest(num_positive, n=total, p=0.5, alternative='two-sided')
-        results['binomial_statistic'] = binom_result.statistic
-        results['binomial_p_value'] = binom_result.pvalue
-    else:
-        results['binomial_statistic'] = np.nan
-        results['binomial_p_value'] = np.nan
+    if 'binomial' in tests:
+        if total > 0:
+            binom_result = stats.binomtest(np.sum(data > 0), n=total, p=0.5, alternative='two-sided')
+            results['binomial_statistic'] = binom_result.statistic
+            results['binomial_p_value'] = binom_result.pvalue
+        else:
+            results['binomial_statistic'] = np.nan
+            results['binomial_p_value'] = np.nan
 
     # 广义符号检验（Permutation Test）
-    if total > 0:
-        permuted_means = []
-        for _ in range(num_permutations):
-            permuted_data = np.random.choice([1, -1], size=total) * data
-            permuted_mean = np.mean(permuted_data)
-            permuted_means.append(permuted_mean)
-        observed_mean = np.mean(data)
-        permuted_means = np.array(permuted_means)
-        p_value_perm = np.mean(np.abs(permuted_means) >= np.abs(observed_mean))
-        results['permutation_statistic'] = observed_mean
-        results['permutation_p_value'] = p_value_perm
-    else:
-        results['permutation_statistic'] = np.nan
-        results['permutation_p_value'] = np.nan
+    if 'permutation' in tests:
+        if total > 0:
+            observed_mean, p_value_perm = permutation_test(
+                data, num_permutations=num_permutations, rng=rng,
+                exact_max_n=exact_max_n, adaptive=adaptive, alpha=alpha
+            )
+            results['permutation_statistic'] = observed_mean
+            results['permutation_p_value'] = p_value_perm
+        else:
+            results['permutation_statistic'] = np.nan
+            results['permutation_p_value'] = np.nan
 
     # Corrado 符号秩检验
-    corrado_z_stat, corrado_p_value = corrado_signed_rank_test(data)
-    results['corrado_statistic'] = corrado_z_stat
-    results['corrado_p_value'] = corrado_p_value
+    if 'corrado' in tests:
+        results['corrado_statistic'], results['corrado_p_value'] = corrado_signed_rank_test(data)
+
+    return results
+
+# run_tests 中的检验名称及返回的检验结果键，按输出顺序排列
+TESTS = ('t', 'patell', 'wilcoxon', 'binomial', 'permutation', 'corrado')
+TEST_KEYS = ('t_statistic', 't_p_value', 'patell_statistic', 'patell_p_value',
+             'wilcoxon_statistic', 'wilcoxon_p_value', 'binomial_statistic', 'binomial_p_value',
+             'permutation_statistic', 'permutation_p_value', 'corrado_statistic', 'corrado_p_value')
+
+# standardized_tests 中的检验名称（基于估计窗口方差，只在每日截面上计算）
+STANDARDIZED_TESTS = ('patell_sr', 'bmp', 'kp')
+
+def select_tests(tests=None):
+    """
+    规范化检验选择：None 表示全部检验，也可传入单个名称或名称序列，
+    名称取自 TESTS 与 STANDARDIZED_TESTS。返回按输出顺序排列的名称元组；未知名称引发 ValueError。
+    """
+    if tests is None:
+        return TESTS + STANDARDIZED_TESTS
+    if isinstance(tests, str):
+        tests = [tests]
+    tests = set(tests)
+    unknown = sorted(tests.difference(TESTS + STANDARDIZED_TESTS))
+    if unknown:
+        raise ValueError(f"Unknown tests: {unknown}; available: {list(TESTS + STANDARDIZED_TESTS)}")
+    return tuple(name for name in TESTS + STANDARDIZED_TESTS if name in tests)
+
+def test_keys(tests=None):
+    """返回所选检验的结果键（TEST_KEYS 与 STANDARDIZED_KEYS 中的子集，顺序不变）。"""
+    names = {f'{name}_{suffix}' for name in select_tests(tests) for suffix in ('statistic', 'p_value')}
+    return tuple(key for key in TEST_KEYS + STANDARDIZED_KEYS if key in names)
+
+def _wilcoxon_block(block):
+    """对 (n, m) 数据块逐列做 Wilcoxon 符号秩检验；全零或无法计算的列为 NaN。"""
+    m = block.shape[1]
+    statistic = np.full(m, np.nan)
+    p_value = np.full(m, np.nan)
+    valid = np.any(block != 0, axis=0)
+    if not valid.any():
+        return statistic, p_value
+
+    # method='auto' 依据整个数组是否存在零值或结值选择精确/渐近方法，
+    # 因此按该条件把列分开调用，以保证结果与逐列调用一致
+    magnitude = np.sort(np.abs(block), axis=0)
+    irregular = np.any(magnitude == 0, axis=0) | np.any(np.diff(magnitude, axis=0) == 0, axis=0)
+
+    for cols in (np.flatnonzero(valid & irregular), np.flatnonzero(valid & ~irregular)):
+        if len(cols) == 0:
+            continue
+        try:
+            res = stats.wilcoxon(block[:, cols], zero_method='wilcox', correction=False,
+                                 alternative='two-sided', axis=0)
+            statistic[cols] = res.statistic
+            p_value[cols] = res.pvalue
+        except Exception:
+            for j in cols:
+                try:
+                    res = stats.wilcoxon(block[:, j], zero_method='wilcox', correction=False,
+                                         alternative='two-sided')
+                    statistic[j], p_value[j] = res.statistic, res.pvalue
+                except Exception:
+                    pass
+    return statistic, p_value
+
+def _permutation_block(block, num_permutations, rng, exact_max_n, adaptive=False, alpha=0.05):
+    """
+    对 (n, m) 数据块的每一列做符号翻转置换检验，所有列共用同一组符号矩阵。
+
+    adaptive=True 时与 permutation_test 相同，每块 100 次抽样后逐列检查 p 值的
+    99.9% Clopper-Pearson 区间，已完全位于 alpha 之上或之下的列停止抽样，其余列继续使用后续的符号矩阵。
+    """
+    n, m = block.shape
+    observed = np.mean(block, axis=0)
+    threshold = np.abs(np.sum(block, axis=0)) - 1e-12 * np.sum(np.abs(block), axis=0)
+
+    if n <= exact_max_n:
+        patterns = (np.arange(2 ** n)[:, None] >> np.arange(n)) & 1
+        signs = 1 - 2 * patterns
+        return observed, np.mean(np.abs(signs @ block) >= threshold, axis=0)
+
+    random = np.random if rng is None else rng
+    chunk_size = 100 if adaptive else max(1, (1 << 22) // max(n * m, 1))
+    extreme = np.zeros(m)
+    drawn = np.zeros(m)
+    active = np.arange(m)
+    total = 0
+    while total < num_permutations and len(active):
+        size = min(chunk_size, num_permutations - total)
+        signs = random.choice([1, -1], size=(size, n))
+        columns = block if len(active) == m else block[:, active]
+        extreme[active] += np.sum(np.abs(signs @ columns) >= threshold[active], axis=0)
+        drawn[active] += size
+        total += size
+        if adaptive and total < num_permutations:
+            hits, draws = extreme[active], drawn[active]
+            with np.errstate(invalid='ignore'):
+                lower = np.where(hits > 0, stats.beta.ppf(0.0005, hits, draws - hits + 1), 0.0)
+                upper = np.where(hits < draws, stats.beta.ppf(0.9995, hits + 1, draws - hits), 1.0)
+            active = active[(upper >= alpha) & (lower <= alpha)]
+    return observed, extreme / drawn
+
+def _tests_block(block, num_permutations, rng, exact_max_n, tests=TESTS, adaptive=False, alpha=0.05):
+    """对没有缺失值的 (n, m) 数据块逐列执行 tests 中的检验，返回 {检验键: 长度为 m 的数组}。"""
+    n, m = block.shape
+    out = {}
+
+    # T检验（常数列为 NaN）
+    if 't' in tests:
+        constant = np.ptp(block, axis=0) == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_res = stats.ttest_1samp(block, 0, axis=0)
+        out['t_statistic'] = np.where(constant, np.nan, t_res.statistic)
+        out['t_p_value'] = np.where(constant, np.nan, t_res.pvalue)
+
+    # Patell Z 检验
+    if 'patell' in tests:
+        if n >= 2:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                standardized = (block - np.mean(block, axis=0)) / np.std(block, axis=0, ddof=1)
+                z_stat = np.sum(standardized, axis=0) / np.sqrt(n)
+            out['patell_statistic'] = z_stat
+            out['patell_p_value'] = 2 * (1 - stats.norm.cdf(np.abs(z_stat)))
+        else:
+            out['patell_statistic'] = np.full(m, np.nan)
+            out['patell_p_value'] = np.full(m, np.nan)
+
+    # Wilcoxon 符号秩检验
+    if 'wilcoxon' in tests:
+        out['wilcoxon_statistic'], out['wilcoxon_p_value'] = _wilcoxon_block(block)
+
+    # 单变量符号检验（p=0.5 时双侧二项检验的 p 值等于较小尾部概率的两倍）
+    if 'binomial' in tests:
+        num_positive = np.sum(block > 0, axis=0)
+        out['binomial_statistic'] = num_positive / n
+        out['binomial_p_value'] = np.minimum(1.0, 2 * stats.binom.cdf(np.minimum(num_positive, n - num_positive), n, 0.5))
+
+    # 广义符号检验（Permutation Test）
+    if 'permutation' in tests:
+        out['permutation_statistic'], out['permutation_p_value'] = _permutation_block(
+            block, num_permutations, rng, exact_max_n, adaptive, alpha)
+
+    # Corrado 符号秩检验
+    if 'corrado' in tests:
+        if n >= 2:
+            ranks = stats.rankdata(np.abs(block), axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                z_stat = np.sum(np.sign(block) * ranks, axis=0) / np.sqrt(np.sum(ranks ** 2, axis=0))
+            out['corrado_statistic'] = z_stat
+            out['corrado_p_value'] = 2 * (1 - stats.norm.cdf(np.abs(z_stat)))
+        else:
+            out['corrado_statistic'] = np.full(m, np.nan)
+            out['corrado_p_value'] = np.full(m, np.nan)
+
+    return out
+
+def run_tests_batch(matrix, axis=0, min_count=1, num_permutations=1000, rng=None, exact_max_n=10,
+                    adaptive=False, alpha=0.05, tests=None):
+    """
+    对矩阵的每一列（沿 axis 方向的每个截面）同时执行 run_tests 中的检验。
+
+    matrix 可为 事件 × 事件日（× 模型）的数组，NaN 表示缺失。各检验与观测顺序无关，
+    因此先把每列的 NaN 排到末尾，再按有效样本量把列分组，每组以一个稠密数据块
+    调用带 axis 参数的向量化 NumPy/SciPy 函数。有效样本量小于 min_count 的列结果为 NaN。
+    置换检验的所有列共用同一组符号矩阵；adaptive=True 时各列按 permutation_test 的
+    Clopper-Pearson 规则分别提前停止，否则总是抽满 num_permutations 次。
+    tests 同 run_tests：只计算并返回所选检验；没有可计算的列时不做任何排序与检验。
+
+    返回：{检验键: 数组}，数组形状为 matrix 去掉 axis 维度后的形状。
+    """
+    tests = tuple(name for name in select_tests(tests) if name in TESTS)
+    keys = test_keys(tests)
+    values = np.moveaxis(np.asarray(matrix, dtype=float), axis, 0)
+    shape = values.shape[1:]
+    values = values.reshape(values.shape[0], -1)
+    results = {key: np.full(values.shape[1], np.nan) for key in keys}
+    if not keys or values.shape[0] < max(min_count, 1):
+        return {key: value.reshape(shape) for key, value in results.items()}
+
+    counts = np.sum(~np.isnan(values), axis=0)
+    compact = np.sort(values, axis=0)
+
+    for n in np.unique(counts):
+        if n < max(min_count, 1):
+            continue
+        cols = np.flatnonzero(counts == n)
+        block_results = _tests_block(compact[:n, cols], num_permutations, rng, exact_max_n, tests, adaptive, alpha)
+        for key in keys:
+            results[key][cols] = block_results[key]
+
+    return {key: value.reshape(shape) for key, value in results.items()}
+
+# standardized_tests 返回的检验结果键
+STANDARDIZED_KEYS = ('patell_sr_statistic', 'patell_sr_p_value', 'bmp_statistic', 'bmp_p_value',
+                     'kp_statistic', 'kp_p_value')
+
+def standardized_tests(sar, dof=None, r_bar=0.0, axis=0, tests=None):
+    """
+    基于估计窗口方差的标准化残差检验，对 事件 × 事件日 矩阵的每一列同时计算：
+
+    - Patell 检验：Z = ΣSAR / sqrt(Σ dof/(dof-2))，其中 SAR 已用估计窗口残差方差
+      及预测误差修正项 x0'(X'X)^-1 x0 标准化，dof 为估计窗口的残差自由度；
+    - Boehmer-Musumeci-Poulsen（BMP）检验：用 SAR 的截面标准差代替理论方差，
+      对事件引起的方差增大稳健；
+    - Kolari-Pynnönen（KP）检验：按估计窗口残差的平均截面相关系数 r_bar 调整 BMP 统计量，
+      t_KP = t_BMP * sqrt((1 - r_bar) / (1 + (N - 1) * r_bar))。
+
+    sar 中的 NaN 表示缺失；dof 为与 sar 同形状的矩阵或 None（此时 SAR 方差视为 1）。
+    tests 为所选检验（见 select_tests），只返回其中属于 STANDARDIZED_TESTS 的结果。
+    返回：{检验键: 数组}，数组形状为 sar 去掉 axis 维度后的形状。
+    """
+    sar = np.moveaxis(np.asarray(sar, dtype=float), axis, 0)
+    valid = ~np.isnan(sar)
+    n = np.sum(valid, axis=0)
+
+    if dof is None:
+        variance = valid.astype(float)
+    else:
+        dof = np.moveaxis(np.asarray(dof, dtype=float), axis, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variance = np.where(valid & (dof > 2), dof / (dof - 2), np.where(valid, np.nan, 0.0))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        total = np.nansum(sar, axis=0)
+        patell = np.where(n > 0, total / np.sqrt(np.sum(variance, axis=0)), np.nan)
+
+        mean = np.where(n > 0, total / np.maximum(n, 1), np.nan)
+        deviation = np.where(valid, sar - mean, 0.0)
+        sd = np.sqrt(np.sum(deviation ** 2, axis=0) / (n - 1))
+        bmp = np.where(n > 1, mean / (sd / np.sqrt(n)), np.nan)
+        kp = bmp * np.sqrt((1 - r_bar) / (1 + (n - 1) * r_bar))
+
+    df = np.maximum(n - 1, 1)
+    results = {
+        'patell_sr_statistic': patell,
+        'patell_sr_p_value': 2 * stats.norm.sf(np.abs(patell)),
+        'bmp_statistic': bmp,
+        'bmp_p_value': 2 * stats.t.sf(np.abs(bmp), df),
+        'kp_statistic': kp,
+        'kp_p_value': 2 * stats.t.sf(np.abs(kp), df),
+    }
+    return {key: results[key] for key in test_keys(tests) if key in results}
+
+
+class ResidualCorrelation:
+    """
+    估计窗口标准化残差的平均截面相关系数（Kolari-Pynnönen 检验中的 r_bar）。
+
+    按日期维护 S_t = Σu、Q_t = Σu² 与样本数 C_t，两两乘积之和为 Σ(S_t² - Q_t)，
+    配对数为 Σ(C_t² - C_t)，因此无需构造事件 × 事件的相关矩阵；
+    各块的和可直接相加，适合按块处理事件。
+    """
+
+    def __init__(self):
+        self.sums = None
+
+    def update(self, dates, residuals):
+        """并入多个事件的估计窗口标准化残差（dates、residuals 为等长数组的列表）。"""
+        if not dates:
+            return
+        u = np.concatenate(residuals).astype(float)
+        frame = pd.DataFrame({'S': u, 'Q': u * u, 'C': np.ones(len(u))},
+                             index=np.concatenate(dates).astype('datetime64[ns]'))
+        frame = frame[np.isfinite(u)]
+        sums = frame.groupby(level=0).sum()
+        self.sums = sums if self.sums is None else self.sums.add(sums, fill_value=0.0)
+
+    def merge(self, other):
+        """并入另一个 ResidualCorrelation 的按日期累计和（如其他分片或节点上的结果）。"""
+        if other.sums is not None:
+            self.sums = other.sums if self.sums is None else self.sums.add(other.sums, fill_value=0.0)
 
-    return results
\ No newline at end of file
+    def value(self):
+        """返回平均截面相关系数；没有重叠日期时返回 0。"""
+        if self.sums is None:
+            return 0.0
+        pairs = np.sum(self.sums['C'] ** 2 - self.sums['C'])
+        if pairs <= 0:
+            return 0.0
+        return float(np.sum(self.sums['S'] ** 2 - self.sums['Q']) / pairs)
@@ -0,0 +1,89 @@
+# event_study/streaming.py
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from .statistical_tests import select_tests
+
+
+class DailyAccumulator:
+    """
+    按 (列, 事件日) 维护运行中的充分统计量：样本数、均值、离差平方和与正值个数。
+
+    各块的统计量用 Chan 等人的合并公式并入，数值上比直接累加平方和更稳定；
+    占用内存只与事件日数和列数有关，与事件数无关。
+    """
+
+    def __init__(self, columns, day_column='EventDay'):
+        self.columns = list(columns)
+        self.day_column = day_column
+        # {列: {事件日: [样本数, 均值, 离差平方和, 正值个数]}}
+        self.stats = {col: {} for col in self.columns}
+
+    def update(self, frame):
+        """并入一个数据块（包含事件日列与各统计列的长表）。"""
+        for col in self.columns:
+            values = frame[[self.day_column, col]].dropna()
+            if values.empty:
+                continue
+            # 紧凑类型模式下的 float32 列在 float64 下汇总
+            grouped = values[col].astype(np.float64).groupby(values[self.day_column])
+            count = grouped.count()
+            mean = grouped.mean()
+            m2 = grouped.var(ddof=0) * count
+            positive = (values[col] > 0).groupby(values[self.day_column]).sum()
+
+            day_stats = self.stats[col]
+            for day in count.index:
+                n_b, mean_b, m2_b, pos_b = count[day], mean[day], m2[day], positive[day]
+                if day not in day_stats:
+                    day_stats[day] = [n_b, mean_b, m2_b, pos_b]
+                    continue
+                n_a, mean_a, m2_a, pos_a = day_stats[day]
+                n = n_a + n_b
+                delta = mean_b - mean_a
+                day_stats[day] = [n, mean_a + delta * n_b / n, m2_a + m2_b + delta ** 2 * n_a * n_b / n, pos_a + pos_b]
+
+    def summary(self, column, mean_label, tests=None):
+        """
+        由充分统计量计算每日均值及可得的检验：t 检验与符号检验（二项检验）。
+
+        Wilcoxon、置换与 Corrado 检验需要完整样本，流式模式下不提供；
+        tests 为所选检验（见 select_tests），未选择的检验不计算。
+        """
+        tests = select_tests(tests)
+        day_stats = self.stats[column]
+        days = np.array(sorted(day_stats), dtype=np.int64)
+        values = np.array([day_stats[day] for day in days], dtype=float).reshape(-1, 4)
+        n, mean, m2, positive = values.T
+
+        table = {'EventDay': days, mean_label: mean, 'N': n.astype(np.int64)}
+        if 't' in tests:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                variance = np.where(n > 1, m2 / (n - 1), np.nan)
+                t_stat = np.where(variance > 0, mean / np.sqrt(variance / n), np.nan)
+            table['t_statistic'] = t_stat
+            table['t_p_value'] = 2 * stats.t.sf(np.abs(t_stat), n - 1)
+        if 'binomial' in tests:
+            table['Binomial_statistic'] = positive / n
+            table['Binomial_p_value'] = np.minimum(1.0, 2 * stats.binom.cdf(np.minimum(positive, n - positive), n, 0.5))
+
+        return pd.DataFrame(table)
+
+
+class CsvSink:
+    """逐块追加写入的 CSV 输出；首次写入时写表头，之后只追加数据行。"""
+
+    def __init__(self, path, overwrite=True):
+        self.path = path
+        if overwrite and os.path.exists(path):
+            os.remove(path)
+
+    def append(self, frame):
+        if frame.empty:
+            return
+        header = not os.path.exists(self.path)
+        frame.to_csv(self.path, mode='a', header=header, index=False)
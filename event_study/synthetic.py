@@ -0,0 +1,191 @@
+# event_study/synthetic.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import parquet_available
+
+# 各因子的日收益均值与标准差（RiskPremium1 为市场超额收益，Retindex = RiskPremium1 + 无风险利率）
+FACTOR_MOMENTS = {
+    'RiskPremium1': (0.0003, 0.012),
+    'SMB1': (0.0001, 0.005),
+    'HML1': (0.0001, 0.004),
+    'RMW1': (0.0001, 0.003),
+    'CMA1': (0.0000, 0.003),
+}
+
+# 与 run_event_study 默认参数一致的文件名（不含扩展名）
+FILE_NAMES = {
+    'event_file': 'Event',
+    'firm_file': 'Firm',
+    'market_file': 'Market',
+    'ff_factors_file': 'FF factor',
+}
+
+# Excel 工作表的行数上限
+EXCEL_MAX_ROWS = 1048575
+
+def trading_days(start, n_years, holidays_per_year, rng, business_days=True):
+    """
+    以工作日为基础、随机剔除节假日，生成 n_years 年的交易日序列；
+    business_days=False 时每个自然日都是交易日（与示例数据一致），不剔除节假日。
+    """
+    start = pd.Timestamp(start)
+    end = start + pd.DateOffset(years=n_years) - pd.Timedelta(days=1)
+    if not business_days:
+        return pd.date_range(start, end).to_numpy(dtype='datetime64[ns]')
+    days = pd.bdate_range(start, end)
+    n_holidays = min(int(round(holidays_per_year * n_years)), len(days) // 2)
+    holidays = rng.choice(len(days), size=n_holidays, replace=False)
+    return days.delete(holidays).to_numpy(dtype='datetime64[ns]')
+
+def _factor_returns(n_days, rng, risk_free=0.0001):
+    """生成市场收益与 FF 因子收益，返回 (Retindex, {因子: 收益})。"""
+    factors = {name: rng.normal(mean, sd, n_days) for name, (mean, sd) in FACTOR_MOMENTS.items()}
+    # 市场与 SMB 弱负相关，更接近实际数据
+    factors['SMB1'] -= 0.2 * factors['RiskPremium1'] * FACTOR_MOMENTS['SMB1'][1] / FACTOR_MOMENTS['RiskPremium1'][1]
+    market = factors['RiskPremium1'] + risk_free + rng.normal(0.0, 0.0005, n_days)
+    return market, factors
+
+def _firm_lifetimes(n_firms, n_days, days_per_year, rng, listed_share=0.6, delist_rate=0.1):
+    """
+    每家公司的上市与退市位置（日期轴上的 [first, last)）：listed_share 比例的公司在样本开始前已上市，
+    其余在前 70% 的样本期内上市；delist_rate 比例的公司在上市一年后的某天退市。
+    """
+    first = np.where(rng.random(n_firms) < listed_share, 0, rng.integers(0, max(int(n_days * 0.7), 1), n_firms))
+    last = np.full(n_firms, n_days)
+    delisted = rng.random(n_firms) < delist_rate
+    earliest = np.minimum(first + int(days_per_year), n_days - 1)
+    last[delisted] = rng.integers(earliest[delisted], n_days)
+    return first, np.maximum(last, first + 1)
+
+def _trading_mask(first, last, n_days, rng, suspensions_per_year, mean_suspension, missing_rate, days_per_year):
+    """
+    一批公司的有效交易日掩码 (公司数, 交易日数)：上市期内交易，减去停牌区间与零星缺失日。
+    停牌次数服从泊松分布，持续天数服从几何分布，少数停牌持续数月。
+    """
+    axis = np.arange(n_days)
+    mask = (axis >= first[:, None]) & (axis < last[:, None])
+    mask &= rng.random(mask.shape) >= missing_rate
+
+    years = (last - first) / days_per_year
+    counts = rng.poisson(suspensions_per_year * years)
+    for firm in np.flatnonzero(counts):
+        starts = rng.integers(first[firm], last[firm], counts[firm])
+        lengths = rng.geometric(1.0 / mean_suspension, counts[firm])
+        long_spells = rng.random(counts[firm]) < 0.05
+        lengths[long_spells] *= 10
+        for start, length in zip(starts, lengths):
+            mask[firm, start:start + length] = False
+    return mask
+
+def generate_panel(n_firms=500, n_years=5, n_events=2000, start='2000-01-01', seed=None,
+                   holidays_per_year=10, suspensions_per_year=0.5, mean_suspension=8, missing_rate=0.01,
+                   listed_share=0.6, delist_rate=0.1, unknown_event_share=0.001, business_days=True,
+                   firm_batch=256):
+    """
+    生成可复现的合成面板数据，列结构与 run_event_study 的输入文件一致。
+
+    参数：
+    - n_firms、n_years、n_events：公司数、样本年数与事件数（如 5000 × 20 × 50000）。
+    - start：样本起始日期。
+    - seed：随机种子；相同的参数与种子生成完全相同的数据。
+    - holidays_per_year：每年从工作日中剔除的节假日数，市场与因子只包含交易日。
+    - suspensions_per_year、mean_suspension：每家公司每年的平均停牌次数与平均停牌天数。
+    - missing_rate：上市期内零星缺失的交易日比例。
+    - listed_share、delist_rate：样本开始前已上市与样本期内退市的公司比例。
+    - unknown_event_share：股票代码不在公司表中的事件比例。
+    - business_days：True 时只有工作日（剔除节假日）为交易日；False 时每个自然日都有数据，
+      此时以自然日计的窗口（window_unit='calendar'）才有足够的估计样本。
+    - firm_batch：每批生成的公司数，用于控制内存。
+
+    公司收益由五因子模型加 t 分布扰动生成，各公司的因子载荷不同。事件日期在公司上市期内的
+    自然日中均匀抽取，因此包含非交易日、停牌期间以及估计窗口样本不足的事件。
+
+    返回：(event_data, firm_data, market_data, ff_factors) 四个 DataFrame。
+    """
+    rng = np.random.default_rng(seed)
+    dates = trading_days(start, n_years, holidays_per_year, rng, business_days)
+    n_days = len(dates)
+
+    market, factors = _factor_returns(n_days, rng)
+    market_data = pd.DataFrame({'Date': dates, 'Retindex': market})
+    ff_factors = pd.DataFrame({'Date': dates, **factors})
+    factor_matrix = np.column_stack([factors[name] for name in FACTOR_MOMENTS])
+
+    symbols = np.array([f'{i + 1:06d}' for i in range(n_firms)])
+    first, last = _firm_lifetimes(n_firms, n_days, n_days / n_years, rng, listed_share, delist_rate)
+
+    codes, positions, returns = [], [], []
+    for begin in range(0, n_firms, firm_batch):
+        batch = slice(begin, min(begin + firm_batch, n_firms))
+        size = batch.stop - batch.start
+        loadings = np.column_stack([
+            rng.normal(1.0, 0.3, size),
+            rng.normal(0.3, 0.5, size),
+            rng.normal(0.1, 0.4, size),
+            rng.normal(0.0, 0.3, size),
+            rng.normal(0.0, 0.3, size),
+        ])
+        alpha = rng.normal(0.0, 0.0003, size)
+        volatility = rng.uniform(0.01, 0.03, size)
+        noise = rng.standard_t(5, (size, n_days)) * (volatility / np.sqrt(5 / 3))[:, None]
+        batch_returns = alpha[:, None] + loadings @ factor_matrix.T + noise
+
+        mask = _trading_mask(first[batch], last[batch], n_days, rng, suspensions_per_year, mean_suspension,
+                             missing_rate, n_days / n_years)
+        firm_index, day_index = np.nonzero(mask)
+        codes.append((firm_index + batch.start).astype(np.int32))
+        positions.append(day_index.astype(np.int32))
+        returns.append(batch_returns[firm_index, day_index])
+
+    codes = np.concatenate(codes)
+    firm_data = pd.DataFrame({
+        'Stkcd': pd.Categorical.from_codes(codes, symbols),
+        'Date': dates[np.concatenate(positions)],
+        'Dretnd': np.concatenate(returns),
+    })
+
+    # 事件日期：按上市天数加权抽取公司，再在其上市期内的自然日中均匀抽取
+    weights = (last - first) / np.sum(last - first)
+    event_firms = rng.choice(n_firms, size=n_events, p=weights)
+    listing = dates[first[event_firms]]
+    delisting = dates[last[event_firms] - 1]
+    span = (delisting - listing).astype('timedelta64[D]').astype(np.int64) + 1
+    offsets = (rng.random(n_events) * span).astype(np.int64)
+    event_dates = (listing.astype('datetime64[D]') + offsets).astype('datetime64[ns]')
+    event_symbols = symbols[event_firms].astype(object)
+    unknown = rng.random(n_events) < unknown_event_share
+    event_symbols[unknown] = [f'{n_firms + 1 + i:06d}' for i in range(int(unknown.sum()))]
+    event_data = pd.DataFrame({'Symbol': event_symbols, 'Date': event_dates})
+
+    return event_data, firm_data, market_data, ff_factors
+
+def write_panel(tables, directory, file_format='parquet'):
+    """
+    把 generate_panel 的结果写入 directory，文件名与 run_event_study 的默认文件名一致。
+
+    file_format 为 'parquet'、'csv' 或 'xlsx'；无 pyarrow 时 'parquet' 改用 'csv'。
+    返回 {run_event_study 参数名: 文件路径}，可直接以 **paths 传入 run_event_study。
+    """
+    if file_format not in ('parquet', 'csv', 'xlsx'):
+        raise ValueError(f"Unknown file_format: {file_format}")
+    if file_format == 'parquet' and not parquet_available():
+        file_format = 'csv'
+    if file_format == 'xlsx' and max(len(table) for table in tables) > EXCEL_MAX_ROWS:
+        raise ValueError("The panel exceeds Excel's row limit; use file_format='parquet' or 'csv'.")
+
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for (argument, name), table in zip(FILE_NAMES.items(), tables):
+        path = os.path.join(directory, f'{name}.{file_format}')
+        if file_format == 'parquet':
+            table.to_parquet(path, index=False)
+        elif file_format == 'csv':
+            table.to_csv(path, index=False)
+        else:
+            table.to_excel(path, index=False)
+        paths[argument] = path
+    return paths
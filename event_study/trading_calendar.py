@@ -0,0 +1,54 @@
+# event_study/trading_calendar.py
+
+import numpy as np
+import pandas as pd
+
+
+class TradingCalendar:
+    """
+    由市场收益序列构建的交易日历，只构建一次。
+
+    除排序后的交易日数组外，还预先计算一张按自然日编号的查找表：
+    lookup[d] 为第 d 个自然日（相对首个交易日）当天或之后的第一个交易日序号，
+    因此任意日期到交易日序号的转换都是 O(1) 的数组索引。
+    """
+
+    def __init__(self, dates):
+        self.dates = np.unique(np.asarray(dates, dtype='datetime64[ns]'))
+        days = self.dates.astype('datetime64[D]').astype(np.int64)
+        self.origin = int(days[0]) if len(days) else 0
+        span = int(days[-1]) - self.origin + 1 if len(days) else 0
+        self.lookup = np.searchsorted(days, self.origin + np.arange(span)).astype(np.int64)
+
+    @classmethod
+    def from_market(cls, market_data):
+        """从市场收益表的 'Date' 列构建交易日历。"""
+        return cls(market_data['Date'].to_numpy())
+
+    def __len__(self):
+        return len(self.dates)
+
+    def ordinals(self, dates):
+        """
+        将日期（标量或数组）转换为交易日序号：非交易日映射到其后的第一个交易日；
+        早于首个交易日的日期为 0，晚于最后一个交易日的日期为 len(self)。
+        """
+        days = np.asarray(pd.to_datetime(dates), dtype='datetime64[D]').astype(np.int64) - self.origin
+        inside = np.clip(days, 0, max(len(self.lookup) - 1, 0))
+        result = np.where(days < 0, 0, np.where(days >= len(self.lookup), len(self.dates), self.lookup[inside]))
+        return result if result.ndim else int(result)
+
+    def ordinal(self, date):
+        """返回单个日期的交易日序号。"""
+        return int(self.ordinals(date))
+
+    def window_dates(self, first, last):
+        """
+        返回交易日序号区间 [first, last]（截断到日历范围内）对应的起止日期；
+        区间为空时返回 None。
+        """
+        first = max(first, 0)
+        last = min(last, len(self.dates) - 1)
+        if first > last:
+            return None
+        return pd.Timestamp(self.dates[first]), pd.Timestamp(self.dates[last])
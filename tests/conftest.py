@@ -0,0 +1,44 @@
+# tests/conftest.py
+
+import pytest
+
+from event_study.main import compute_event_study
+from event_study.synthetic import generate_panel, write_panel
+
+# 小规模合成面板：交易日窗口下几秒内即可跑完全部入口
+PANEL = dict(n_firms=20, n_years=3, n_events=40, seed=0)
+
+# 各测试共用的运行参数；给定 seed 使置换检验可复现
+OPTIONS = dict(window_unit='trading', estimation_window_days=120, seed=1)
+
+@pytest.fixture(scope='session')
+def panel():
+    """(event_data, firm_data, market_data, ff_factors)"""
+    return generate_panel(**PANEL)
+
+@pytest.fixture(scope='session')
+def panel_files(panel, tmp_path_factory):
+    """共用面板写成的输入文件：{run_event_study 参数名: 文件路径}。"""
+    return write_panel(panel, str(tmp_path_factory.mktemp('panel')))
+
+@pytest.fixture(scope='session')
+def options():
+    return dict(OPTIONS)
+
+@pytest.fixture(scope='session')
+def compute(panel, options):
+    """
+    compute(**overrides) 在共用面板上运行 compute_event_study（参数为 OPTIONS 加 overrides），
+    返回 (逐事件汇总表, 每日检验表)；相同参数的运行只计算一次。
+    """
+    runs = {}
+
+    def run(**overrides):
+        key = tuple(sorted(overrides.items()))
+        if key not in runs:
+            results, daily_tables = compute_event_study(*panel, **{**options, **overrides})
+            assert results is not None
+            runs[key] = (results.to_frame(), daily_tables)
+        return runs[key]
+
+    return run
@@ -0,0 +1,53 @@
+# tests/test_car_calculations.py
+
+import numpy as np
+import pandas as pd
+
+from event_study import car_calculations
+from event_study.car_calculations import calculate_CAR_AR
+from event_study.main import compute_event_study
+from event_study.results import EVENT_TESTS
+from event_study.trading_calendar import TradingCalendar
+
+def test_test_subset_matches_full_run(compute):
+    summary, daily_tables = compute(tests=('t', 'binomial'))
+    full_summary, full_daily_tables = compute()
+    assert set(summary.columns) < set(full_summary.columns)
+    pd.testing.assert_frame_equal(summary, full_summary[summary.columns])
+    for key, table in daily_tables.items():
+        assert set(table.columns) < set(full_daily_tables[key].columns)
+        pd.testing.assert_frame_equal(table, full_daily_tables[key][table.columns])
+
+def test_event_tests_skip_daily_only_tests(panel, options, monkeypatch):
+    # 逐事件序列上不计算 Patell 与 Corrado；交易日窗口中每个事件日只有一行，不构建每日矩阵
+    selected = []
+    run_tests = car_calculations.run_tests
+
+    def recording_run_tests(data, tests=None, **kwargs):
+        selected.append(tests)
+        return run_tests(data, tests=tests, **kwargs)
+
+    monkeypatch.setattr(car_calculations, 'run_tests', recording_run_tests)
+    monkeypatch.setattr(car_calculations, 'event_day_matrix', None)
+    results, _ = compute_event_study(*panel, **options)
+    assert results is not None
+    assert selected and all(tests == EVENT_TESTS for tests in selected)
+
+def test_repeated_event_days_run_daily_tests(panel):
+    # 公司表中重复的行使同一事件日有两行，每日 CAR 检验可以计算
+    event_data, firm_data, market_data, ff_factors = panel
+    models = ['MarketModel']
+    calendar = TradingCalendar.from_market(market_data)
+    for symbol, event_date in event_data[['Symbol', 'Date']].itertuples(index=False, name=None):
+        rows = firm_data[(firm_data['Stkcd'] == symbol) & (firm_data['Date'] >= event_date - pd.Timedelta(days=3))
+                         & (firm_data['Date'] <= event_date + pd.Timedelta(days=3))]
+        duplicated = pd.concat([firm_data, rows], ignore_index=True)
+        res = calculate_CAR_AR(symbol, event_date, duplicated, market_data, ff_factors, (-3, 3), 120, models,
+                               calendar=calendar, compact=True, tests=('t',))
+        if res is not None and len(rows) >= 2:
+            break
+    record, merged_event = res
+    means = merged_event.groupby('EventDay')['CAR_MarketModel'].mean()
+    np.testing.assert_array_equal(record.days, means.index)
+    np.testing.assert_allclose(record.daily_means[0], means.to_numpy(), rtol=1e-12)
+    assert record.daily_tests is not None
@@ -0,0 +1,25 @@
+# tests/test_compact.py
+
+import numpy as np
+import pandas as pd
+
+from event_study.data_loader import COMPACT_FLOAT, compact_table, load_data
+from event_study.main import check_compact_accuracy
+
+def test_compact_accuracy_passes(panel, options):
+    report = check_compact_accuracy(*panel, tolerance=1e-4, **options)
+    assert report.loc[~report['Passed'], 'Quantity'].tolist() == []
+    assert {'events', 'AR', 'CAR'} <= set(report['Quantity'])
+    assert (report.set_index('Quantity').loc[['AR', 'CAR'], 'Compared'] > 0).all()
+
+def test_compact_tables(panel, panel_files):
+    _, firm_data, _, _ = panel
+    compact = compact_table(firm_data)
+    assert isinstance(compact['Stkcd'].dtype, pd.CategoricalDtype)
+    assert compact['Dretnd'].dtype == COMPACT_FLOAT
+    assert compact['Date'].dtype == firm_data['Date'].dtype
+    np.testing.assert_allclose(compact['Dretnd'], firm_data['Dretnd'], rtol=1e-6)
+
+    loaded = load_data(**panel_files, use_cache=False, compact=True)
+    assert isinstance(loaded[0]['Symbol'].dtype, pd.CategoricalDtype)
+    assert loaded[1]['Dretnd'].dtype == COMPACT_FLOAT
@@ -0,0 +1,30 @@
+# tests/test_data_loader.py
+
+import os
+
+import pandas as pd
+import pytest
+
+from event_study.data_loader import load_table
+
+@pytest.fixture
+def firm_csv(tmp_path):
+    path = tmp_path / 'Firm.csv'
+    path.write_text('Stkcd,Date,Dretnd\n000001,2020-01-02,0.1\n,2020-01-03,0.2\n000002,2020-01-03,-0.1\n')
+    return str(path)
+
+def test_cache_round_trip(firm_csv, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    first = load_table(firm_csv, cache_dir=cache_dir)
+    assert sorted(name.rsplit('.', 1)[1] for name in os.listdir(cache_dir)) in (['json', 'parquet'], ['json', 'npz'])
+    second = load_table(firm_csv, cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(first, second, check_dtype=False)
+    assert first['Stkcd'].isna().tolist() == [False, True, False]
+    assert first['Stkcd'][0] == '000001'
+
+def test_unwritable_cache_dir_warns_and_continues(firm_csv, tmp_path):
+    blocker = tmp_path / 'not_a_directory'
+    blocker.write_text('')
+    with pytest.warns(UserWarning, match='continuing without a cache'):
+        df = load_table(firm_csv, cache_dir=str(blocker / 'cache'))
+    assert len(df) == 3
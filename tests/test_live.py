@@ -0,0 +1,94 @@
+# tests/test_live.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_study.live import EventStudySession
+from event_study.main import compute_event_study
+
+MODELS = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+WINDOW = (-1, 1)
+ESTIMATION = 120
+
+def _day(tables, date):
+    """某个交易日的 (公司收益, 市场行, 因子行)，即 append_day 的参数。"""
+    _, firm_data, market_data, ff_factors = tables
+    firm = firm_data[firm_data['Date'] == date][['Stkcd', 'Dretnd']]
+    return (firm, market_data[market_data['Date'] == date].iloc[0].to_dict(),
+            ff_factors[ff_factors['Date'] == date].iloc[0].to_dict())
+
+def _start(panel, start):
+    """以第 start 个交易日之前的历史数据开始会话，并加入全部事件。"""
+    event_data, firm_data, market_data, ff_factors = panel
+    first = np.sort(market_data['Date'].unique())[start]
+    history = [table[table['Date'] < first] for table in (firm_data, market_data, ff_factors)]
+    return EventStudySession(*history, MODELS, WINDOW, ESTIMATION, events=event_data)
+
+def _run(session, panel, dates, snapshot_at=None, path=None):
+    for i, date in enumerate(dates):
+        if i == snapshot_at:
+            session.snapshot(path)
+            session = EventStudySession.restore(path)
+        session.append_day(*_day(panel, date))
+    return session
+
+def test_live_session_matches_batch_trading_run(panel, tmp_path):
+    event_data, firm_data, market_data, ff_factors = panel
+    dates = np.sort(market_data['Date'].unique())
+    session = _run(_start(panel, 300), panel, dates[300:], snapshot_at=100, path=str(tmp_path / 'session.pkl'))
+    np.testing.assert_array_equal(session.dates, dates.astype('datetime64[ns]'))
+
+    # 与只含会话中已拟合事件的批量交易日模式运行比较
+    fitted = [state.index for state in session.events if state.status in ('done', 'active')]
+    assert fitted
+    _, daily_tables = compute_event_study(event_data.iloc[fitted].reset_index(drop=True), firm_data, market_data,
+                                          ff_factors, models_to_use=MODELS, event_window_days=WINDOW,
+                                          estimation_window_days=ESTIMATION, window_unit='trading',
+                                          tests=('t', 'binomial'))
+    for kind in ('AR', 'CAR'):
+        summary = session.summary(kind)
+        for model in MODELS:
+            mine = summary[summary['Model'] == model].reset_index(drop=True)
+            reference = daily_tables[(kind, model)]
+            columns = [col for col in reference.columns if col in mine.columns]
+            assert len(columns) > 2
+            pd.testing.assert_frame_equal(mine[columns], reference[columns], check_dtype=False, rtol=1e-10)
+
+def test_snapshot_restore_continues_identically(panel, tmp_path):
+    _, _, market_data, _ = panel
+    dates = np.sort(market_data['Date'].unique())
+    straight = _run(_start(panel, 400), panel, dates[400:460])
+    restored = _run(_start(panel, 400), panel, dates[400:460], snapshot_at=30, path=str(tmp_path / 'session.pkl'))
+
+    np.testing.assert_array_equal(restored.dates, straight.dates)
+    pd.testing.assert_frame_equal(restored.event_frame(), straight.event_frame())
+    for kind in ('AR', 'CAR'):
+        pd.testing.assert_frame_equal(restored.summary(kind), straight.summary(kind))
+
+def test_append_day_updates_active_events(panel):
+    _, _, market_data, _ = panel
+    dates = np.sort(market_data['Date'].unique())
+    session = _start(panel, 400)
+    n_dates = len(session.dates)
+    updated = [session.append_day(*_day(panel, date)) for date in dates[400:430]]
+    assert len(session.dates) == n_dates + 30
+
+    rows = pd.concat(updated, ignore_index=True)
+    assert len(rows) and rows['EventDay'].between(*WINDOW).all()
+    for _, row in rows.iterrows():
+        index = next(state.index for state in session.events
+                     if state.symbol == row['Symbol'] and state.event_date == row['EventDate'])
+        event_rows = session.event_rows(index).set_index('EventDay')
+        assert event_rows.loc[row['EventDay'], 'CAR_3F'] == pytest.approx(row['CAR_3F'])
+
+def test_append_day_rejects_old_or_mismatched_dates(panel):
+    _, _, market_data, _ = panel
+    dates = np.sort(market_data['Date'].unique())
+    session = _start(panel, 400)
+    firm, market_row, factor_row = _day(panel, dates[399])
+    with pytest.raises(ValueError):
+        session.append_day(firm, market_row, factor_row)
+    firm, market_row, _ = _day(panel, dates[400])
+    with pytest.raises(ValueError):
+        session.append_day(firm, market_row, _day(panel, dates[401])[2])
@@ -0,0 +1,18 @@
+# tests/test_panel_index.py
+
+import numpy as np
+
+from event_study.panel_index import PanelIndex
+
+def test_integer_codes_are_grouped_by_string_order(panel):
+    _, firm_data, market_data, ff_factors = panel
+    categorical = PanelIndex(firm_data, market_data, ff_factors)
+    numeric = PanelIndex(firm_data.assign(Stkcd=firm_data['Stkcd'].astype(str).astype(int)), market_data, ff_factors)
+
+    np.testing.assert_array_equal(numeric.symbols, np.sort(numeric.symbols))
+    for symbol in categorical.symbols:
+        start, end = categorical.symbol_bounds(symbol)
+        numeric_start, numeric_end = numeric.symbol_bounds(str(int(symbol)))
+        assert end > start
+        np.testing.assert_array_equal(numeric.firm_values[numeric_start:numeric_end],
+                                      categorical.firm_values[start:end])
@@ -0,0 +1,12 @@
+# tests/test_parallel.py
+
+import pandas as pd
+
+def test_parallel_matches_serial(compute):
+    serial, serial_daily = compute(n_jobs=1)
+    parallel, parallel_daily = compute(n_jobs=2, chunk_size=7)
+
+    pd.testing.assert_frame_equal(parallel, serial)
+    assert parallel_daily.keys() == serial_daily.keys()
+    for key, table in serial_daily.items():
+        pd.testing.assert_frame_equal(parallel_daily[key], table)
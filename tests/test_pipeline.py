@@ -0,0 +1,40 @@
+# tests/test_pipeline.py
+
+import pandas as pd
+import pytest
+
+from event_study.main import compute_event_study
+from event_study.output_writers import write_results
+from event_study.pipeline import run_event_study_pipelined
+
+MODELS = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+OUTPUTS = ('event_study_results.csv', 'event_study_daily_AR_results.csv', 'event_study_daily_CAR_results.csv')
+
+def _assert_same_outputs(panel, options, pipelined_dir, reference_dir, **overrides):
+    results, daily_tables = compute_event_study(*panel, **options, **overrides)
+    write_results(results, daily_tables, MODELS, 'csv', output_dir=str(reference_dir))
+    for name in OUTPUTS:
+        pd.testing.assert_frame_equal(pd.read_csv(pipelined_dir / name), pd.read_csv(reference_dir / name))
+
+@pytest.mark.parametrize('firm_sorted', [False, True])
+def test_pipelined_matches_compute_event_study(panel, panel_files, options, tmp_path, monkeypatch, firm_sorted):
+    # 公司表按 500 行分块读取，事件按每块 7 个处理，读取、计算与写出相互重叠
+    run_dir = tmp_path / 'pipelined'
+    run_dir.mkdir()
+    monkeypatch.chdir(run_dir)
+    run_event_study_pipelined(**panel_files, **options, generate_plots=False, use_cache=False, output_format='csv',
+                              chunk_size=7, read_chunk_rows=500, firm_sorted=firm_sorted)
+    _assert_same_outputs(panel, options, run_dir, tmp_path)
+
+def test_pipelined_compact_dtypes(panel, panel_files, options, tmp_path, monkeypatch):
+    run_dir = tmp_path / 'pipelined'
+    run_dir.mkdir()
+    monkeypatch.chdir(run_dir)
+    run_event_study_pipelined(**panel_files, **options, generate_plots=False, use_cache=False, output_format='csv',
+                              chunk_size=7, read_chunk_rows=500, compact_dtypes=True)
+    _assert_same_outputs(panel, options, run_dir, tmp_path, compact_dtypes=True)
+
+def test_pipelined_rejects_result_store(panel_files, options, tmp_path):
+    with pytest.raises(ValueError):
+        run_event_study_pipelined(**panel_files, **options, generate_plots=False,
+                                  result_store=str(tmp_path / 'results.sqlite'))
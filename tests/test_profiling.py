@@ -0,0 +1,95 @@
+# tests/test_profiling.py
+
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from event_study.profiling import NULL_PROFILER, Profiler
+
+def test_nested_stages_count_inner_time_in_outer():
+    profiler = Profiler()
+    with profiler.stage('outer'):
+        for _ in range(3):
+            with profiler.stage('inner'):
+                time.sleep(0.01)
+    profiler.count('rows', 5)
+    profiler.count('rows')
+    profiler.skip('short_window')
+
+    report = profiler.report()
+    stages = report['stages']
+    assert stages['outer']['calls'] == 1
+    assert stages['inner']['calls'] == 3
+    assert stages['inner']['wall'] >= 0.03
+    assert stages['outer']['wall'] >= stages['inner']['wall']
+    assert report['counters'] == {'rows': 6}
+    assert report['skipped'] == {'short_window': 1}
+
+def test_peak_memory_propagates_and_tracing_stops():
+    if tracemalloc.is_tracing():
+        pytest.skip('tracemalloc 已由外部启动')
+    profiler = Profiler(hooks=('tracemalloc',))
+    size = 8 * 1_000_000
+    with profiler.stage('outer'):
+        with profiler.stage('small'):
+            small = np.ones(1000)
+        with profiler.stage('large'):
+            large = np.ones(size // 8)
+            del large
+    del small
+    assert tracemalloc.is_tracing()
+
+    stages = profiler.report()['stages']
+    # 内层阶段的峰值在其结束后仍计入外层阶段
+    assert stages['large']['peak_memory'] >= size
+    assert stages['small']['peak_memory'] < size
+    assert stages['outer']['peak_memory'] >= stages['large']['peak_memory']
+    assert not tracemalloc.is_tracing()
+
+def test_external_tracing_is_left_running():
+    if tracemalloc.is_tracing():
+        pytest.skip('tracemalloc 已由外部启动')
+    tracemalloc.start()
+    try:
+        profiler = Profiler(hooks=('tracemalloc',))
+        with profiler.stage('load'):
+            pass
+        assert 'peak_memory' in profiler.report()['stages']['load']
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+def test_merge_adds_worker_reports():
+    worker = Profiler()
+    with worker.stage('regression'):
+        pass
+    worker.count('regressions', 4)
+    worker.skip('no_data')
+
+    profiler = Profiler()
+    with profiler.stage('regression'):
+        pass
+    profiler.count('regressions', 1)
+    profiler.merge(worker.report())
+    profiler.merge(None)
+
+    report = profiler.report()
+    assert report['stages']['regression']['calls'] == 2
+    assert report['counters'] == {'regressions': 5}
+    assert report['skipped'] == {'no_data': 1}
+
+def test_unknown_hook_raises():
+    with pytest.raises(ValueError):
+        Profiler(hooks=('perf',))
+
+def test_null_profiler_is_noop():
+    assert not NULL_PROFILER.enabled
+    with NULL_PROFILER.stage('outer'):
+        with NULL_PROFILER.stage('inner'):
+            NULL_PROFILER.count('rows', 10)
+            NULL_PROFILER.skip('no_data')
+    NULL_PROFILER.merge({'stages': {}, 'counters': {'rows': 1}, 'skipped': {}})
+    assert NULL_PROFILER.report() is None
+    assert not vars(NULL_PROFILER)
@@ -0,0 +1,47 @@
+# tests/test_regressions.py
+
+import numpy as np
+import pandas as pd
+
+from event_study.regression_models import batch_regressions, perform_regressions, unpack_batch
+
+MODELS = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+
+def _windows(panel, n_windows=6, length=120):
+    """取若干公司最近 length 个交易日的合并数据作为估计窗口，长度各不相同以覆盖零填充。"""
+    _, firm_data, market_data, ff_factors = panel
+    merged = firm_data.merge(market_data, on='Date').merge(ff_factors, on='Date')
+    windows = []
+    for i, (_, group) in enumerate(merged.groupby('Stkcd', observed=True)):
+        if len(windows) == n_windows:
+            break
+        windows.append(group.tail(length - 7 * i).reset_index(drop=True))
+    return windows
+
+def test_batch_regressions_match_statsmodels(panel):
+    windows = _windows(panel)
+    batch = batch_regressions(windows, MODELS, batch_size=4)
+    for i, window in enumerate(windows):
+        reference = perform_regressions(window, MODELS)
+        estimates = unpack_batch(batch, i)
+        assert estimates.keys() == reference.keys()
+        for model, fit in reference.items():
+            np.testing.assert_allclose(estimates[model].params[fit.params.index], fit.params, rtol=1e-8, atol=1e-12)
+            np.testing.assert_allclose(estimates[model].sigma2, fit.scale, rtol=1e-8)
+            assert estimates[model].nobs == fit.nobs
+
+def test_batch_engine_matches_statsmodels_run(compute):
+    batch, batch_daily = compute(regression_engine='batch')
+    reference, reference_daily = compute(regression_engine='statsmodels')
+
+    keys = ['Symbol', 'EventDate']
+    pd.testing.assert_frame_equal(batch[keys], reference[keys])
+    averages = [col for col in reference.columns if col.startswith(('AvgAR_', 'AvgCAR_'))]
+    np.testing.assert_allclose(batch[averages].to_numpy(), reference[averages].to_numpy(),
+                               rtol=1e-7, atol=1e-10)
+
+    assert batch_daily.keys() == reference_daily.keys()
+    for key, table in reference_daily.items():
+        np.testing.assert_array_equal(batch_daily[key]['EventDay'], table['EventDay'])
+        column = f'Avg{key[0]}'
+        np.testing.assert_allclose(batch_daily[key][column], table[column], rtol=1e-7, atol=1e-10)
@@ -0,0 +1,49 @@
+# tests/test_result_store.py
+
+import os
+
+import pandas as pd
+import pytest
+
+from event_study.main import run_event_study
+from event_study.result_store import ResultStore, data_version
+
+RUN = dict(generate_plots=False, use_cache=False, output_format='csv', profile=True)
+
+@pytest.fixture
+def run(panel_files, options, tmp_path, monkeypatch):
+    """run(name, **overrides) 在临时目录 name 中运行 run_event_study，返回 (Profiler 报告, 逐事件结果表)。"""
+    def run_in(name, **overrides):
+        directory = tmp_path / name
+        directory.mkdir()
+        monkeypatch.chdir(directory)
+        report = run_event_study(**panel_files, **{**options, **RUN, **overrides})
+        return report, pd.read_csv('event_study_results.csv')
+
+    return run_in
+
+def test_rerun_reuses_results_after_touch(panel_files, run, tmp_path):
+    store = str(tmp_path / 'results.sqlite')
+    first, first_results = run('first', result_store=store)
+    version = data_version(panel_files['firm_file'])
+    os.utime(panel_files['firm_file'], ns=(1, 1))
+    assert data_version(panel_files['firm_file']) == version
+
+    second, second_results = run('second', result_store=store)
+    assert second['counters']['events_reused'] == first['counters']['events']
+    assert 'regressions_fit' not in second['counters']
+    pd.testing.assert_frame_equal(second_results, first_results)
+
+def test_changed_event_window_reuses_estimates(run, tmp_path):
+    store = str(tmp_path / 'results.sqlite')
+    first, _ = run('first', result_store=store)
+    with ResultStore(store) as opened:
+        assert opened.conn.execute('SELECT COUNT(*) FROM estimates').fetchone()[0] == \
+            first['counters']['events_processed']
+
+    reused, reused_results = run('reused', result_store=store, event_window_days=(-2, 2))
+    assert reused['counters']['estimates_reused'] == first['counters']['events_processed']
+    assert reused['counters']['regressions_fit'] == 0
+
+    _, fresh_results = run('fresh', event_window_days=(-2, 2))
+    pd.testing.assert_frame_equal(reused_results, fresh_results)
@@ -0,0 +1,49 @@
+# tests/test_sensitivity.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_study.panel_index import PanelIndex
+from event_study.sensitivity import bootstrap_caar, run_sensitivity, window_cars
+
+MODELS = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+EVENT_WINDOWS = [(-1, 1), (0, 3)]
+ESTIMATION_WINDOWS = [100, 120]
+
+def test_prefix_sum_cars_match_compute_event_study(panel, compute):
+    event_data, firm_data, market_data, ff_factors = panel
+    cars = window_cars(PanelIndex(firm_data, market_data, ff_factors), event_data, EVENT_WINDOWS,
+                       ESTIMATION_WINDOWS, MODELS)
+    events = event_data[['Symbol', 'Date']].rename(columns={'Date': 'EventDate'}).astype({'Symbol': str})
+
+    for L in ESTIMATION_WINDOWS:
+        for w, window in enumerate(EVENT_WINDOWS):
+            frame, _ = compute(estimation_window_days=L, event_window_days=window, tests=('t',))
+            frame = frame.astype({'Symbol': str})
+            merged = events.reset_index().merge(frame, on=['Symbol', 'EventDate'], how='left')
+            for model in MODELS:
+                expected = merged[f'CAR_LastDay_{model}'].to_numpy(dtype=float)
+                np.testing.assert_allclose(cars[(L, model)][merged['index'], w], expected, rtol=1e-9, atol=1e-12,
+                                           err_msg=f'L={L} window={window} {model}')
+            assert np.sum(~np.isnan(cars[(L, 'MarketModel')][:, w])) == len(frame)
+
+def test_bootstrap_is_reproducible_and_independent_of_chunking():
+    cars = np.random.default_rng(0).normal(0.01, 0.05, size=(60, 3))
+    cars[::7, 1] = np.nan
+    first = bootstrap_caar(cars, 500, rng=np.random.default_rng(3))
+    second = bootstrap_caar(cars, 500, rng=np.random.default_rng(3), chunk_size=64)
+    np.testing.assert_array_equal(first[0], second[0])
+    np.testing.assert_array_equal(first[1], second[1])
+    assert np.all(first[0] < np.nanmean(cars, axis=0)) and np.all(np.nanmean(cars, axis=0) < first[1])
+
+    other = bootstrap_caar(cars, 500, rng=np.random.default_rng(4))
+    assert not np.array_equal(first[0], other[0])
+
+def test_run_sensitivity_is_reproducible_with_seed(panel_files):
+    options = dict(event_windows=EVENT_WINDOWS, estimation_windows=ESTIMATION_WINDOWS, num_bootstrap=200, seed=5,
+                   use_cache=False)
+    first = run_sensitivity(**panel_files, **options)
+    pd.testing.assert_frame_equal(first, run_sensitivity(**panel_files, **options))
+    assert len(first) == len(ESTIMATION_WINDOWS) * len(MODELS) * len(EVENT_WINDOWS)
+    assert first['CI_lower'].notna().all()
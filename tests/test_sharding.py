@@ -0,0 +1,70 @@
+# tests/test_sharding.py
+
+import multiprocessing
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from event_study.main import compute_event_study
+from event_study.output_writers import write_results
+from event_study.sharding import QUEUE_FILE, ShardQueue, prepare_shards, process_shard, reduce_shards, run_shard_worker
+
+MODELS = ['MarketModel', 'MarketAdjusted', '3F', '4F', '5F']
+OUTPUTS = ('event_study_results.csv', 'event_study_daily_AR_results.csv', 'event_study_daily_CAR_results.csv')
+
+@pytest.fixture
+def shard_dir(panel_files, options, tmp_path):
+    """在共用面板上写出 4 个分片的目录。"""
+    directory = str(tmp_path / 'shards')
+    prepare_shards(directory, **panel_files, **options, n_shards=4, read_chunk_rows=500, use_cache=False)
+    return directory
+
+def _reduce_and_compare(shard_dir, panel, options, tmp_path):
+    output_dir = tmp_path / 'reduced'
+    reduce_shards(shard_dir, output_format='csv', output_dir=str(output_dir))
+    reference_dir = tmp_path / 'reference'
+    results, daily_tables = compute_event_study(*panel, **options)
+    write_results(results, daily_tables, MODELS, 'csv', output_dir=str(reference_dir))
+    for name in OUTPUTS:
+        pd.testing.assert_frame_equal(pd.read_csv(output_dir / name), pd.read_csv(reference_dir / name))
+
+def test_two_workers_match_compute_event_study(shard_dir, panel, options, tmp_path):
+    workers = [multiprocessing.Process(target=run_shard_worker, args=(shard_dir, f'worker-{i}')) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [worker.exitcode for worker in workers] == [0, 0]
+
+    with ShardQueue(os.path.join(shard_dir, QUEUE_FILE)) as shard_queue:
+        assert shard_queue.unfinished() == []
+    _reduce_and_compare(shard_dir, panel, options, tmp_path)
+
+def test_expired_lease_is_reclaimed(shard_dir, panel, options, tmp_path):
+    with ShardQueue(os.path.join(shard_dir, QUEUE_FILE)) as shard_queue:
+        n_shards = len(shard_queue.unfinished())
+        stale = shard_queue.claim('stale', lease_seconds=0.05)
+        assert shard_queue.claim('fresh', lease_seconds=0.05) != stale
+        time.sleep(0.1)
+        # 两个租约都已过期：编号最小的分片（stale 领取的分片）先被重新领取
+        assert shard_queue.claim('retry') == stale
+
+        # 原工作进程与重新领取的工作进程都完成同一分片：部分结果内容相同，重复完成不影响结果
+        process_shard(shard_dir, stale)
+        shard_queue.complete(stale)
+        process_shard(shard_dir, stale)
+        shard_queue.complete(stale)
+        attempts = shard_queue.conn.execute('SELECT attempts FROM shards WHERE shard = ?', (stale,)).fetchone()[0]
+        assert attempts == 2
+
+    done = run_shard_worker(shard_dir, 'rest')
+    assert stale not in done and len(done) == n_shards - 1
+    with ShardQueue(os.path.join(shard_dir, QUEUE_FILE)) as shard_queue:
+        assert shard_queue.status() == {'done': n_shards}
+    _reduce_and_compare(shard_dir, panel, options, tmp_path)
+
+def test_reduce_refuses_unfinished_shards(shard_dir):
+    with pytest.raises(ValueError):
+        reduce_shards(shard_dir, output_format='csv')
@@ -0,0 +1,140 @@
+# tests/test_statistical_tests.py
+
+import itertools
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from event_study.statistical_tests import (TEST_KEYS, ResidualCorrelation, permutation_test, run_tests, run_tests_batch,
+                                          standardized_tests)
+
+def _brute_force_p_value(data):
+    """逐一枚举全部 2^n 种符号组合的双侧 p 值。"""
+    observed = abs(np.sum(data))
+    flips = [abs(np.dot(signs, data)) >= observed - 1e-12 * np.sum(np.abs(data))
+             for signs in itertools.product((1, -1), repeat=len(data))]
+    return np.mean(flips)
+
+@pytest.mark.parametrize('n', [1, 2, 5, 8, 10])
+def test_exact_permutation_matches_brute_force(n):
+    data = np.random.default_rng(n).normal(0.2, 1.0, size=n)
+    observed_mean, p_value = permutation_test(data, exact_max_n=10)
+    assert observed_mean == pytest.approx(np.mean(data))
+    assert p_value == pytest.approx(_brute_force_p_value(data), abs=1e-15)
+
+def test_seeded_permutation_is_reproducible():
+    data = np.random.default_rng(0).normal(0.1, 1.0, size=30)
+    first = permutation_test(data, num_permutations=2000, rng=np.random.default_rng(5))
+    second = permutation_test(data, num_permutations=2000, rng=np.random.default_rng(5))
+    assert first == second
+
+class _CountingRng:
+    """记录抽样次数的 np.random.Generator 包装。"""
+
+    def __init__(self, seed):
+        self.rng = np.random.default_rng(seed)
+        self.drawn = 0
+
+    def choice(self, values, size):
+        self.drawn += size[0]
+        return self.rng.choice(values, size=size)
+
+def test_adaptive_permutation_stops_early_on_clear_effect():
+    data = np.random.default_rng(0).normal(2.0, 1.0, size=40)
+    rng = _CountingRng(1)
+    _, p_value = permutation_test(data, num_permutations=10000, rng=rng, adaptive=True)
+    assert p_value == 0.0
+    # 没有极端值时 99.9% Clopper-Pearson 上界在 200 次抽样后低于 0.05
+    assert rng.drawn == 200
+
+def test_adaptive_permutation_draws_everything_near_alpha():
+    data = np.random.default_rng(3).normal(0.0, 1.0, size=40)
+    data += 1.98 * data.std(ddof=1) / np.sqrt(len(data)) - data.mean()
+    rng = _CountingRng(1)
+    _, p_value = permutation_test(data, num_permutations=2000, rng=rng, adaptive=True)
+    assert rng.drawn == 2000
+    assert 0.02 < p_value < 0.1
+
+def test_batch_tests_match_per_column_run_tests():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(0.1, 1.0, size=(25, 5))
+    matrix[20:, 1] = np.nan
+    matrix[3:, 4] = np.nan
+    tests = ('t', 'patell', 'wilcoxon', 'binomial', 'corrado')
+    batch = run_tests_batch(matrix, tests=tests)
+    for j, column in enumerate(matrix.T):
+        expected = run_tests(column[~np.isnan(column)], tests=tests)
+        for key, value in expected.items():
+            assert batch[key][j] == pytest.approx(value, rel=1e-10, nan_ok=True), (key, j)
+
+def test_batch_min_count_leaves_short_columns_nan():
+    matrix = np.random.default_rng(0).normal(size=(5, 2))
+    matrix[1:, 1] = np.nan
+    batch = run_tests_batch(matrix, min_count=2)
+    assert set(batch) == set(TEST_KEYS)
+    assert all(np.isnan(value[1]) for value in batch.values())
+
+def test_batch_exact_permutation_matches_brute_force():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(0.1, 1.0, size=(9, 6))
+    matrix[6:, 3:] = np.nan
+    results = run_tests_batch(matrix, exact_max_n=10, tests='permutation')
+    expected = [_brute_force_p_value(column[~np.isnan(column)]) for column in matrix.T]
+    np.testing.assert_allclose(results['permutation_p_value'], expected, rtol=0, atol=1e-15)
+    np.testing.assert_allclose(results['permutation_statistic'], np.nanmean(matrix, axis=0))
+
+def test_batch_adaptive_stops_clear_columns_only():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(40, 2))
+    matrix[:, 0] += 2.0
+    full = run_tests_batch(matrix, rng=np.random.default_rng(1), tests='permutation', num_permutations=5000)
+    adaptive = run_tests_batch(matrix, rng=np.random.default_rng(1), tests='permutation', num_permutations=5000,
+                               adaptive=True)
+    assert adaptive['permutation_p_value'][0] == 0.0
+    assert abs(adaptive['permutation_p_value'][1] - full['permutation_p_value'][1]) < 0.1
+
+def test_standardized_tests_match_hand_computed_values():
+    # 第一列：SAR = (1, 2, -0.5, 1.5)，dof = 10，每个 SAR 的方差为 10/8
+    # 第二列：一个缺失值，dof = 20，方差为 20/18
+    sar = np.array([[1.0, 0.5], [2.0, np.nan], [-0.5, -1.0], [1.5, 2.0]])
+    dof = np.array([[10, 20], [10, 20], [10, 20], [10, 20]])
+    r_bar = 0.1
+    results = standardized_tests(sar, dof, r_bar=r_bar)
+
+    patell = [4.0 / np.sqrt(4 * 1.25), 1.5 / np.sqrt(3 * 20 / 18)]
+    # 截面标准差：离差平方和 3.5（n=4）与 4.5（n=3，均值 0.5）
+    bmp = [1.0 / (np.sqrt(3.5 / 3) / 2), 0.5 / (np.sqrt(4.5 / 2) / np.sqrt(3))]
+    kp = [bmp[0] * np.sqrt(0.9 / (1 + 3 * r_bar)), bmp[1] * np.sqrt(0.9 / (1 + 2 * r_bar))]
+    np.testing.assert_allclose(results['patell_sr_statistic'], patell, rtol=1e-12)
+    np.testing.assert_allclose(results['bmp_statistic'], bmp, rtol=1e-12)
+    np.testing.assert_allclose(results['kp_statistic'], kp, rtol=1e-12)
+    np.testing.assert_allclose(results['patell_sr_p_value'], 2 * stats.norm.sf(np.abs(patell)), rtol=1e-12)
+    np.testing.assert_allclose(results['bmp_p_value'], 2 * stats.t.sf(np.abs(bmp), [3, 2]), rtol=1e-12)
+    np.testing.assert_allclose(results['kp_p_value'], 2 * stats.t.sf(np.abs(kp), [3, 2]), rtol=1e-12)
+
+def test_standardized_tests_without_dof_and_short_dof():
+    sar = np.array([[1.0, 1.0], [3.0, 3.0]])
+    dof = np.array([[10.0, 2.0], [10.0, 10.0]])
+    assert standardized_tests(sar)['patell_sr_statistic'][0] == pytest.approx(4.0 / np.sqrt(2))
+    # dof <= 2 时 SAR 方差不存在，Patell 统计量为 NaN；BMP 与 KP 不依赖 dof
+    results = standardized_tests(sar, dof, tests=('patell_sr', 'bmp'))
+    assert set(results) == {'patell_sr_statistic', 'patell_sr_p_value', 'bmp_statistic', 'bmp_p_value'}
+    assert np.isnan(results['patell_sr_statistic'][1])
+    assert results['bmp_statistic'][1] == pytest.approx(2.0 / (np.sqrt(2.0) / np.sqrt(2)))
+
+def test_residual_correlation_matches_pairwise_average():
+    d = np.array(['2020-01-01', '2020-01-02', '2020-01-03'], dtype='datetime64[ns]')
+    events = [(d, np.array([1.0, -1.0, 2.0])), (d[:2], np.array([1.0, 0.5])), (d[2:], np.array([3.0])),
+              (d[:1], np.array([np.nan]))]
+    # 同日残差两两乘积：1×1、-1×0.5、2×3，平均为 6.5 / 3
+    correlation = ResidualCorrelation()
+    correlation.update([dates for dates, _ in events], [u for _, u in events])
+    assert correlation.value() == pytest.approx(6.5 / 3)
+
+    first, second = ResidualCorrelation(), ResidualCorrelation()
+    first.update([events[0][0]], [events[0][1]])
+    second.update([dates for dates, _ in events[1:]], [u for _, u in events[1:]])
+    first.merge(second)
+    assert first.value() == pytest.approx(6.5 / 3)
+    assert ResidualCorrelation().value() == 0.0
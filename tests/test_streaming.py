@@ -0,0 +1,44 @@
+# tests/test_streaming.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from event_study.main import run_event_study
+from event_study.streaming import DailyAccumulator
+
+def test_accumulator_merges_uneven_chunks():
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({'EventDay': rng.integers(-2, 3, size=200), 'AR': rng.normal(size=200)})
+    frame.loc[rng.choice(200, 15, replace=False), 'AR'] = np.nan
+    accumulator = DailyAccumulator(['AR'])
+    for start, stop in ((0, 3), (3, 4), (4, 90), (90, 91), (91, 200)):
+        accumulator.update(frame.iloc[start:stop])
+
+    table = accumulator.summary('AR', 'AvgAR')
+    grouped = frame.dropna().groupby('EventDay')['AR']
+    np.testing.assert_array_equal(table['EventDay'], grouped.mean().index)
+    np.testing.assert_allclose(table['AvgAR'], grouped.mean(), rtol=1e-12)
+    np.testing.assert_array_equal(table['N'], grouped.count())
+    t_stat = grouped.mean() / (grouped.std(ddof=1) / np.sqrt(grouped.count()))
+    np.testing.assert_allclose(table['t_statistic'], t_stat, rtol=1e-10)
+    np.testing.assert_allclose(table['Binomial_statistic'], grouped.apply(lambda x: np.mean(x > 0)), rtol=1e-12)
+
+def test_streaming_daily_tables_match_in_memory(panel_files, compute, options, tmp_path):
+    # 40 个事件按每块 7 个处理，各块有效事件数不同，最后一块只有 5 个
+    stream_dir = str(tmp_path / 'stream')
+    run_event_study(**panel_files, **options, generate_plots=False, use_cache=False, stream_dir=stream_dir,
+                    chunk_size=7)
+    _, daily_tables = compute()
+
+    for kind in ('AR', 'CAR'):
+        streamed = pd.read_csv(os.path.join(stream_dir, f'event_study_daily_{kind}_results.csv'))
+        for (table_kind, model), table in daily_tables.items():
+            if table_kind != kind:
+                continue
+            mine = streamed[streamed['Model'] == model].reset_index(drop=True)
+            np.testing.assert_array_equal(mine['EventDay'], table['EventDay'])
+            for column in (f'Avg{kind}', 't_statistic', 't_p_value', 'Binomial_statistic', 'Binomial_p_value'):
+                np.testing.assert_allclose(mine[column], table[column], rtol=1e-9, atol=1e-12,
+                                           err_msg=f'{kind} {model} {column}')